@@ -0,0 +1,121 @@
+"""
+Timing comparison of the crosstab() bar chart queries against the single scan FILTER pivots.
+
+Runs against an in-memory SQLite table by default. crosstab() does not exist in SQLite,
+so the legacy timing covers the crosstab source query plus the pivot done by crosstab itself.
+Pass --dsn to compare the real crosstab() queries on a temporary Postgres table (requires tablefunc).
+
+    python -m benchmarks.bench_pivot --rows 1000000
+    python -m benchmarks.bench_pivot --rows 5000000 --dsn "dbname=grafana user=grafana host=localhost"
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from generate_dashboards.dashboard.group_overview import get_commits_per_commit_type_barchart, CHANGE_TYPES
+
+GROUP_ID = 'bench-group'
+AUTHORS = [f'student{n}@stud.ntnu.no' for n in range(6)]
+
+LEGACY_SOURCE_SQL = f'''
+SELECT author_email, type, count(DISTINCT commit_sha)
+FROM changecontribution
+WHERE group_id='{GROUP_ID}' AND author_email IN (${{filter_users}})
+GROUP BY author_email, type
+ORDER BY author_email, type
+'''
+
+LEGACY_CROSSTAB_SQL = f'''
+SELECT * FROM crosstab(
+    $${LEGACY_SOURCE_SQL}$$,
+    $$SELECT type FROM (VALUES {', '.join(f"('{t}')" for t in sorted(CHANGE_TYPES))}) T(type)$$
+) AS final_result(author_email varchar, {', '.join(f'"{t}" bigint' for t in sorted(CHANGE_TYPES))})
+'''
+
+
+def expand_variables(sql: str) -> str:
+    return sql.replace('${filter_users}', ','.join(f"'{author}'" for author in AUTHORS))
+
+
+def time_query(run: Callable[[], object], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def sqlite_timings(rows: int, repeat: int) -> Dict[str, List[float]]:
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE changecontribution (group_id TEXT, author_email TEXT, commit_sha TEXT, type TEXT)')
+    rnd = random.Random(0)
+    types = list(CHANGE_TYPES)
+    groups = [GROUP_ID] + [f'group{n}' for n in range(19)]
+    conn.executemany(
+        'INSERT INTO changecontribution VALUES (?, ?, ?, ?)',
+        ((rnd.choice(groups), rnd.choice(AUTHORS), f'sha{n // 3}', rnd.choice(types)) for n in range(rows)),
+    )
+
+    def legacy():
+        table = defaultdict(dict)
+        for author, change_type, count in conn.execute(expand_variables(LEGACY_SOURCE_SQL)):
+            table[author][change_type] = count
+        return table
+
+    pivot_sql = expand_variables(get_commits_per_commit_type_barchart(GROUP_ID, None).targets[0].rawSql)
+    return {
+        'crosstab source + pivot': time_query(legacy, repeat),
+        'FILTER pivot': time_query(lambda: conn.execute(pivot_sql).fetchall(), repeat),
+    }
+
+
+def postgres_timings(dsn: str, rows: int, repeat: int) -> Dict[str, List[float]]:
+    from manage_users.db_connector import query_db_conn
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as curs:
+            curs.execute('''
+            CREATE TEMPORARY TABLE changecontribution AS
+            SELECT
+                CASE WHEN mod(n, 20) = 0 THEN %s ELSE 'group' || mod(n, 20) END AS group_id,
+                (%s::varchar[])[1 + mod(n, %s)] AS author_email,
+                'sha' || (n / 3) AS commit_sha,
+                (%s::varchar[])[1 + mod(n * 7, %s)] AS type
+            FROM generate_series(1, %s) AS n
+            ''', (GROUP_ID, AUTHORS, len(AUTHORS), list(CHANGE_TYPES), len(CHANGE_TYPES), rows))
+            curs.execute('ANALYZE changecontribution')
+
+        pivot_sql = expand_variables(get_commits_per_commit_type_barchart(GROUP_ID, None).targets[0].rawSql)
+        return {
+            'crosstab': time_query(lambda: query_db_conn(conn, expand_variables(LEGACY_CROSSTAB_SQL), None), repeat),
+            'FILTER pivot': time_query(lambda: query_db_conn(conn, pivot_sql, None), repeat),
+        }
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dsn', default=None, help='libpq connection string, SQLite is used if omitted')
+    args = parser.parse_args()
+
+    if args.dsn:
+        results = postgres_timings(args.dsn, args.rows, args.repeat)
+    else:
+        results = sqlite_timings(args.rows, args.repeat)
+
+    for name, timings in results.items():
+        print(f'{name:<25} median {statistics.median(timings) * 1000:8.1f} ms  (rows={args.rows})')
+
+
+if __name__ == '__main__':
+    main()
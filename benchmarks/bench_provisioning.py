@@ -0,0 +1,186 @@
+"""
+End-to-end throughput of provisioning a course and uploading its dashboards, against the in-process
+Grafana and GitLab stand-ins of benchmarks.standins.
+
+Every phase reports its wall time and HTTP requests per second. With --baseline the throughputs are compared
+to a previous run and the benchmark exits with status 1 if any phase got slower than the tolerance allows.
+
+    python -m benchmarks.bench_provisioning --groups 400 --members-per-group 5 --write-baseline baseline.json
+    python -m benchmarks.bench_provisioning --groups 400 --members-per-group 5 --baseline baseline.json
+    python -m benchmarks.bench_provisioning --latency-ms 20 --rate-limit 200
+    python -m benchmarks.bench_provisioning --latency-ms 20 --workers 16
+    python -m benchmarks.bench_provisioning --latency-ms 20 --workers 16 --courses 8 --processes 4
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+from benchmarks.standins import GitLabStandIn, GrafanaStandIn, StandInBehaviour, StandInServer
+from generate_dashboards.api import get_dashboard_payload, upload_to_grafana
+from generate_dashboards.dashboard.group_overview import group_overview
+from manage_users import __main__ as provisioning
+from manage_users.api import grafana
+from manage_users.config import Config
+from manage_users.instrumentation import METRICS
+from manage_users.orchestrator import provision as orchestrated_provision
+from manage_users.sharding import provision_courses
+from manage_users.uids import folder_uid
+
+PARENT_GROUP_ID = 11911
+
+
+def run_phase(name: str, server: StandInServer, run: Callable[[], object]) -> Dict:
+    requests_before = sum(server.requests.values())
+    start = time.perf_counter()
+    error = None
+    try:
+        run()
+    except Exception as e:
+        # The API helpers don't retry, so injected errors and rate limits end the run
+        error = repr(e)
+    seconds = time.perf_counter() - start
+    requests = sum(server.requests.values()) - requests_before
+    print(f'{name:<22} {seconds:8.2f} s  {requests:7d} requests  {requests / seconds:8.1f} requests/s'
+          + (f'  FAILED {error}' if error else ''))
+    return {'seconds': seconds, 'requests': requests, 'requests_per_second': requests / seconds, 'error': error}
+
+
+def run_benchmark(groups: int, members_per_group: int, behaviour: StandInBehaviour) -> Dict[str, Dict]:
+    results = {}
+    with GitLabStandIn(behaviour) as gitlab, GrafanaStandIn(behaviour) as grafana_server:
+        gitlab.add_course(PARENT_GROUP_ID, groups, members_per_group)
+        grafana_api = grafana.auth(host=grafana_server.address, username='admin', password='admin')
+        # The cache of created emails belongs to the previous Grafana
+        grafana.cached_user_emails = set()
+        state = {}
+
+        def fetch():
+            state['groups'] = provisioning.retrieve_gitlab_data('token', PARENT_GROUP_ID, gitlab.api_url)
+
+        def users():
+            state['users'] = provisioning.generate_grafana_users(grafana_api, state['groups'])
+
+        def teams():
+            state['teams'] = provisioning.generate_teams_and_assign_users(grafana_api, state['groups'],
+                                                                          state['users'])
+
+        def folders():
+            state['teams'] = provisioning.generate_folders_and_assign_privileges(grafana_api, state['teams'])
+
+        def dashboards():
+            for group_name, team in state['teams'].items():
+                upload_to_grafana(get_dashboard_payload(group_overview(group_name), team['folder_uid']),
+                                  grafana_server.address, 'api-key')
+
+        phases = [('gitlab fetch', gitlab, fetch), ('users', grafana_server, users),
+                  ('teams and members', grafana_server, teams), ('folders', grafana_server, folders),
+                  ('dashboard upload', grafana_server, dashboards)]
+        for name, server, phase in phases:
+            results[name] = run_phase(name, server, phase)
+            if results[name]['error']:
+                break
+    return results
+
+
+def run_orchestrated_benchmark(groups: int, members_per_group: int, behaviour: StandInBehaviour,
+                               workers: int) -> Dict[str, Dict]:
+    with GitLabStandIn(behaviour) as gitlab, GrafanaStandIn(behaviour) as grafana_server:
+        gitlab.add_course(PARENT_GROUP_ID, groups, members_per_group)
+        grafana_api = grafana.auth(host=grafana_server.address, username='admin', password='admin')
+        grafana.cached_user_emails = set()
+        gitlab_groups_and_users = provisioning.retrieve_gitlab_data('token', PARENT_GROUP_ID, gitlab.api_url)
+
+        def upload_dashboards(group_name: str, gitlab_group_id: int):
+            return upload_to_grafana(get_dashboard_payload(group_overview(group_name), folder_uid(gitlab_group_id)),
+                                     grafana_server.address, 'api-key')
+
+        name = f'orchestrated x{workers}'
+        METRICS.reset()
+        result = run_phase(name, grafana_server, lambda: orchestrated_provision(
+            grafana_api, gitlab_groups_and_users, upload_dashboards, max_workers=workers))
+        # The lower bound of the wall time at any number of workers, absent if the run failed
+        critical_path = METRICS.report().get('orchestrator.critical_path')
+        if critical_path:
+            result['critical_path_seconds'] = critical_path['total_seconds']
+            print(f'{"  critical path":<22} {critical_path["total_seconds"]:8.2f} s')
+        return {name: result}
+
+
+def run_sharded_benchmark(courses: int, groups: int, members_per_group: int, behaviour: StandInBehaviour,
+                          processes: int, workers: int) -> Dict[str, Dict]:
+    with GitLabStandIn(behaviour) as gitlab, GrafanaStandIn(behaviour) as grafana_server:
+        for course in range(courses):
+            # Every course has its own students, apart from the first group which is shared by all courses
+            member_ids = itertools.count(start=course * groups * members_per_group)
+            for group in range(groups):
+                ids = range(members_per_group) if group == 0 else itertools.islice(member_ids, members_per_group)
+                gitlab.add_group(course + 1, (course + 1) * 10_000 + group, f'course{course}-group{group}',
+                                 [{'id': n, 'username': f'student{n}', 'name': f'Student {n}'} for n in ids])
+        config = Config(gitlab_token='token', gitlab_api_url=gitlab.api_url, grafana_host=grafana_server.address)
+
+        name = f'sharded {processes}x{workers}'
+        return {name: run_phase(name, grafana_server, lambda: provision_courses(
+            config, list(range(1, courses + 1)), processes, workers))}
+
+
+def regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> Dict[str, float]:
+    """
+    :return: Dict({ phase: relative throughput compared to the baseline }) of the phases slower than the tolerance
+    """
+    slower = {}
+    for name, measured in results.items():
+        if name in baseline:
+            ratio = measured['requests_per_second'] / baseline[name]['requests_per_second']
+            if ratio < 1 - tolerance:
+                slower[name] = ratio
+    return slower
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', type=int, default=400)
+    parser.add_argument('--members-per-group', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every stand-in request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing with 500')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second before 429')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='also provision users to dashboards concurrently with this many workers')
+    parser.add_argument('--courses', type=int, default=0,
+                        help='also provision this many courses of --groups groups across --processes processes')
+    parser.add_argument('--processes', type=int, default=None, help='defaults to the number of cores')
+    parser.add_argument('--baseline', default=None, help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative throughput drop')
+    parser.add_argument('--write-baseline', default=None, help='store the results as JSON')
+    args = parser.parse_args()
+
+    behaviour = StandInBehaviour(latency_s=args.latency_ms / 1000, error_rate=args.error_rate,
+                                 rate_limit_per_s=args.rate_limit)
+    print(f'{args.groups} groups of {args.members_per_group} students')
+    results = run_benchmark(args.groups, args.members_per_group, behaviour)
+    if args.workers:
+        results.update(run_orchestrated_benchmark(args.groups, args.members_per_group, behaviour, args.workers))
+    if args.courses:
+        results.update(run_sharded_benchmark(args.courses, args.groups, args.members_per_group, behaviour,
+                                             args.processes or os.cpu_count() or 1, args.workers or 8))
+
+    if args.write_baseline:
+        with open(args.write_baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    failed = any(result['error'] for result in results.values())
+    if args.baseline:
+        with open(args.baseline) as file:
+            slower = regressions(results, json.load(file), args.tolerance)
+        for name, ratio in slower.items():
+            print(f'REGRESSION {name}: {ratio:.0%} of baseline throughput')
+        failed = failed or bool(slower)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
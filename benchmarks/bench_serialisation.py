@@ -0,0 +1,103 @@
+"""
+Encode time, peak allocation and body size per dashboard for every serialiser of generate_dashboards.api,
+with and without gzip compression.
+
+Peak allocations are traced in a separate pass, tracing slows encoding down. With --upload the dashboards
+are also uploaded to the in-process Grafana stand-in of benchmarks.standins.
+
+    python -m benchmarks.bench_serialisation --groups 50
+    python -m benchmarks.bench_serialisation --groups 50 --upload --latency-ms 5
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.standins import GrafanaStandIn, StandInBehaviour
+from generate_dashboards.api import SERIALISERS, get_dashboard_payload, serialise, upload_to_grafana
+from generate_dashboards.dashboard.group_overview import commit_drilldown, group_overview
+
+
+def dashboard_payloads(groups: int) -> List[Dict]:
+    return [get_dashboard_payload(dashboard(f'group{n}'), folder_uid=f'folder{n}')
+            for n in range(groups) for dashboard in (group_overview, commit_drilldown)]
+
+
+def encoded_size(payload: Dict, serialiser: str, compress: bool) -> int:
+    return sum(len(chunk) for chunk in serialise(payload, serialiser, compress))
+
+
+def time_encoding(payloads: List[Dict], serialiser: str, compress: bool, repeat: int) -> Dict:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = sum(encoded_size(payload, serialiser, compress) for payload in payloads)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    peaks = []
+    for payload in payloads:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        encoded_size(payload, serialiser, compress)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    median = statistics.median(seconds)
+    return {
+        'ms_per_dashboard': median / len(payloads) * 1000,
+        'bytes_per_dashboard': size / len(payloads),
+        'peak_bytes_per_dashboard': statistics.mean(peaks),
+        'megabytes_per_second': size / median / 1e6,
+    }
+
+
+def time_upload(payloads: List[Dict], serialiser: str, compress: bool, behaviour: StandInBehaviour) -> float:
+    """
+    :return: uploaded dashboards per second
+    """
+    with GrafanaStandIn(behaviour) as grafana_server:
+        for folder_uid in {payload['folderUid'] for payload in payloads}:
+            grafana_server.folders[folder_uid] = {'id': len(grafana_server.folders) + 1, 'uid': folder_uid,
+                                                  'title': folder_uid}
+        start = time.perf_counter()
+        for payload in payloads:
+            upload_to_grafana(payload, grafana_server.address, 'key', serialiser=serialiser, compress=compress)
+        return len(payloads) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', type=int, default=50, help='two dashboards are encoded per group')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--upload', action='store_true', help='also measure uploads to the Grafana stand-in')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every stand-in request')
+    parser.add_argument('--json', default=None, help='store the results as JSON')
+    args = parser.parse_args()
+
+    payloads = dashboard_payloads(args.groups)
+    behaviour = StandInBehaviour(latency_s=args.latency_ms / 1000)
+    print(f'{len(payloads)} dashboards')
+    print(f'{"serialiser":<16} {"ms/dashboard":>12} {"bytes":>9} {"peak bytes":>11} {"MB/s":>8}'
+          + (f' {"uploads/s":>10}' if args.upload else ''))
+    results = {}
+    for serialiser in SERIALISERS:
+        for compress in (False, True):
+            name = f'{serialiser}+gzip' if compress else serialiser
+            result = time_encoding(payloads, serialiser, compress, args.repeat)
+            if args.upload:
+                result['uploads_per_second'] = time_upload(payloads, serialiser, compress, behaviour)
+            results[name] = result
+            print(f'{name:<16} {result["ms_per_dashboard"]:12.3f} {result["bytes_per_dashboard"]:9.0f} '
+                  f'{result["peak_bytes_per_dashboard"]:11.0f} {result["megabytes_per_second"]:8.1f}'
+                  + (f' {result["uploads_per_second"]:10.1f}' if args.upload else ''))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
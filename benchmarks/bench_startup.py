@@ -0,0 +1,93 @@
+"""
+Cold start of the CLI, measured with python -X importtime.
+
+For every command line the benchmark reports the median wall time over fresh interpreters, the cumulative
+import time and the most expensive top level imports. It exits with status 1 if a command imports one of
+the heavy dependencies it should defer, or if its median exceeds --max-ms.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 20 --max-ms 150
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'cli.py')
+
+# Command lines which must not load any of HEAVY_MODULES
+LIGHT_COMMANDS = [
+    ['--help'],
+    ['sync-users', '--help'],
+    ['teardown'],
+]
+HEAVY_MODULES = ['grafanalib', 'grafana_api', 'requests', 'psycopg2', 'faker']
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_times(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    :return: (module, self µs, cumulative µs) of the top level imports in the -X importtime output
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            imports.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return imports
+
+
+def run_cli(arguments: List[str]) -> Tuple[float, str]:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', CLI, *arguments], cwd=ROOT,
+                            capture_output=True, text=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def measure(arguments: List[str], repeat: int) -> Dict:
+    timings = []
+    for _ in range(repeat):
+        seconds, stderr = run_cli(arguments)
+        timings.append(seconds)
+    imports = import_times(stderr)
+    loaded = {module.split('.')[0] for module, _, _ in imports}
+    return {
+        'median_seconds': statistics.median(timings),
+        'import_seconds': sum(cumulative for _, _, cumulative in imports) / 1e6,
+        'slowest_imports': sorted(imports, key=lambda item: item[2], reverse=True)[:5],
+        'heavy_imports': sorted(loaded & set(HEAVY_MODULES)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if a median cold start is slower')
+    args = parser.parse_args()
+
+    failed = False
+    for arguments in LIGHT_COMMANDS:
+        result = measure(arguments, args.repeat)
+        print(f'cli.py {" ".join(arguments):<22} median {result["median_seconds"] * 1000:7.1f} ms  '
+              f'imports {result["import_seconds"] * 1000:7.1f} ms')
+        for module, _, cumulative in result['slowest_imports']:
+            print(f'    {module:<30} {cumulative / 1000:7.1f} ms')
+        if result['heavy_imports']:
+            print(f'    FAILED imports {", ".join(result["heavy_imports"])}')
+            failed = True
+        if args.max_ms is not None and result['median_seconds'] * 1000 > args.max_ms:
+            print(f'    FAILED slower than {args.max_ms} ms')
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
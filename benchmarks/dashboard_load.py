@@ -0,0 +1,364 @@
+"""
+Load of many students opening the overview dashboards of their groups at once, like right before a deadline.
+
+Every simulated viewer loads the overview of its group like a browser does: first the query variables in order,
+then the annotations and the queries of the panels outside collapsed rows, at most --browser-concurrency at once.
+All variables select "All". Queries run through the /api/ds/query endpoint of a Grafana, which expands the macros
+itself, or directly against Postgres with the macros expanded by generate_dashboards.dashboard.util.
+Postgres queries borrow from a pool of --pool-size connections, standing in for the pool of the Grafana
+datasource, and the time spent waiting for a connection is reported separately.
+
+With several --viewers counts the load is repeated per count. The database or pool saturates at the first count
+where throughput grows by less than half as much as the number of viewers.
+
+    python -m benchmarks.dashboard_load --dsn "dbname=grafana user=grafana host=localhost" --viewers 10 50 100 200
+    python -m benchmarks.dashboard_load --grafana localhost:3000 --api-key $GRAFANA_API_KEY --viewers 50 100
+"""
+import argparse
+import dataclasses
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import group_overview
+from generate_dashboards.dashboard.util import duration_seconds, expand_macros, expand_variables, resolve_time
+
+VARIABLE = 'variable'
+ANNOTATION = 'annotation'
+PANEL = 'panel'
+
+# Requests a browser runs at once against Grafana
+BROWSER_CONCURRENCY = 6
+# Grafana uses the pixel width of a panel when it sets no maxDataPoints
+DEFAULT_MAX_DATA_POINTS = 1000
+PERCENTILES = (50, 95, 99)
+
+
+@dataclasses.dataclass(frozen=True)
+class DashboardQuery:
+    kind: str
+    # Panel title, annotation name or variable name
+    name: str
+    sql: str
+    # Lower bound of $__interval
+    min_interval_s: float = 0.0
+    max_data_points: int = DEFAULT_MAX_DATA_POINTS
+
+
+@dataclasses.dataclass(frozen=True)
+class QueryTiming:
+    kind: str
+    name: str
+    seconds: float
+    # Part of seconds spent waiting for a pooled connection
+    wait_seconds: float
+    error: Optional[str] = None
+
+
+def _panel_queries(panels: List[Dict], expand_rows: bool) -> List[DashboardQuery]:
+    queries = []
+    for panel in panels:
+        if panel.get('type') == 'row':
+            # Collapsed rows nest their panels, expanded rows are followed by them
+            if expand_rows:
+                queries += _panel_queries(panel.get('panels', []), expand_rows)
+            continue
+        min_interval_s = duration_seconds(panel['interval']) if panel.get('interval') else 0.0
+        queries += [DashboardQuery(PANEL, panel.get('title') or str(panel.get('id')), target['rawSql'], min_interval_s,
+                                   panel.get('maxDataPoints') or DEFAULT_MAX_DATA_POINTS)
+                    for target in panel.get('targets', []) if target.get('rawSql')]
+    return queries
+
+
+def dashboard_queries(dashboard: Dict, expand_rows: bool = False) -> Tuple[List[DashboardQuery], List[DashboardQuery]]:
+    """
+    :param dashboard: JSON model of the dashboard
+    :param expand_rows: also run the panels of collapsed rows, as if every viewer expanded them
+    :return: the variable queries in the order Grafana resolves them, and the annotation and panel queries
+    """
+    variables = [DashboardQuery(VARIABLE, variable['name'], variable['query'])
+                 for variable in dashboard.get('templating', {}).get('list', []) if variable.get('type') == 'query']
+    annotations = [DashboardQuery(ANNOTATION, annotation['name'], annotation['rawQuery'])
+                   for annotation in dashboard.get('annotations', {}).get('list', [])
+                   if annotation.get('enable') and annotation.get('rawQuery')]
+    return variables, annotations + _panel_queries(dashboard.get('panels', []), expand_rows)
+
+
+def static_variables(dashboard: Dict) -> Dict[str, str]:
+    """
+    Current values of the custom and textbox variables, query variables are resolved by running them
+    """
+    values = {}
+    for variable in dashboard.get('templating', {}).get('list', []):
+        if variable.get('type') in ('custom', 'textbox'):
+            current = variable.get('current', {}).get('value')
+            values[variable['name']] = current if current is not None else variable.get('query', '').split(',')[0]
+    return values
+
+
+def interval_seconds(query: DashboardQuery, time_from: datetime, time_to: datetime) -> float:
+    return max(query.min_interval_s, (time_to - time_from).total_seconds() / query.max_data_points, 1.0)
+
+
+class PostgresBackend:
+    """
+    Runs queries with their macros expanded on connections borrowed from a manage_users.db_connector.ConnectionPool
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def query(self, sql: str, time_from: datetime, time_to: datetime, interval_s: float) -> Tuple[List, float]:
+        """
+        :return: the values of the first column, and the seconds spent waiting for a connection
+        """
+        start = time.perf_counter()
+        with self._pool.connection() as conn:
+            wait_seconds = time.perf_counter() - start
+            with conn.cursor() as curs:
+                curs.execute(expand_macros(sql, time_from, time_to))
+                rows = curs.fetchall() if curs.description else []
+        return [row[0] for row in rows], wait_seconds
+
+
+class GrafanaBackend:
+    """
+    Runs queries through /api/ds/query, like the panels of a browser. Grafana expands the macros.
+    """
+
+    def __init__(self, server: str, api_key: str, datasource: str = 'default', pool_size: int = 100):
+        self._url = f'http://{server}'
+        self._session = requests.Session()
+        self._session.headers['Authorization'] = f'Bearer {api_key}'
+        self._session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        response = self._session.get(f'{self._url}/api/datasources/name/{datasource}')
+        response.raise_for_status()
+        self._datasource = response.json()
+
+    def query(self, sql: str, time_from: datetime, time_to: datetime, interval_s: float) -> Tuple[List, float]:
+        response = self._session.post(f'{self._url}/api/ds/query', json={
+            'from': str(int(time_from.timestamp() * 1000)),
+            'to': str(int(time_to.timestamp() * 1000)),
+            'queries': [{
+                'refId': 'A',
+                'datasourceId': self._datasource['id'],
+                'datasource': {'uid': self._datasource.get('uid'), 'type': self._datasource.get('type')},
+                'rawSql': sql,
+                'format': 'table',
+                'intervalMs': int(interval_s * 1000),
+            }],
+        })
+        response.raise_for_status()
+        result = response.json()['results']['A']
+        if result.get('error'):
+            raise RuntimeError(result['error'])
+        frames = result.get('frames') or []
+        values = frames[0]['data']['values'] if frames else []
+        return (values[0] if values else []), 0.0
+
+
+def _timed(backend, query: DashboardQuery, variables: Dict, time_from: datetime,
+           time_to: datetime) -> Tuple[List, QueryTiming]:
+    interval_s = interval_seconds(query, time_from, time_to)
+    sql = expand_variables(query.sql, {**variables, '__interval': f'{interval_s:.0f}s',
+                                       '__interval_ms': str(int(interval_s * 1000))})
+    start = time.perf_counter()
+    try:
+        values, wait_seconds = backend.query(sql, time_from, time_to, interval_s)
+        return values, QueryTiming(query.kind, query.name, time.perf_counter() - start, wait_seconds)
+    except Exception as e:
+        return [], QueryTiming(query.kind, query.name, time.perf_counter() - start, 0.0, error=repr(e))
+
+
+def load_dashboard(backend, dashboard: Dict, now: datetime, browser_concurrency: int = BROWSER_CONCURRENCY,
+                   expand_rows: bool = False) -> List[QueryTiming]:
+    """
+    Runs every query of one dashboard load, like a browser opening the dashboard
+    """
+    time_from = resolve_time(dashboard['time']['from'], now)
+    time_to = resolve_time(dashboard['time']['to'], now)
+    variable_queries, queries = dashboard_queries(dashboard, expand_rows)
+
+    variables = static_variables(dashboard)
+    timings = []
+    # Variables may refer to earlier variables, Grafana resolves them one after another
+    for query in variable_queries:
+        values, timing = _timed(backend, query, variables, time_from, time_to)
+        variables[query.name] = [str(value) for value in values]
+        timings.append(timing)
+
+    with ThreadPoolExecutor(max_workers=browser_concurrency) as executor:
+        futures = [executor.submit(_timed, backend, query, variables, time_from, time_to) for query in queries]
+        timings += [future.result()[1] for future in futures]
+    return timings
+
+
+@dataclasses.dataclass
+class LoadResult:
+    viewers: int
+    wall_seconds: float
+    timings: List[QueryTiming]
+    load_seconds: List[float]
+
+    @property
+    def queries_per_second(self) -> float:
+        return len(self.timings) / self.wall_seconds
+
+    def to_json_data(self) -> Dict:
+        by_name = defaultdict(list)
+        for timing in self.timings:
+            by_name[(timing.kind, timing.name)].append(timing)
+        return {
+            'viewers': self.viewers,
+            'wall_seconds': self.wall_seconds,
+            'queries_per_second': self.queries_per_second,
+            'dashboards_per_second': len(self.load_seconds) / self.wall_seconds,
+            'errors': sum(1 for timing in self.timings if timing.error),
+            'dashboard_load': percentiles(self.load_seconds),
+            'queries': {
+                f'{kind} {name}': {
+                    'count': len(timings),
+                    'errors': sum(1 for timing in timings if timing.error),
+                    'mean_wait_seconds': sum(timing.wait_seconds for timing in timings) / len(timings),
+                    **percentiles([timing.seconds for timing in timings]),
+                }
+                for (kind, name), timings in by_name.items()
+            },
+        }
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    # Nearest rank, exact for the small samples of a single run
+    ordered = sorted(values)
+    if not ordered:
+        return {f'p{p}': 0.0 for p in PERCENTILES}
+    return {f'p{p}': ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)] for p in PERCENTILES}
+
+
+def run_load(backend, dashboards: List[Dict], viewers: int, loads: int = 1,
+             browser_concurrency: int = BROWSER_CONCURRENCY, expand_rows: bool = False) -> LoadResult:
+    """
+    Starts all viewers at once, viewer n loads dashboards[n % len(dashboards)] loads times
+    """
+    timings: List[QueryTiming] = []
+    load_seconds: List[float] = []
+    lock = threading.Lock()
+    start_together = threading.Barrier(viewers + 1)
+
+    def viewer(dashboard: Dict):
+        start_together.wait()
+        for _ in range(loads):
+            start = time.perf_counter()
+            viewer_timings = load_dashboard(backend, dashboard, datetime.now(timezone.utc), browser_concurrency,
+                                            expand_rows)
+            with lock:
+                load_seconds.append(time.perf_counter() - start)
+                timings.extend(viewer_timings)
+
+    threads = [threading.Thread(target=viewer, args=(dashboards[n % len(dashboards)],)) for n in range(viewers)]
+    for thread in threads:
+        thread.start()
+    start_together.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return LoadResult(viewers, time.perf_counter() - start, timings, load_seconds)
+
+
+def saturation_point(results: List[LoadResult], min_growth: float = 0.5) -> Optional[LoadResult]:
+    """
+    :return: the first result whose throughput grew by less than min_growth times the relative growth in viewers,
+        None if throughput kept up with the viewers
+    """
+    ordered = sorted(results, key=lambda result: result.viewers)
+    for previous, current in zip(ordered, ordered[1:]):
+        viewer_growth = current.viewers / previous.viewers - 1
+        throughput_growth = current.queries_per_second / previous.queries_per_second - 1
+        if viewer_growth > 0 and throughput_growth < min_growth * viewer_growth:
+            return current
+    return None
+
+
+def _print_result(result: LoadResult) -> None:
+    data = result.to_json_data()
+    load = data['dashboard_load']
+    print(f'{result.viewers:7d} viewers  {data["queries_per_second"]:8.1f} queries/s  '
+          f'{data["dashboards_per_second"]:7.1f} dashboards/s  load p50 {load["p50"]:6.2f} s  '
+          f'p95 {load["p95"]:6.2f} s  p99 {load["p99"]:6.2f} s  {data["errors"]} errors')
+
+
+def _print_queries(result: LoadResult) -> None:
+    print(f'\nQueries at {result.viewers} viewers')
+    print(f'{"query":<48} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"wait ms":>8} {"errors":>6}')
+    for name, query in result.to_json_data()['queries'].items():
+        print(f'{name[:48]:<48} {query["p50"] * 1000:8.1f} {query["p95"] * 1000:8.1f} {query["p99"] * 1000:8.1f} '
+              f'{query["mean_wait_seconds"] * 1000:8.1f} {query["errors"]:6d}')
+
+
+def _postgres_backend(dsn: str, pool_size: int) -> PostgresBackend:
+    from psycopg2.extensions import parse_dsn
+    from manage_users.db_connector import ConnectionPool
+
+    settings = parse_dsn(dsn)
+    return PostgresBackend(ConnectionPool(dbname=settings.get('dbname'), user=settings.get('user'),
+                                          host=settings.get('host'), password=settings.get('password'),
+                                          maxconn=pool_size))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--dsn', help='libpq connection string, only dbname, user, host and password are used')
+    target.add_argument('--grafana', help='host:port of a Grafana with the analytics datasource')
+    parser.add_argument('--api-key', default=None, help='Grafana API key')
+    parser.add_argument('--datasource', default='default')
+    parser.add_argument('--groups', type=int, default=100, help='viewers are spread over group0 to group{n - 1}')
+    parser.add_argument('--viewers', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--loads', type=int, default=1, help='dashboard loads per viewer')
+    parser.add_argument('--browser-concurrency', type=int, default=BROWSER_CONCURRENCY)
+    parser.add_argument('--pool-size', type=int, default=10, help='Postgres connections, like maxOpenConns')
+    parser.add_argument('--expand-rows', action='store_true', help='also query the panels of collapsed rows')
+    parser.add_argument('--json', default=None, help='store the results as JSON')
+    args = parser.parse_args()
+
+    if args.dsn:
+        backend = _postgres_backend(args.dsn, args.pool_size)
+    else:
+        backend = GrafanaBackend(args.grafana, args.api_key, args.datasource,
+                                 pool_size=max(args.viewers) * args.browser_concurrency)
+    dashboards = [get_dashboard_model(group_overview(f'group{n}')) for n in range(args.groups)]
+
+    results = []
+    for viewers in args.viewers:
+        results.append(run_load(backend, dashboards, viewers, args.loads, args.browser_concurrency, args.expand_rows))
+        _print_result(results[-1])
+
+    saturated = saturation_point(results)
+    _print_queries(saturated or results[-1])
+    if saturated:
+        print(f'\nSaturated at {saturated.viewers} viewers, {saturated.queries_per_second:.1f} queries/s')
+        if args.dsn:
+            # Mostly waiting: the pool is the limit. Mostly executing: the database is.
+            waiting = sum(timing.wait_seconds for timing in saturated.timings)
+            busy = sum(timing.seconds for timing in saturated.timings)
+            print(f'{waiting / max(busy, 1e-9):.0%} of query time was spent waiting for a pooled connection')
+    else:
+        print('\nThroughput kept up with the viewers, try more')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'results': [result.to_json_data() for result in results],
+                       'saturated_at': saturated.viewers if saturated else None}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+"""
+In-process HTTP stand-ins for the Grafana and GitLab endpoints used by manage_users.api and generate_dashboards.api.
+
+Each stand-in keeps its state in memory, listens on a free local port and can be slowed down, made to fail
+and rate limited, so provisioning can be exercised at course scale without a real Grafana or GitLab.
+
+    with GrafanaStandIn(StandInBehaviour(latency_s=0.002)) as grafana:
+        grafana_api = auth(host=grafana.address, username='admin', password='admin')
+"""
+import dataclasses
+import gzip
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Handlers receive the regex match of the path, the query parameters and the decoded JSON body,
+# and return a status code and a JSON serialisable payload
+Handler = Callable[[re.Match, Dict[str, List[str]], Optional[Dict]], Tuple[int, object]]
+
+
+@dataclasses.dataclass
+class StandInBehaviour:
+    # Added to every request before it is handled
+    latency_s: float = 0.0
+    # Fraction of requests answered with 500 Internal Server Error
+    error_rate: float = 0.0
+    # Requests per second admitted before answering 429 Too Many Requests, None for no limit
+    rate_limit_per_s: Optional[float] = None
+    # Requests that may exceed the rate momentarily
+    burst: int = 10
+    seed: int = 0
+
+
+class _TokenBucket:
+    def __init__(self, rate_per_s: float, burst: int):
+        self._rate = rate_per_s
+        self._capacity = max(burst, 1)
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class StandInServer:
+    """
+    Routes requests to handlers registered with route(), on a ThreadingHTTPServer running in a daemon thread.
+    Use as a context manager, or call start() and stop().
+    """
+
+    def __init__(self, behaviour: Optional[StandInBehaviour] = None):
+        self.behaviour = behaviour or StandInBehaviour()
+        self._routes: List[Tuple[str, Pattern, Handler]] = []
+        self._random = random.Random(self.behaviour.seed)
+        self._bucket = _TokenBucket(self.behaviour.rate_limit_per_s, self.behaviour.burst) \
+            if self.behaviour.rate_limit_per_s else None
+        # State shared by the handler threads is only touched while holding this lock
+        self.lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def route(self, method: str, pattern: str, handler: Handler) -> None:
+        self._routes.append((method, re.compile(f'^{pattern}$'), handler))
+
+    @property
+    def address(self) -> str:
+        """
+        host:port of the running server
+        """
+        host, port = self._server.server_address[:2]
+        return f'{host}:{port}'
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.address}'
+
+    def start(self) -> 'StandInServer':
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, Nagle would hold back the body for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                status, payload = server.dispatch(self.command, self.path, self.headers, self._body())
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = b''.join(iter(self._chunk, b''))
+                else:
+                    body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                return gzip.decompress(body) if self.headers.get('Content-Encoding') == 'gzip' else body
+
+            def _chunk(self) -> bytes:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(size)
+                # CRLF after the chunk, or the empty trailer after the last chunk
+                self.rfile.readline()
+                return chunk
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _admit(self) -> Optional[Tuple[int, object]]:
+        if self.behaviour.latency_s:
+            time.sleep(self.behaviour.latency_s)
+        if self._bucket and not self._bucket.take():
+            return 429, {'message': 'Too many requests'}
+        with self.lock:
+            failed = self._random.random() < self.behaviour.error_rate
+        if failed:
+            return 500, {'message': 'Injected failure'}
+        return None
+
+    def dispatch(self, method: str, path: str, headers, body: bytes) -> Tuple[int, object]:
+        parts = urlsplit(path)
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(parts.path)
+            if route_method == method and match:
+                endpoint = f'{method} {pattern.pattern[1:-1]}'
+                status, payload = self._admit() or self._authorised(headers) or \
+                    handler(match, parse_qs(parts.query), json.loads(body) if body else None)
+                break
+        else:
+            endpoint = f'{method} {parts.path}'
+            status, payload = 404, {'message': 'Not found'}
+
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.statuses[status] += 1
+        return status, payload
+
+    def _authorised(self, headers) -> Optional[Tuple[int, object]]:
+        return None
+
+
+def _page(items: List, query: Dict[str, List[str]], page_key: str, size_key: str, default_size: int) -> List:
+    size = int(query.get(size_key, [default_size])[0])
+    page = int(query.get(page_key, [1])[0])
+    return items[(page - 1) * size:page * size]
+
+
+class GrafanaStandIn(StandInServer):
+    """
+    Users, teams, team members, folders, folder permissions and dashboards of a single Grafana organisation
+    """
+
+    def __init__(self, behaviour: Optional[StandInBehaviour] = None):
+        super().__init__(behaviour)
+        self._ids = itertools.count(start=2)
+        self.users: Dict[int, Dict] = {1: {'id': 1, 'login': 'admin', 'email': 'admin@localhost', 'name': '',
+                                           'isAdmin': True}}
+        self.teams: Dict[int, Dict] = {}
+        self.team_members: Dict[int, List[int]] = {}
+        self.folders: Dict[str, Dict] = {}
+        self.folder_permissions: Dict[str, List[Dict]] = {}
+        self.dashboards: Dict[str, Dict] = {}
+        self.datasources: Dict[int, Dict] = {}
+        self.datasource_queries: List[Dict] = []
+
+        self.route('POST', '/api/admin/users', self._create_user)
+        self.route('DELETE', r'/api/admin/users/(\d+)', self._delete_user)
+        self.route('GET', '/api/users', self._search_users)
+        self.route('GET', r'/api/users/(\d+)', self._get_user)
+        self.route('POST', '/api/teams', self._create_team)
+        self.route('GET', '/api/teams/search', self._search_teams)
+        self.route('GET', r'/api/teams/(\d+)', self._get_team)
+        self.route('DELETE', r'/api/teams/(\d+)', self._delete_team)
+        self.route('GET', r'/api/teams/(\d+)/members', self._get_team_members)
+        self.route('POST', r'/api/teams/(\d+)/members', self._add_team_member)
+        self.route('DELETE', r'/api/teams/(\d+)/members/(\d+)', self._remove_team_member)
+        self.route('GET', '/api/folders', self._get_folders)
+        self.route('POST', '/api/folders', self._create_folder)
+        self.route('GET', '/api/folders/([^/]+)', self._get_folder)
+        self.route('PUT', '/api/folders/([^/]+)', self._update_folder)
+        self.route('DELETE', '/api/folders/([^/]+)', self._delete_folder)
+        self.route('GET', '/api/folders/([^/]+)/permissions', self._get_folder_permissions)
+        self.route('POST', '/api/folders/([^/]+)/permissions', self._update_folder_permissions)
+        self.route('POST', '/api/dashboards/db', self._upload_dashboard)
+        self.route('GET', '/api/datasources/name/([^/]+)', self._get_datasource)
+        self.route('POST', '/api/datasources', self._create_datasource)
+        self.route('PUT', r'/api/datasources/(\d+)', self._update_datasource)
+        self.route('POST', '/api/ds/query', self._query_datasources)
+
+    def _authorised(self, headers) -> Optional[Tuple[int, object]]:
+        if not headers.get('Authorization'):
+            return 401, {'message': 'Unauthorized'}
+        return None
+
+    def _create_user(self, match, query, body):
+        with self.lock:
+            if any(user['email'] == body['email'] or user['login'] == body.get('login')
+                   for user in self.users.values()):
+                return 412, {'message': 'User with same email address already exists'}
+            user_id = next(self._ids)
+            self.users[user_id] = {'id': user_id, 'login': body.get('login') or body['email'], 'email': body['email'],
+                                   'name': body.get('name', ''), 'isAdmin': False}
+        return 200, {'id': user_id, 'message': 'User created'}
+
+    def _delete_user(self, match, query, body):
+        with self.lock:
+            if self.users.pop(int(match.group(1)), None) is None:
+                return 404, {'message': 'User not found'}
+            for members in self.team_members.values():
+                members[:] = [member for member in members if member != int(match.group(1))]
+        return 200, {'message': 'User deleted'}
+
+    def _search_users(self, match, query, body):
+        with self.lock:
+            users = sorted(self.users.values(), key=lambda user: user['id'])
+        return 200, _page(users, query, 'page', 'perpage', 1000)
+
+    def _get_user(self, match, query, body):
+        with self.lock:
+            user = self.users.get(int(match.group(1)))
+        return (200, user) if user else (404, {'message': 'User not found'})
+
+    def _create_team(self, match, query, body):
+        with self.lock:
+            if any(team['name'] == body['name'] for team in self.teams.values()):
+                return 409, {'message': 'Team name taken'}
+            team_id = next(self._ids)
+            self.teams[team_id] = {'id': team_id, 'name': body['name'], 'email': body.get('email', ''),
+                                   'memberCount': 0}
+            self.team_members[team_id] = []
+        return 200, {'message': 'Team created', 'teamId': team_id}
+
+    def _search_teams(self, match, query, body):
+        with self.lock:
+            teams = [{**team, 'memberCount': len(self.team_members[team['id']])}
+                     for team in sorted(self.teams.values(), key=lambda team: team['id'])]
+        page = _page(teams, query, 'page', 'perpage', 1000)
+        return 200, {'totalCount': len(teams), 'teams': page, 'page': int(query.get('page', [1])[0]),
+                     'perPage': int(query.get('perpage', [1000])[0])}
+
+    def _get_team(self, match, query, body):
+        with self.lock:
+            team = self.teams.get(int(match.group(1)))
+        return (200, team) if team else (404, {'message': 'Team not found'})
+
+    def _delete_team(self, match, query, body):
+        with self.lock:
+            if self.teams.pop(int(match.group(1)), None) is None:
+                return 404, {'message': 'Failed to delete Team. ID not found'}
+            self.team_members.pop(int(match.group(1)), None)
+        return 200, {'message': 'Team deleted'}
+
+    def _get_team_members(self, match, query, body):
+        team_id = int(match.group(1))
+        with self.lock:
+            if team_id not in self.teams:
+                return 404, {'message': 'Team not found'}
+            return 200, [{'teamId': team_id, 'userId': user_id, 'login': self.users[user_id]['login'],
+                          'email': self.users[user_id]['email']} for user_id in self.team_members[team_id]]
+
+    def _add_team_member(self, match, query, body):
+        team_id = int(match.group(1))
+        with self.lock:
+            if team_id not in self.teams or body['userId'] not in self.users:
+                return 404, {'message': 'Team or user not found'}
+            if body['userId'] in self.team_members[team_id]:
+                return 400, {'message': 'User is already added to this team'}
+            self.team_members[team_id].append(body['userId'])
+        return 200, {'message': 'Member added to Team'}
+
+    def _remove_team_member(self, match, query, body):
+        team_id, user_id = int(match.group(1)), int(match.group(2))
+        with self.lock:
+            if user_id not in self.team_members.get(team_id, []):
+                return 404, {'message': 'Team member not found'}
+            self.team_members[team_id].remove(user_id)
+        return 200, {'message': 'Team Member removed'}
+
+    def _get_folders(self, match, query, body):
+        with self.lock:
+            return 200, [{'id': folder['id'], 'uid': folder['uid'], 'title': folder['title']}
+                         for folder in self.folders.values()]
+
+    def _create_folder(self, match, query, body):
+        with self.lock:
+            folder_id = next(self._ids)
+            uid = body.get('uid') or f'folder{folder_id}'
+            if uid in self.folders or any(folder['title'] == body['title'] for folder in self.folders.values()):
+                return 409, {'message': 'A folder or dashboard with the same name or uid already exists'}
+            self.folders[uid] = {'id': folder_id, 'uid': uid, 'title': body['title'], 'version': 1}
+            return 200, self.folders[uid]
+
+    def _get_folder(self, match, query, body):
+        with self.lock:
+            folder = self.folders.get(match.group(1))
+        return (200, folder) if folder else (404, {'message': 'Folder not found'})
+
+    def _update_folder(self, match, query, body):
+        with self.lock:
+            folder = self.folders.get(match.group(1))
+            if folder is None:
+                return 404, {'message': 'Folder not found'}
+            uid = body.get('uid') or folder['uid']
+            if (uid != folder['uid'] and uid in self.folders) or any(
+                    other['title'] == body['title'] for other in self.folders.values() if other is not folder):
+                return 409, {'message': 'A folder or dashboard with the same name or uid already exists'}
+            if not body.get('overwrite') and body.get('version') != folder['version']:
+                return 412, {'message': 'The folder has been changed by someone else'}
+            # Like Grafana, the dashboards and permissions follow a changed uid
+            del self.folders[folder['uid']]
+            if folder['uid'] in self.folder_permissions:
+                self.folder_permissions[uid] = self.folder_permissions.pop(folder['uid'])
+            for dashboard in self.dashboards.values():
+                if dashboard['folderUid'] == folder['uid']:
+                    dashboard['folderUid'] = uid
+            self.folders[uid] = {**folder, 'uid': uid, 'title': body['title'], 'version': folder['version'] + 1}
+            return 200, self.folders[uid]
+
+    def _delete_folder(self, match, query, body):
+        with self.lock:
+            folder = self.folders.pop(match.group(1), None)
+            if folder is None:
+                return 404, {'message': 'Folder not found'}
+            self.folder_permissions.pop(folder['uid'], None)
+            for uid in [uid for uid, dashboard in self.dashboards.items() if dashboard['folderUid'] == folder['uid']]:
+                del self.dashboards[uid]
+        return 200, {'message': f'Folder {folder["title"]} deleted', 'id': folder['id']}
+
+    def _get_folder_permissions(self, match, query, body):
+        with self.lock:
+            if match.group(1) not in self.folders:
+                return 404, {'message': 'Folder not found'}
+            return 200, self.folder_permissions.get(match.group(1), [])
+
+    def _update_folder_permissions(self, match, query, body):
+        with self.lock:
+            if match.group(1) not in self.folders:
+                return 404, {'message': 'Folder not found'}
+            self.folder_permissions[match.group(1)] = body['items']
+        return 200, {'message': 'Folder permissions updated'}
+
+    def _upload_dashboard(self, match, query, body):
+        dashboard = body['dashboard']
+        with self.lock:
+            if body.get('folderUid') and body['folderUid'] not in self.folders:
+                return 400, {'message': 'Folder not found'}
+            # Like Grafana, dashboards without uid are matched by title within their folder
+            same_title = [known for known, stored in self.dashboards.items()
+                          if stored['dashboard']['title'] == dashboard['title']
+                          and stored['folderUid'] == body.get('folderUid')]
+            uid = dashboard.get('uid') or (same_title[0] if same_title else f'dashboard{next(self._ids)}')
+            previous = self.dashboards.get(uid)
+            if previous and not body.get('overwrite'):
+                return 412, {'message': 'A dashboard with the same uid already exists', 'status': 'name-exists'}
+            version = previous['version'] + 1 if previous else 1
+            dashboard_id = previous['id'] if previous else next(self._ids)
+            self.dashboards[uid] = {'id': dashboard_id, 'version': version, 'dashboard': dashboard,
+                                    'folderUid': body.get('folderUid')}
+        return 200, {'id': dashboard_id, 'uid': uid, 'url': f'/d/{uid}', 'status': 'success', 'version': version,
+                     'slug': re.sub(r'[^a-z0-9]+', '-', dashboard['title'].lower()).strip('-')}
+
+    @staticmethod
+    def _stored_datasource(datasource_id: int, body: Dict) -> Dict:
+        # Like Grafana, secrets are write only
+        stored = {key: value for key, value in body.items() if key != 'secureJsonData'}
+        secure_fields = {key: True for key in body.get('secureJsonData', {})}
+        return {**stored, 'id': datasource_id, 'secureJsonFields': secure_fields}
+
+    def _get_datasource(self, match, query, body):
+        with self.lock:
+            for datasource in self.datasources.values():
+                if datasource['name'] == match.group(1):
+                    return 200, datasource
+        return 404, {'message': 'Data source not found'}
+
+    def _create_datasource(self, match, query, body):
+        with self.lock:
+            if any(datasource['name'] == body['name'] for datasource in self.datasources.values()):
+                return 409, {'message': 'Data source with the same name already exists'}
+            datasource_id = next(self._ids)
+            self.datasources[datasource_id] = self._stored_datasource(datasource_id, body)
+        return 200, {'id': datasource_id, 'name': body['name'], 'message': 'Datasource added',
+                     'datasource': self.datasources[datasource_id]}
+
+    def _update_datasource(self, match, query, body):
+        datasource_id = int(match.group(1))
+        with self.lock:
+            if datasource_id not in self.datasources:
+                return 404, {'message': 'Data source not found'}
+            self.datasources[datasource_id] = self._stored_datasource(datasource_id, body)
+        return 200, {'id': datasource_id, 'name': body['name'], 'message': 'Datasource updated',
+                     'datasource': self.datasources[datasource_id]}
+
+    def _query_datasources(self, match, query, body):
+        # The SQL is not run, every query returns an empty frame
+        with self.lock:
+            self.datasource_queries.extend(body['queries'])
+        return 200, {'results': {query['refId']: {'frames': [{'schema': {'fields': []}, 'data': {'values': []}}]}
+                                 for query in body['queries']}}
+
+
+class GitLabStandIn(StandInServer):
+    """
+    Subgroups and members of GitLab groups, served below /api/v4 like the GitLab REST API
+    """
+
+    def __init__(self, behaviour: Optional[StandInBehaviour] = None):
+        super().__init__(behaviour)
+        self.subgroups: Dict[int, List[Dict]] = {}
+        self.members: Dict[int, List[Dict]] = {}
+
+        self.route('GET', r'/api/v4/groups/(\d+)/subgroups', self._get_subgroups)
+        self.route('GET', r'/api/v4/groups/(\d+)/members/all', self._get_members)
+
+    @property
+    def api_url(self) -> str:
+        return f'{self.url}/api/v4'
+
+    def _authorised(self, headers) -> Optional[Tuple[int, object]]:
+        if not headers.get('PRIVATE-TOKEN'):
+            return 401, {'message': '401 Unauthorized'}
+        return None
+
+    def add_group(self, parent_group_id: int, group_id: int, name: str, members: List[Dict]) -> None:
+        """
+        :param members: [ Dict({ "id": int, "username": str, "name": str }), ... ]
+        """
+        with self.lock:
+            self.subgroups.setdefault(parent_group_id, []).append(
+                {'id': group_id, 'name': name, 'parent_id': parent_group_id})
+            self.members[group_id] = members
+
+    def add_course(self, parent_group_id: int, groups: int, members_per_group: int) -> None:
+        """
+        Adds groups subgroups to parent_group_id, each with members_per_group distinct students
+        """
+        member_ids = itertools.count(start=1)
+        for group_number in range(groups):
+            members = []
+            for member_id in itertools.islice(member_ids, members_per_group):
+                members.append({'id': member_id, 'username': f'student{member_id}', 'name': f'Student {member_id}'})
+            self.add_group(parent_group_id, parent_group_id * 10_000 + group_number, f'group{group_number}', members)
+
+    def _get_subgroups(self, match, query, body):
+        with self.lock:
+            if int(match.group(1)) not in self.subgroups and int(match.group(1)) not in self.members:
+                return 404, {'message': '404 Group Not Found'}
+            return 200, list(self.subgroups.get(int(match.group(1)), []))
+
+    def _get_members(self, match, query, body):
+        with self.lock:
+            if int(match.group(1)) not in self.members:
+                return 404, {'message': '404 Group Not Found'}
+            return 200, list(self.members[int(match.group(1))])
@@ -0,0 +1,310 @@
+"""
+Fills a Postgres database, e.g. the db service of compose.yml, with synthetic changecontribution,
+commitaggregate and issueaggregate rows for testing the dashboard queries at realistic volumes.
+
+Every group has its own seeded random stream, so a dataset is reproducible from its spec, and rows are
+streamed into COPY FROM STDIN in batches without ever being held in memory.
+
+    python -m benchmarks.synthetic_dataset --dsn "dbname=grafana user=grafana host=localhost" \\
+        --groups 2000 --authors 5 --commits 1000 --issues 150
+"""
+import argparse
+import dataclasses
+import hashlib
+import io
+import itertools
+import json
+import logging
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection
+
+from generate_dashboards.dashboard.group_overview import CHANGE_TYPES
+from manage_users.db_connector import execute_db_conn
+
+_LOG = logging.getLogger(__name__)
+
+CREATE_TABLES_SQL = '''
+CREATE TABLE IF NOT EXISTS changecontribution (
+    group_id varchar NOT NULL,
+    repository_id integer NOT NULL,
+    author_email varchar NOT NULL,
+    type varchar NOT NULL,
+    commit_sha varchar NOT NULL,
+    "timestamp" timestamp NOT NULL,
+    lines_added integer NOT NULL,
+    lines_removed integer NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS commitaggregate (
+    group_id varchar NOT NULL,
+    commit_sha varchar NOT NULL,
+    commit_time timestamp NOT NULL,
+    project_path varchar NOT NULL,
+    title json NOT NULL,
+    size varchar NOT NULL,
+    is_merge_commit boolean NOT NULL,
+    gitlab_issues_referenced integer[] NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS issueaggregate (
+    group_id varchar NOT NULL,
+    issue_iid integer NOT NULL,
+    created_at timestamp NOT NULL,
+    closed_at timestamp,
+    state varchar NOT NULL,
+    title json NOT NULL,
+    description json NOT NULL,
+    author varchar NOT NULL
+);
+'''
+
+# Share of the changed files per change type
+CHANGE_TYPE_WEIGHTS = {
+    'FUNCTIONAL': 55,
+    'TEST': 15,
+    'CONFIGURATION': 12,
+    'DOCUMENTATION': 8,
+    'OTHER': 10,
+}
+
+_TITLE_WORDS = ['add', 'fix', 'update', 'remove', 'refactor', 'test', 'component', 'page', 'api', 'style',
+                'readme', 'login', 'form', 'button', 'query', 'bug', 'layout', 'config', 'lint', 'docs', 'wip']
+# Students mostly work in the evening, hour weights from 00 to 23
+_HOUR_WEIGHTS = [2, 1, 1, 0, 0, 0, 0, 1, 3, 6, 8, 8, 7, 8, 9, 9, 8, 7, 7, 8, 9, 8, 6, 4]
+
+
+@dataclasses.dataclass(frozen=True)
+class DatasetSpec:
+    groups: int = 100
+    authors_per_group: int = 5
+    commits_per_author: int = 200
+    issues_per_group: int = 60
+    start: datetime = datetime(2021, 8, 16)
+    # Length of the semester, with project deadlines every deadline_every_days days
+    days: int = 120
+    deadline_every_days: int = 28
+    seed: int = 0
+
+    def group_name(self, group_number: int) -> str:
+        return f'group{group_number}'
+
+    def random(self, group_number: int, stream: str) -> random.Random:
+        # Independent of how many groups are generated and of the order the tables are loaded in
+        return random.Random(f'{self.seed}-{group_number}-{stream}')
+
+
+@dataclasses.dataclass
+class _Commit:
+    sha: str
+    time: datetime
+    author_email: str
+    title: str
+    is_merge_commit: bool
+    changes: List[Tuple[str, int, int]]
+
+
+def _moment(spec: DatasetSpec, rnd: random.Random) -> datetime:
+    # Activity increases towards every deadline
+    deadlines = max(spec.days // spec.deadline_every_days, 1)
+    deadline = rnd.randrange(1, deadlines + 1) * spec.deadline_every_days
+    day = max(deadline - int(rnd.expovariate(1 / 6)), 0)
+    hour = rnd.choices(range(24), weights=_HOUR_WEIGHTS)[0]
+    return spec.start + timedelta(days=min(day, spec.days - 1), hours=hour, seconds=rnd.randrange(3600))
+
+
+def _title(rnd: random.Random, mean_words: float) -> str:
+    words = max(1, int(rnd.gauss(mean_words, mean_words / 2)))
+    return ' '.join(rnd.choices(_TITLE_WORDS, k=words)).capitalize()
+
+
+def _group_commits(spec: DatasetSpec, group_number: int) -> Iterator[_Commit]:
+    rnd = spec.random(group_number, 'commits')
+    authors = [f'student{group_number}x{n}@stud.ntnu.no' for n in range(spec.authors_per_group)]
+    titles: List[str] = []
+    change_types = list(CHANGE_TYPES)
+    cumulative_weights = list(itertools.accumulate(CHANGE_TYPE_WEIGHTS[change_type] for change_type in change_types))
+    for number in range(spec.authors_per_group * spec.commits_per_author):
+        is_merge_commit = rnd.random() < 0.1
+        if is_merge_commit:
+            title = f'Merge branch \'{rnd.choice(_TITLE_WORDS)}\' into \'master\''
+        elif titles and rnd.random() < 0.05:
+            # Some titles, like "fix", are reused over and over
+            title = rnd.choice(titles)
+        else:
+            title = _title(rnd, 5)
+            titles.append(title)
+
+        changes = []
+        for change_type in rnd.choices(change_types, cum_weights=cumulative_weights, k=1 + int(rnd.expovariate(0.6))):
+            # Line counts are heavy tailed, most commits are small
+            changes.append((change_type, int(rnd.lognormvariate(2.5, 1.2)), int(rnd.lognormvariate(1.5, 1.2))))
+
+        yield _Commit(
+            sha=hashlib.sha1(f'{spec.seed}-{group_number}-{number}'.encode()).hexdigest(),
+            time=_moment(spec, rnd),
+            author_email=rnd.choice(authors),
+            title=title,
+            is_merge_commit=is_merge_commit,
+            changes=changes,
+        )
+
+
+def changecontribution_rows(spec: DatasetSpec) -> Iterator[Tuple]:
+    for group_number in range(spec.groups):
+        for commit in _group_commits(spec, group_number):
+            for change_type, lines_added, lines_removed in commit.changes:
+                yield (spec.group_name(group_number), group_number + 1, commit.author_email, change_type,
+                       commit.sha, commit.time, lines_added, lines_removed)
+
+
+def commitaggregate_rows(spec: DatasetSpec) -> Iterator[Tuple]:
+    for group_number in range(spec.groups):
+        rnd = spec.random(group_number, 'references')
+        for commit in _group_commits(spec, group_number):
+            lines = sum(added + removed for _, added, removed in commit.changes)
+            size = 'SMALL' if lines <= 50 else 'MEDIUM' if lines <= 800 else 'LARGE'
+            references = min(int(rnd.expovariate(1.5)), spec.issues_per_group)
+            referenced = rnd.sample(range(1, spec.issues_per_group + 1), k=references)
+            yield (spec.group_name(group_number), commit.sha, commit.time, f'course/{spec.group_name(group_number)}',
+                   json.dumps({'raw': commit.title, 'length': len(commit.title)}), size, commit.is_merge_commit,
+                   referenced)
+
+
+def issueaggregate_rows(spec: DatasetSpec) -> Iterator[Tuple]:
+    for group_number in range(spec.groups):
+        rnd = spec.random(group_number, 'issues')
+        for issue_iid in range(1, spec.issues_per_group + 1):
+            created_at = _moment(spec, rnd)
+            closed = rnd.random() < 0.7
+            title = _title(rnd, 4)
+            # A fifth of the issues have no description at all
+            description_length = 0 if rnd.random() < 0.2 else int(rnd.lognormvariate(5, 1))
+            yield (spec.group_name(group_number), issue_iid, created_at,
+                   created_at + timedelta(hours=rnd.expovariate(1 / 72)) if closed else None,
+                   'CLOSED' if closed else 'OPENED',
+                   json.dumps({'raw': title, 'length': len(title)}),
+                   json.dumps({'length': description_length}),
+                   f'student{group_number}x{rnd.randrange(spec.authors_per_group)}')
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, list):
+        return '{' + ','.join(map(str, value)) + '}'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyStream(io.TextIOBase):
+    """
+    File-like view of rows in the COPY text format, read by copy_expert in chunks as it sends them
+    """
+
+    def __init__(self, rows: Iterable[Tuple]):
+        self._lines = ('\t'.join(map(_copy_value, row)) + '\n' for row in rows)
+        self._buffer = ''
+        # Rows handed out so far
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def copy_rows(conn: connection, table: str, rows: Iterable[Tuple], batch_rows: int = 500_000,
+              columns: Optional[List[str]] = None, progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Loads rows into table with one COPY FROM STDIN per batch of batch_rows rows, each committed on its own
+    :return: the number of loaded rows
+    """
+    column_list = f' ({", ".join(columns)})' if columns else ''
+    rows = iter(rows)
+    loaded = 0
+    while True:
+        stream = CopyStream(itertools.islice(rows, batch_rows))
+        with conn:
+            with conn.cursor() as curs:
+                curs.copy_expert(f'COPY {table}{column_list} FROM STDIN', stream, size=1 << 20)
+        if not stream.rows:
+            return loaded
+        loaded += stream.rows
+        if progress:
+            progress(loaded)
+
+
+def load_dataset(conn: connection, spec: DatasetSpec, batch_rows: int = 500_000) -> None:
+    execute_db_conn(conn, CREATE_TABLES_SQL)
+    tables = [
+        ('changecontribution', changecontribution_rows(spec)),
+        ('commitaggregate', commitaggregate_rows(spec)),
+        ('issueaggregate', issueaggregate_rows(spec)),
+    ]
+    for table, rows in tables:
+        start = time.perf_counter()
+        loaded = copy_rows(conn, table, rows, batch_rows,
+                           progress=lambda count, name=table: _LOG.info(f"{name}: {count} rows"))
+        seconds = time.perf_counter() - start
+        _LOG.info(f"Loaded {loaded} rows into {table} in {seconds:.1f} s ({loaded / max(seconds, 1e-9):.0f} rows/s)")
+    execute_db_conn(conn, 'ANALYZE changecontribution; ANALYZE commitaggregate; ANALYZE issueaggregate;')
+
+
+def expected_changecontribution_rows(spec: DatasetSpec) -> int:
+    """
+    Rough size of changecontribution, commits change 1 + floor(Exp(0.6)) file types
+    """
+    return math.ceil(spec.groups * spec.authors_per_group * spec.commits_per_author * (1 + 1 / math.expm1(0.6)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', required=True, help='libpq connection string')
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--authors', type=int, default=5, help='authors per group')
+    parser.add_argument('--commits', type=int, default=200, help='commits per author')
+    parser.add_argument('--issues', type=int, default=60, help='issues per group')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-rows', type=int, default=500_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    spec = DatasetSpec(groups=args.groups, authors_per_group=args.authors, commits_per_author=args.commits,
+                       issues_per_group=args.issues, seed=args.seed)
+    _LOG.info(f"Generating about {expected_changecontribution_rows(spec)} changecontribution rows")
+    conn = psycopg2.connect(args.dsn)
+    try:
+        load_dataset(conn, spec, args.batch_rows)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+Single entry point for provisioning Grafana from GitLab and generating the group dashboards.
+
+    python cli.py sync-users
+    python cli.py build-dashboards
+    python cli.py provision --workers 16
+    python cli.py sync-courses --parent-groups 1042 11911 --processes 4
+    python cli.py daemon --port 8090
+    python cli.py migrate
+    python cli.py refresh
+    python cli.py partitions --detach-before 2021-01-01 --archive-schema archive
+    python cli.py datasource --viewers 120 --yaml provisioning/datasources/analytics.yaml
+    python cli.py teardown --yes
+    python cli.py bench provisioning --groups 100
+
+Settings are read once from the .env file at the root of the repository, see manage_users.config.
+grafanalib, grafana_api, requests and psycopg2 are only imported by the subcommands that use them,
+so --help and invalid arguments return without loading them.
+"""
+import argparse
+import importlib
+import logging
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+# Benchmark name: module with a main() reading sys.argv
+BENCHMARKS = {
+    'pivot': 'benchmarks.bench_pivot',
+    'provisioning': 'benchmarks.bench_provisioning',
+    'startup': 'benchmarks.bench_startup',
+    'dataset': 'benchmarks.synthetic_dataset',
+    'serialisation': 'benchmarks.bench_serialisation',
+    'dashboard-load': 'benchmarks.dashboard_load',
+}
+
+
+def sync_users(config, args) -> None:
+    from manage_users.__main__ import sync_users as sync
+
+    sync(config)
+
+
+def build_dashboards(config, args) -> None:
+    from generate_dashboards.__main__ import build_dashboards as build
+
+    build(config)
+
+
+def provision(config, args) -> None:
+    from manage_users.__main__ import provision as run_provisioning
+
+    upload_dashboards = None
+    pool = None
+    if not args.skip_dashboards:
+        from generate_dashboards.__main__ import connect_analytics_pool, upload_group_dashboards
+        from generate_dashboards.schema.maintenance import SchemaFeatures, detect_schema
+        from manage_users.db_connector import get_group_activity_range
+
+        # One connection per worker, so concurrent uploads don't wait for each other's lookups
+        pool = connect_analytics_pool(config, args.workers)
+        schema = SchemaFeatures()
+        if pool:
+            with pool.connection() as db:
+                schema = detect_schema(db)
+
+        def upload_dashboards(group_name: str, gitlab_group_id: int):
+            activity_range = None
+            if pool:
+                with pool.connection() as db:
+                    activity_range = get_group_activity_range(db, group_name)
+            return upload_group_dashboards(config, group_name, gitlab_group_id, activity_range, schema)
+
+    try:
+        run_provisioning(config, args.workers, upload_dashboards)
+    finally:
+        if pool:
+            pool.close()
+
+
+def sync_courses(config, args) -> None:
+    import json
+    from manage_users.sharding import provision_courses
+
+    report = provision_courses(config, args.parent_groups or [config.parent_group_id], args.processes, args.workers)
+    report_json = json.dumps(report.to_json_data(), indent=2)
+    if args.report:
+        with open(args.report, 'w') as file:
+            file.write(report_json)
+    else:
+        print(report_json)
+
+
+def daemon(config, args) -> None:
+    from manage_users.api.grafana import auth as grafana_auth
+    from manage_users.daemon import ChangeBuffer, SyncDaemon, webhook_server
+
+    grafana_api = grafana_auth(host=config.grafana_host, username=config.grafana_user,
+                               password=config.grafana_password)
+    sync_daemon = SyncDaemon(config, grafana_api, ChangeBuffer(args.debounce, args.max_delay), args.reconcile_every)
+    server = webhook_server(sync_daemon.submit, args.host, args.port, config.webhook_secret)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sync_daemon.run()
+    except KeyboardInterrupt:
+        sync_daemon.stop()
+    finally:
+        server.shutdown()
+
+
+@contextmanager
+def _analytics_db(config) -> Iterator:
+    if not config.db_host:
+        sys.exit("the analytics database is not configured, set DB_HOST, DB_NAME, DB_USER and DB_PASSWORD")
+    from generate_dashboards.__main__ import connect_analytics_db
+
+    conn = connect_analytics_db(config)
+    try:
+        # Commits what is left open, or rolls it back if the command fails
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def migrate(config, args) -> None:
+    from generate_dashboards.schema.maintenance import migrate as apply_migrations
+
+    with _analytics_db(config) as db:
+        print(apply_migrations(db))
+
+
+def refresh(config, args) -> None:
+    from generate_dashboards.schema.maintenance import refresh as refresh_tables
+
+    with _analytics_db(config) as db:
+        for table, refreshed in refresh_tables(db, args.groups).items():
+            print(table, refreshed)
+
+
+def partitions(config, args) -> None:
+    from generate_dashboards.schema.maintenance import maintain_partitions
+
+    with _analytics_db(config) as db:
+        changed = maintain_partitions(db, args.periods_ahead, args.detach_before, args.archive_schema)
+    for table, names in changed.items():
+        print(table, ' '.join(names))
+
+
+def datasource(config, args) -> None:
+    if not (config.db_host and config.db_name and config.db_user):
+        sys.exit("datasource needs DB_HOST, DB_NAME and DB_USER of the analytics database")
+    from generate_dashboards.api import get_dashboard_model
+    from generate_dashboards.dashboard.group_overview import commit_drilldown, group_overview
+    from generate_dashboards.datasource import analytics_datasources, pool_sizing, provisioning_yaml, \
+        queries_on_load, statement_timeout_sql
+
+    queries_per_load = max(queries_on_load(get_dashboard_model(dashboard('group')))
+                           for dashboard in (group_overview, commit_drilldown))
+    sizing = pool_sizing(args.viewers, queries_per_load, args.connection_budget, args.grafana_instances)
+    print(f"{args.viewers} viewers, {queries_per_load} queries per dashboard load: "
+          f"maxOpenConns {sizing.max_open_conns}, maxIdleConns {sizing.max_idle_conns}")
+
+    datasources = analytics_datasources(config, sizing)
+    if args.yaml:
+        with open(args.yaml, 'w') as file:
+            file.write(provisioning_yaml(datasources))
+    else:
+        from generate_dashboards.datasource import provision_datasources
+        from manage_users.api.grafana import auth as grafana_auth
+
+        grafana_api = grafana_auth(host=config.grafana_host, username=config.grafana_user,
+                                   password=config.grafana_password)
+        for response in provision_datasources(grafana_api, datasources):
+            print(response['message'], response['name'])
+    if args.statement_timeout_ms:
+        print(f"Run on every database server: {statement_timeout_sql(config.db_user, args.statement_timeout_ms)}")
+
+
+def teardown(config, args) -> None:
+    if not args.yes:
+        sys.exit("teardown deletes every non-admin user, team and folder, pass --yes to confirm")
+    from manage_users.__main__ import teardown as delete_everything
+
+    delete_everything(config)
+
+
+def bench(config, args) -> None:
+    module = importlib.import_module(BENCHMARKS[args.benchmark])
+    sys.argv = [f'{sys.argv[0]} bench {args.benchmark}', *args.arguments]
+    module.main()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--env-file', default=None, help='defaults to .env at the root of the repository')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    subcommands.add_parser('sync-users', help='create Grafana users, teams and folders from the GitLab groups') \
+        .set_defaults(run=sync_users)
+    subcommands.add_parser('build-dashboards', help='upload the dashboards of every group folder') \
+        .set_defaults(run=build_dashboards)
+
+    provision_parser = subcommands.add_parser(
+        'provision', help='sync-users and build-dashboards with concurrent Grafana calls')
+    provision_parser.add_argument('--workers', type=int, default=8, help='concurrent Grafana calls')
+    provision_parser.add_argument('--skip-dashboards', action='store_true')
+    provision_parser.set_defaults(run=provision)
+
+    courses_parser = subcommands.add_parser(
+        'sync-courses', help='provision several courses at once, spread over worker processes')
+    courses_parser.add_argument('--parent-groups', type=int, nargs='+', default=None,
+                                help='GitLab parent group of every course, defaults to PARENT_GROUP_ID')
+    courses_parser.add_argument('--processes', type=int, default=None, help='defaults to the number of cores')
+    courses_parser.add_argument('--workers', type=int, default=8, help='concurrent Grafana calls per process')
+    courses_parser.add_argument('--report', default=None, help='write the merged JSON report here')
+    courses_parser.set_defaults(run=sync_courses)
+
+    daemon_parser = subcommands.add_parser(
+        'daemon', help='apply GitLab membership webhooks to Grafana as they arrive')
+    daemon_parser.add_argument('--host', default='127.0.0.1')
+    daemon_parser.add_argument('--port', type=int, default=8090)
+    daemon_parser.add_argument('--debounce', type=float, default=2.0,
+                               help='seconds without new events before changes are applied')
+    daemon_parser.add_argument('--max-delay', type=float, default=30.0,
+                               help='maximum seconds a change waits during a burst of events')
+    daemon_parser.add_argument('--reconcile-every', type=float, default=3600.0,
+                               help='seconds between full reconciliations with GitLab')
+    daemon_parser.set_defaults(run=daemon)
+
+    subcommands.add_parser('migrate', help='create and fill the optional tables and columns read by the dashboards') \
+        .set_defaults(run=migrate)
+    refresh_parser = subcommands.add_parser(
+        'refresh', help='bring the precomputed dashboard tables up to date, run after every ingestion')
+    refresh_parser.add_argument('--groups', nargs='+', default=None, help='only refresh these group ids')
+    refresh_parser.set_defaults(run=refresh)
+
+    partitions_parser = subcommands.add_parser(
+        'partitions', help='create the coming partitions of the partitioned tables, optionally detach old ones')
+    partitions_parser.add_argument('--periods-ahead', type=int, default=2,
+                                   help='months or semesters to create partitions for, after the current one')
+    partitions_parser.add_argument('--detach-before', type=datetime.fromisoformat, default=None,
+                                   help='detach the partitions ending at or before this date, e.g. 2021-01-01')
+    partitions_parser.add_argument('--archive-schema', default=None, help='move the detached partitions here')
+    partitions_parser.set_defaults(run=partitions)
+
+    datasource_parser = subcommands.add_parser(
+        'datasource', help='upsert the analytics datasources, with pools sized for the expected viewers')
+    datasource_parser.add_argument('--viewers', type=int, default=60, help='viewers opening a dashboard at once')
+    datasource_parser.add_argument('--connection-budget', type=int, default=80,
+                                   help='Postgres connections Grafana may use in total, of the default 100')
+    datasource_parser.add_argument('--grafana-instances', type=int, default=1)
+    datasource_parser.add_argument('--statement-timeout-ms', type=int, default=None,
+                                   help='print the SQL limiting the queries of DB_USER')
+    datasource_parser.add_argument('--yaml', default=None, help='write a provisioning file instead of using the API')
+    datasource_parser.set_defaults(run=datasource)
+
+    teardown_parser = subcommands.add_parser('teardown', help='delete every non-admin user, team and folder')
+    teardown_parser.add_argument('--yes', action='store_true', help='confirm the deletion')
+    teardown_parser.set_defaults(run=teardown)
+
+    bench_parser = subcommands.add_parser('bench', help='run a benchmark, arguments are passed on to it')
+    bench_parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    bench_parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    bench_parser.set_defaults(run=bench)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    from manage_users.config import DEFAULT_ENV_FILE, load_config
+
+    config = load_config(args.env_file or DEFAULT_ENV_FILE)
+    args.run(config, args)
+
+    if config.metrics_dir and args.command != 'bench':
+        from manage_users.instrumentation import METRICS
+
+        METRICS.write_reports(config.metrics_dir, name=args.command.replace('-', '_'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,82 @@
-import dotenv
+from datetime import datetime
+from typing import List, Optional, Tuple
 
-from api import upload_to_grafana, get_dashboard_json
-from generate_dashboards.dashboard.group_overview import group_overview
-from manage_users.api.grafana import get_all_folders, auth as grafana_auth
+from psycopg2.extensions import connection
 
+from generate_dashboards.api import upload_to_grafana, get_dashboard_payload
+from generate_dashboards.dashboard.group_overview import group_overview, commit_drilldown
+from generate_dashboards.schema.maintenance import SchemaFeatures, detect_schema
+from manage_users.api.gitlab import get_subgroups_from_parent_group_id
+from manage_users.config import Config, load_config
+from manage_users.db_connector import ConnectionPool, connect, get_group_activity_range
+from manage_users.instrumentation import METRICS
+from manage_users.uids import DRILLDOWN, OVERVIEW, folder_uid, group_uid
 
-def main():
-    API_KEY = dotenv.get_key('../.env', "GRAFANA_API_KEY")
-    SERVER = dotenv.get_key('../.env', "GRAFANA_SERVER")
 
-    GRAFANA_API = grafana_auth(host='localhost:3000', username="admin", password="admin")
-    all_folders = get_all_folders(GRAFANA_API)
+def connect_analytics_db(config: Config) -> Optional[connection]:
+    # The analytics database is optional, it is only used to pick the default time range of each dashboard
+    if not config.db_host:
+        return None
+    return connect(
+        dbname=config.db_name,
+        user=config.db_user,
+        host=config.db_host,
+        password=config.db_password,
+    )
+
+
+def connect_analytics_pool(config: Config, maxconn: int) -> Optional[ConnectionPool]:
+    # Pool for concurrent uploads, see connect_analytics_db
+    if not config.db_host:
+        return None
+    return ConnectionPool(
+        dbname=config.db_name,
+        user=config.db_user,
+        host=config.db_host,
+        password=config.db_password,
+        maxconn=maxconn,
+    )
+
+
+def upload_group_dashboards(config: Config, group_name: str, gitlab_group_id: int,
+                            activity_range: Optional[Tuple[datetime, datetime]] = None,
+                            schema: SchemaFeatures = SchemaFeatures()) -> List:
+    """
+    Uploads the dashboards of a group into its folder, both addressed by the uids derived from the GitLab group
+    :param schema: optional tables of the analytics database read by the dashboards, see detect_schema
+    """
+    dashboards = [
+        group_overview(group_name, activity_range=activity_range, uid=group_uid(gitlab_group_id, OVERVIEW),
+                       use_running_totals=schema.running_totals, use_text_metrics=schema.text_metrics,
+                       use_milestone_table=schema.milestone_table, use_author_aliases=schema.author_aliases),
+        commit_drilldown(group_name, activity_range=activity_range, uid=group_uid(gitlab_group_id, DRILLDOWN),
+                         use_text_metrics=schema.text_metrics),
+    ]
+    return [
+        upload_to_grafana(get_dashboard_payload(dashboard, folder_uid=folder_uid(gitlab_group_id)),
+                          config.dashboard_server, config.grafana_api_key, verify=True)
+        for dashboard in dashboards
+    ]
+
+
+def build_dashboards(config: Config) -> None:
+    # The folders created by manage_users are addressed by uid, only the GitLab groups are listed
+    groups = get_subgroups_from_parent_group_id(config.gitlab_token, config.parent_group_id, config.gitlab_api_url)
+    DB = connect_analytics_db(config)
+    schema = detect_schema(DB) if DB else SchemaFeatures()
+
+    for group in groups:
+        activity_range = get_group_activity_range(DB, group['name']) if DB else None
+        for res in upload_group_dashboards(config, group['name'], group['id'], activity_range, schema):
+            print(res)
+
+
+def main():
+    config = load_config()
+    build_dashboards(config)
 
-    for folder in all_folders:
-        overview = get_dashboard_json(group_overview(folder['title']), folder_uid=folder['uid'])
-        res = upload_to_grafana(overview, SERVER, API_KEY, verify=True)
-        print(res)
+    if config.metrics_dir:
+        METRICS.write_reports(config.metrics_dir, name='generate_dashboards')
 
 
 if __name__ == "__main__":
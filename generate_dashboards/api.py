@@ -1,22 +1,140 @@
 import json
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, Optional, Union
 
 import requests
 from grafanalib._gen import DashboardEncoder
 from grafanalib.core import Dashboard
-from typing import Optional
 
+from manage_users.instrumentation import METRICS, instrumented
 
-def get_dashboard_json(dashboard: Dashboard, folder_uid: Optional[str] = None):
-    return json.dumps({
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+Serialisation of dashboard upload payloads.
+
+A serialiser turns a payload into chunks of UTF-8 JSON. "compact" and "orjson" encode in one shot,
+which is several times faster than the streaming pure Python encoder used by "pretty".
+Gzip compression consumes the chunks and yields compressed chunks, the full compressed body is never built.
+"""
+
+# Size of the chunks written to the request
+CHUNK_SIZE = 64 * 1024
+
+Serialiser = Callable[[Dict], Iterable[bytes]]
+
+
+def _to_json_data(obj):
+    to_json_data = getattr(obj, 'to_json_data', None)
+    if to_json_data is None:
+        raise TypeError(f"{type(obj).__name__} is not JSON serialisable")
+    return to_json_data()
+
+
+def _pretty(payload: Dict) -> Iterator[bytes]:
+    # iterencode yields every token separately, they are joined into chunks of about CHUNK_SIZE characters
+    pieces, size = [], 0
+    for piece in DashboardEncoder(indent=2).iterencode(payload):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(pieces).encode()
+            pieces, size = [], 0
+    yield ''.join(pieces).encode()
+
+
+def _compact(payload: Dict) -> Iterable[bytes]:
+    return [DashboardEncoder(separators=(',', ':')).encode(payload).encode()]
+
+
+def _orjson(payload: Dict) -> Iterable[bytes]:
+    return [orjson.dumps(payload, default=_to_json_data)]
+
+
+SERIALISERS: Dict[str, Serialiser] = {
+    'pretty': _pretty,
+    'compact': _compact,
+}
+# orjson is an optional dependency
+if orjson is not None:
+    SERIALISERS['orjson'] = _orjson
+
+DEFAULT_SERIALISER = 'orjson' if orjson is not None else 'compact'
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # Slices of a memoryview are not copies of large one shot chunks
+        view = memoryview(chunk)
+        for start in range(0, len(view), CHUNK_SIZE):
+            compressed = compressor.compress(view[start:start + CHUNK_SIZE])
+            if compressed:
+                yield compressed
+    yield compressor.flush()
+
+
+def get_dashboard_payload(dashboard: Dashboard, folder_uid: Optional[str] = None) -> Dict:
+    return {
         "dashboard": dashboard.to_json_data(),
         "overwrite": True,
         "message": "test message",
         "folderUid": folder_uid
-    }, indent=2, cls=DashboardEncoder)
+    }
+
+
+def serialise(payload: Dict, serialiser: str = DEFAULT_SERIALISER, compress: bool = False) -> Iterable[bytes]:
+    """
+    :param serialiser: name of one of SERIALISERS
+    :return: the chunks of the request body, gzip compressed if compress is set
+    """
+    chunks = SERIALISERS[serialiser](payload)
+    return gzip_chunks(chunks) if compress else chunks
+
 
+def get_dashboard_model(dashboard: Dashboard) -> Dict:
+    # JSON model of the dashboard as stored by Grafana, with plain dicts and lists only
+    return json.loads(b''.join(SERIALISERS[DEFAULT_SERIALISER]({'dashboard': dashboard.to_json_data()})))['dashboard']
 
-def upload_to_grafana(json_dashboard, server, api_key, verify=True):
+
+def get_dashboard_json(dashboard: Dashboard, folder_uid: Optional[str] = None):
+    # Readable JSON, for inspecting dashboards
+    return b''.join(serialise(get_dashboard_payload(dashboard, folder_uid), 'pretty')).decode()
+
+
+@instrumented('grafana')
+def upload_to_grafana(dashboard_payload: Union[Dict, str], server, api_key, verify=True,
+                      serialiser: str = DEFAULT_SERIALISER, compress: bool = False):
+    """
+    :param dashboard_payload: payload from get_dashboard_payload, or JSON from get_dashboard_json which is sent as is
+    :param compress: gzip the request body, Grafana must be served behind a proxy which decompresses requests
+    """
     headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
-    r = requests.post(f'http://{server}/api/dashboards/db', data=json_dashboard, headers=headers, verify=verify)
+    if isinstance(dashboard_payload, str):
+        chunks = [dashboard_payload.encode()]
+        if compress:
+            chunks = gzip_chunks(chunks)
+    else:
+        chunks = serialise(dashboard_payload, serialiser, compress)
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+
+    sent = 0
+
+    def body() -> Iterator[bytes]:
+        nonlocal sent
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+
+    # A single chunk is sent with a Content-Length, streamed bodies with chunked transfer encoding
+    data = chunks[0] if isinstance(chunks, list) and len(chunks) == 1 else body()
+    r = requests.post(f'http://{server}/api/dashboards/db', data=data, headers=headers, verify=verify,
+                      hooks={'response': METRICS.response_hook})
+    # The response hook only counts bodies of known length
+    METRICS.record_bytes(sent=sent)
     r.raise_for_status()
     return r.json()
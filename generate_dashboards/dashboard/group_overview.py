@@ -1,11 +1,16 @@
 import typing
+from datetime import datetime
 
-from grafanalib.core import Dashboard, Time, Templating, GridPos, SqlTarget, TimeSeries, Threshold, Stat, RowPanel, \
+from grafanalib.core import Dashboard, Templating, GridPos, SqlTarget, TimeSeries, Threshold, Stat, \
     Table, Annotations
 
 from generate_dashboards.custom_class import BarChart
+from generate_dashboards.dashboard.layout import layout, LayoutRow, SizedPanel, PanelSize
+from generate_dashboards.schema.tables import ACCUMULATED_CONTRIBUTION_TABLE, COMMIT_COUNT_TABLE
+from manage_users.tables import AUTHOR_ALIAS_TABLE
 from generate_dashboards.dashboard.util import rename_by_regex, annotate_with_milestones, sql_query, override_by_name, \
-    OverrideProperty, TimeSeriesSqlQuery, TableSqlQuery
+    OverrideProperty, TimeSeriesSqlQuery, TableSqlQuery, PivotColumn, filter_pivot_query, time_range_from_activity, \
+    page_size_variable, keyset_cursor_variable, page_number_variable, dashboards_link_by_tags, sql_string
 
 """
 This is the dashboard presenting an overview to each Student group
@@ -24,17 +29,41 @@ CHANGE_TYPES = {
     'OTHER': 'red',
 }
 
+# Lower bounds for $__interval, Grafana picks the bucket size from the time range and maxDataPoints
+_MIN_INTERVAL_DAY = '1d'
+_MIN_INTERVAL_WEEK = '1w'
+# Upper bounds for the number of points returned per series
+_STAT_MAX_DATA_POINTS = 60
+_TIME_SERIES_MAX_DATA_POINTS = 200
+
+# Number of rows shown by the table panels of the overview, the rest is found in the drilldown dashboard
+_TOP_N_COMMITS = 50
+_TOP_N_DUPLICATED_TITLES = 20
+_DRILLDOWN_PAGE_SIZES = [50, 100, 500, 1000]
+# Values from the URL are not checked against the options of the variable, so it is quoted and cast
+_DRILLDOWN_LIMIT = f"{sql_string('page_size')}::integer"
+
+_STAT_SIZE = PanelSize(w=6, h=4)
+
+# Buckets used to classify a commit by the total number of lines it adds
+COMMIT_SIZE_BUCKETS = {
+    'S (< 50)': 'total_lines_added <= 50',
+    'M (50-99)': 'total_lines_added > 50 AND total_lines_added <= 100',
+    'L (100<)': 'total_lines_added > 100',
+}
+
 
-def long_commit_titles(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Stat:
+def long_commit_titles(gitlab_group_name: str, pos: typing.Optional[GridPos], use_text_metrics: bool = False) -> Stat:
+    title_length = 'title_length' if use_text_metrics else "(title->>'length')::integer"
     query = f'''
     SELECT
-      $__timeGroup(commit_time, '1d') AS time,
-      COUNT(commit_sha) as amount
+      $__timeGroup(commit_time, $__interval) AS time,
+      COUNT(*) as amount
     FROM
       commitaggregate
     WHERE
       group_id='{gitlab_group_name}' AND $__timeFilter(commit_time)
-      AND (title ->> 'length')::numeric > {_LONG_COMMIT_TITLE_THRESHOLD_CHARACTERS}
+      AND {title_length} > {_LONG_COMMIT_TITLE_THRESHOLD_CHARACTERS}
       AND is_merge_commit=false
     GROUP BY time
     ORDER BY time ASC
@@ -50,6 +79,8 @@ def long_commit_titles(gitlab_group_name: str, pos: typing.Optional[GridPos]) ->
         colorMode='background',
         graphMode='area',
         gridPos=pos,
+        interval=_MIN_INTERVAL_DAY,
+        maxDataPoints=_STAT_MAX_DATA_POINTS,
         targets=[
             SqlTarget(
                 rawSql=query,
@@ -63,7 +94,7 @@ def long_commit_titles(gitlab_group_name: str, pos: typing.Optional[GridPos]) ->
 def large_commits(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Stat:
     query = f'''
     SELECT
-      $__timeGroup(commit_time, '1d') AS time,
+      $__timeGroup(commit_time, $__interval) AS time,
       COUNT(commit_sha) as amount
     FROM
       commitaggregate
@@ -103,6 +134,8 @@ def large_commits(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Stat
             Threshold(index=2, color='red', value=10.0),
         ],
         gridPos=pos,
+        interval=_MIN_INTERVAL_DAY,
+        maxDataPoints=_STAT_MAX_DATA_POINTS,
         targets=[
             SqlTarget(
                 rawSql=query,
@@ -115,16 +148,18 @@ def large_commits(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Stat
     return panel
 
 
-def issues_without_description(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Stat:
+def issues_without_description(gitlab_group_name: str, pos: typing.Optional[GridPos],
+                               use_text_metrics: bool = False) -> Stat:
+    description_length = 'description_length' if use_text_metrics else "(description->>'length')::integer"
     query = f'''
     SELECT
-      $__timeGroup(created_at, '1d') as "time",
-      COUNT(issue_iid) AS "value"
+      $__timeGroup(created_at, $__interval) as "time",
+      COUNT(*) AS "value"
     FROM
       issueaggregate
     WHERE
-      $__timeFilter(created_at) 
-      AND (description->'length')::numeric < 1
+      $__timeFilter(created_at)
+      AND {description_length} < 1
       AND group_id = '{gitlab_group_name}'
     GROUP BY "time"
     '''
@@ -154,6 +189,8 @@ def issues_without_description(gitlab_group_name: str, pos: typing.Optional[Grid
             Threshold(index=2, color='red', value=2.0),
         ],
         gridPos=pos,
+        interval=_MIN_INTERVAL_DAY,
+        maxDataPoints=_STAT_MAX_DATA_POINTS,
         targets=[
             SqlTarget(
                 rawSql=query,
@@ -166,16 +203,19 @@ def issues_without_description(gitlab_group_name: str, pos: typing.Optional[Grid
     return panel
 
 
-def issues_with_short_titles(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Stat:
+def issues_with_short_titles(gitlab_group_name: str, pos: typing.Optional[GridPos],
+                             use_text_metrics: bool = False) -> Stat:
+    title_word_count = 'title_word_count' if use_text_metrics else \
+        "array_length(string_to_array(title->>'raw', ' '), 1)"
     query = f'''
     SELECT
-      $__timeGroup(created_at, '1d') as "time",
-      COUNT(issue_iid) AS "value"
+      $__timeGroup(created_at, $__interval) as "time",
+      COUNT(*) AS "value"
     FROM
       issueaggregate
     WHERE
-      $__timeFilter(created_at) 
-      AND array_length(string_to_array(title->>'raw'::varchar, ' '), 1) < 3
+      $__timeFilter(created_at)
+      AND {title_word_count} < 3
       AND group_id = '{gitlab_group_name}'
     GROUP BY "time"
     '''.strip()
@@ -205,6 +245,8 @@ def issues_with_short_titles(gitlab_group_name: str, pos: typing.Optional[GridPo
             Threshold(index=2, color='red', value=10.0),
         ],
         gridPos=pos,
+        interval=_MIN_INTERVAL_DAY,
+        maxDataPoints=_STAT_MAX_DATA_POINTS,
         targets=[
             SqlTarget(
                 rawSql=query,
@@ -217,22 +259,60 @@ def issues_with_short_titles(gitlab_group_name: str, pos: typing.Optional[GridPo
     return panel
 
 
-def _duplicated_commit_titles(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Table:
+def _duplicated_commit_titles(
+        gitlab_group_name: str,
+        pos: typing.Optional[GridPos],
+        limit: typing.Union[int, str] = _TOP_N_DUPLICATED_TITLES,
+        use_text_metrics: bool = False,
+        page_variable: typing.Optional[str] = None,
+) -> Table:
     """
     Presents a timeline overview of the comits
+
+    :param limit: maximum number of titles, either a number or an SQL expression of a dashboard variable
+    :param page_variable: name of a page_number_variable, pages of limit titles are skipped before it.
+        The duplicates are aggregated in full either way, so OFFSET only skips output rows and a keyset
+        cursor would not save any work.
+    :param use_text_metrics: group by the stored title_hash column, see generate_dashboards.schema.text_metrics
     """
+    if use_text_metrics:
+        # Titles are grouped by their hash, the text is only looked up for the duplicated ones
+        title_key = 'title_hash'
+        title = f"""(
+        SELECT title->>'raw'
+        FROM commitaggregate AS titles
+        WHERE titles.group_id = '{gitlab_group_name}' AND titles.title_hash = duplicated.title_key
+          AND $__timeFilter(titles.commit_time)
+        LIMIT 1
+      )"""
+    else:
+        title_key, title = "title->>'raw'", 'title_key'
+
+    offset = ''
+    if page_variable:
+        page = f"GREATEST(COALESCE(NULLIF({sql_string(page_variable)}, '')::integer, 1), 1)"
+        offset = f'OFFSET ({page} - 1) * {limit}'
+
     query = TableSqlQuery(f'''
     SELECT
-      title->'raw' as "Commit Title",
+      {title} as "Commit Title",
       project_path as "Project Path",
-      COUNT(commit_sha) AS "duplicates"
-    FROM
-      commitaggregate
-    WHERE
-      $__timeFilter(commit_time) AND group_id = '{gitlab_group_name}'
-    GROUP BY "Commit Title", "Project Path"
-    HAVING COUNT(commit_sha) > 1
-    ORDER BY duplicates desc
+      duplicates
+    FROM (
+      SELECT
+        {title_key} AS title_key,
+        project_path,
+        COUNT(*) AS duplicates
+      FROM
+        commitaggregate
+      WHERE
+        $__timeFilter(commit_time) AND group_id = '{gitlab_group_name}'
+      GROUP BY 1, project_path
+      HAVING COUNT(*) > 1
+    ) AS duplicated
+    ORDER BY duplicates desc, 1, project_path
+    LIMIT {limit}
+    {offset}
     ''')
 
     panel = Table(
@@ -266,12 +346,12 @@ def _duplicated_commit_titles(gitlab_group_name: str, pos: typing.Optional[GridP
 def _changes_by_type(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> TimeSeries:
     label = 'value'
     query = TimeSeriesSqlQuery(f'''
-    SELECT 
-      $__timeGroup("timestamp", '1w') as "time",
+    SELECT
+      $__timeGroup("timestamp", $__interval) as "time",
       "type",
       COUNT(commit_sha) as "{label}"
     FROM changecontribution
-    WHERE group_id = '{gitlab_group_name}'
+    WHERE $__timeFilter("timestamp") AND group_id = '{gitlab_group_name}'
     GROUP BY time, "type"
     ORDER BY time ASC
     ''')
@@ -281,6 +361,8 @@ def _changes_by_type(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> T
         description='''
         '''.strip(),
         gridPos=pos,
+        interval=_MIN_INTERVAL_WEEK,
+        maxDataPoints=_TIME_SERIES_MAX_DATA_POINTS,
         transparent=False,
         targets=[query],
         transformations=[rename_by_regex(label, '')],
@@ -295,28 +377,56 @@ def _changes_by_type(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> T
     return panel
 
 
-def commit_table(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Table:
+def commit_table(
+        gitlab_group_name: str,
+        pos: typing.Optional[GridPos],
+        limit: typing.Union[int, str] = _TOP_N_COMMITS,
+        cursor_variable: typing.Optional[str] = None,
+        use_text_metrics: bool = False,
+) -> Table:
     """
     Presents a timeline overview of the comits
+
+    :param limit: maximum number of commits, either a number or an SQL expression of a dashboard variable
+    :param cursor_variable: name of a keyset_cursor_variable holding the "Cursor" column of the last commit
+        of the previous page, '<commit_time>,<commit_sha>'. Only the commits after it are shown.
+    :param use_text_metrics: read the stored title_length column, see generate_dashboards.schema.text_metrics
     """
+    description = ''
+    if isinstance(limit, int):
+        description = f'Showing the {limit} most recent commits, see the commit drilldown dashboard for all commits'
+
+    cursor_column, keyset_condition = '', ''
+    if cursor_variable:
+        # Commits sharing the time of the page boundary are told apart by their sha
+        cursor = sql_string(cursor_variable)
+        cursor_column = """CONCAT(commit_time, ',', commit_sha) AS "Cursor","""
+        keyset_condition = f"""AND (commit_time, commit_sha) < (
+        COALESCE(NULLIF(split_part({cursor}, ',', 1), '')::timestamp, 'infinity'),
+        split_part({cursor}, ',', 2)
+      )"""
+
     query = f'''
     SELECT
       commit_time AS time,
       project_path as "Project",
       title->>'raw'::varchar as "Title",
-      title->>'length' as "Title length",
+      {'title_length' if use_text_metrics else "(title->>'length')::integer"} as "Title length",
       size,
+      {cursor_column}
       gitlab_issues_referenced as "Issues referenced"
     FROM
       commitaggregate
     WHERE
       group_id='{gitlab_group_name}' AND $__timeFilter(commit_time)
-    ORDER BY time DESC
+      {keyset_condition}
+    ORDER BY time DESC, commit_sha DESC
+    LIMIT {limit}
     '''
 
     panel = Table(
         title='Commits',
-        description='',
+        description=description,
         gridPos=pos,
         transparent=True,
         targets=[
@@ -365,38 +475,20 @@ def commit_table(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> Table
 
 
 def get_commits_per_commit_type_barchart(gitlab_group_name: str, pos: typing.Optional[GridPos]):
-    COMMIT_PER_COMMIT_TYPE_SQL = f'''SELECT * FROM crosstab(
-            $$
-                SELECT author_email, type, count(DISTINCT commit_sha)
-                FROM changecontribution
-                WHERE group_id='{gitlab_group_name}' AND author_email IN (${'{filter_users}'})
-                GROUP BY author_email, type
-                ORDER BY author_email, type
-            $$,
-            $$
-                SELECT type
-                FROM (
-                    VALUES ('CONFIGURATION'),
-                    ('DOCUMENTATION'),
-                    ('FUNCTIONAL'),
-                    ('OTHER'),
-                    ('TEST')) T(type)
-            $$
-            )
-        AS final_result(
-            author_email varchar,
-            CONFIGURATION bigint,
-            DOCUMENTATION bigint,
-            FUNCTIONAL bigint,
-            OTHER bigint,
-            TEST bigint)'''
+    query = filter_pivot_query(
+        source='changecontribution',
+        row_key='author_email',
+        aggregate='COUNT(DISTINCT commit_sha)',
+        columns=[PivotColumn(name=change_type, condition=f"type = '{change_type}'") for change_type in CHANGE_TYPES],
+        where=f"group_id='{gitlab_group_name}' AND author_email IN (${'{filter_users}'})",
+    )
 
     return BarChart(
         title="Number of commits per contribution type",
         dataSource="default",
         targets=[
             SqlTarget(
-                rawSql=COMMIT_PER_COMMIT_TYPE_SQL,
+                rawSql=query,
                 refId="A",
                 format='table',
             ),
@@ -406,31 +498,58 @@ def get_commits_per_commit_type_barchart(gitlab_group_name: str, pos: typing.Opt
     )
 
 
-def accumulated_lines_contributed(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> TimeSeries:
+def accumulated_lines_contributed(
+        gitlab_group_name: str,
+        pos: typing.Optional[GridPos],
+        use_running_totals: bool = False,
+) -> TimeSeries:
+    """
+    Lines are accumulated from the start of the selected time range.
+
+    :param use_running_totals: sum the daily rows of the maintained accumulatedcontribution table instead of
+        changecontribution, see generate_dashboards.schema.running_totals. The time range then applies to whole days.
+    """
     label = 'Accumulated lines contributed'
+    if use_running_totals:
+        sql = f"""
+        SELECT
+          $__timeGroup(day, $__interval) AS "time",
+          author_email,
+          SUM(SUM(lines_changed)) OVER
+            (PARTITION BY author_email ORDER BY $__timeGroup(day, $__interval)) AS "{label}"
+        FROM {ACCUMULATED_CONTRIBUTION_TABLE}
+        WHERE $__timeFilter(day)
+            AND group_id='{gitlab_group_name}'
+            AND author_email IN (${'{filter_users}'})
+            AND type IN (${'{commit_types}'})
+        GROUP BY 1, 2
+        ORDER BY 1
+        """
+    else:
+        sql = f"""
+        SELECT
+          $__timeGroup("timestamp", $__interval) AS "time",
+          author_email,
+          SUM(SUM(lines_added - lines_removed)) OVER
+            (PARTITION BY author_email ORDER BY $__timeGroup("timestamp", $__interval)) AS "{label}"
+        FROM changecontribution
+        WHERE $__timeFilter("timestamp")
+            AND group_id='{gitlab_group_name}'
+            AND author_email IN (${'{filter_users}'})
+            AND type IN (${'{commit_types}'})
+        GROUP BY 1, 2
+        ORDER BY 1
+        """
+
     return TimeSeries(
         title="Accumulated lines contributed",
         dataSource="default",
         spanNulls=True,
         lineWidth=2,
-        targets=[
-            TimeSeriesSqlQuery(
-                sql=f"""
-                SELECT
-                  "timestamp" AS "time",
-                  author_email,
-                  SUM(lines_added - lines_removed) OVER
-                    (PARTITION BY author_email ORDER BY "timestamp") AS "{label}"
-                FROM changecontribution
-                WHERE $__timeFilter("timestamp")
-                    AND group_id='{gitlab_group_name}'
-                    AND author_email IN (${'{filter_users}'})
-                    AND type IN (${'{commit_types}'})
-                ORDER BY 1
-                """
-            )
-        ],
+        targets=[TimeSeriesSqlQuery(sql=sql)],
         gridPos=pos,
+        interval=_MIN_INTERVAL_DAY,
+        maxDataPoints=_TIME_SERIES_MAX_DATA_POINTS,
         editable=True,
         # We don't want to include the static label for each value
         # (more interested in author_email)
@@ -438,8 +557,47 @@ def accumulated_lines_contributed(gitlab_group_name: str, pos: typing.Optional[G
     )
 
 
-def get_accumulated_group_commits_time_series(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> TimeSeries:
+def get_accumulated_group_commits_time_series(
+        gitlab_group_name: str,
+        pos: typing.Optional[GridPos],
+        use_running_totals: bool = False,
+) -> TimeSeries:
+    """
+    Commits with any of the selected change types, accumulated from the start of the selected time range.
+
+    :param use_running_totals: sum the daily commit counts maintained in accumulatedcontribution_commits instead of
+        counting distinct commits in changecontribution, see generate_dashboards.schema.running_totals.
+        The time range then applies to whole days.
+    """
     label = 'Commit count'
+    if use_running_totals:
+        sql = f"""
+        SELECT
+            $__timeGroup(day, $__interval) AS "time",
+            SUM(SUM(commits)) OVER (ORDER BY $__timeGroup(day, $__interval)) AS "{label}"
+        FROM {COMMIT_COUNT_TABLE}
+        WHERE $__timeFilter(day)
+            AND group_id='{gitlab_group_name}'
+            AND types && ARRAY[${'{commit_types}'}]::varchar[]
+        GROUP BY 1
+        ORDER BY 1
+        """
+    else:
+        sql = f"""
+        SELECT
+            $__timeGroup("time", $__interval) AS "time",
+            SUM(COUNT(commit_sha)) OVER (ORDER BY $__timeGroup("time", $__interval)) AS "{label}"
+        FROM (
+            SELECT
+                DISTINCT commit_sha,
+                "timestamp" AS "time"
+            FROM changecontribution
+            WHERE $__timeFilter("timestamp") AND group_id='{gitlab_group_name}' AND type IN (${'{commit_types}'})
+        ) AS distinct_commits
+        GROUP BY 1
+        ORDER BY 1
+        """
+
     return TimeSeries(
         title="Total Commits accumulated",
         description='Total number of commits accumulated by the student group',
@@ -452,73 +610,37 @@ def get_accumulated_group_commits_time_series(gitlab_group_name: str, pos: typin
             ]),
         ],
         transformations=[rename_by_regex(label, '')],
-        targets=[
-            TimeSeriesSqlQuery(
-                sql=sql_query(f"""
-                SELECT
-                    "time",
-                    SUM(COUNT(commit_sha)) OVER (ORDER BY "time") AS "{label}"
-                FROM (
-                    SELECT
-                        DISTINCT commit_sha,
-                        "timestamp" AS "time"
-                    FROM changecontribution
-                    WHERE group_id='{gitlab_group_name}' AND type IN (${'{commit_types}'})
-                ) AS distinct_commits
-                GROUP BY "time"
-                """)
-            )
-        ],
+        targets=[TimeSeriesSqlQuery(sql=sql)],
         gridPos=pos,
+        interval=_MIN_INTERVAL_DAY,
+        maxDataPoints=_TIME_SERIES_MAX_DATA_POINTS,
         editable=True
     )
 
 
 def get_commit_size_bar_chart(gitlab_group_name: str, pos: typing.Optional[GridPos]) -> BarChart:
+    # Lines added are summed per commit before the commit is placed in a size bucket
+    commit_sizes = f"""(
+        SELECT author_email, SUM(lines_added) AS total_lines_added
+        FROM changecontribution
+        WHERE
+            group_id='{gitlab_group_name}' AND
+            author_email IN (${'{filter_users}'}) AND
+            type IN (${'{commit_types}'})
+        GROUP BY commit_sha, author_email
+    ) AS commit_sizes"""
+
     return BarChart(
         title="Number of commits per commit size",
         dataSource="default",
         targets=[
             TableSqlQuery(
-                sql=f"""
-               SELECT * FROM crosstab(
-    $$
-        SELECT
-            author_email,
-            bucket,
-            COUNT(bucket)
-        FROM(
-            SELECT
-                author_email,
-                (CASE
-                    WHEN total_lines_added <= 50 THEN 'S'
-                    WHEN total_lines_added <= 100 THEN 'M'
-                    ELSE 'L'
-                END) as bucket
-                FROM (
-                    SELECT author_email, SUM(lines_added) AS total_lines_added
-                    FROM changecontribution
-                    WHERE
-                        group_id='{gitlab_group_name}' AND
-                        author_email IN (${'{filter_users}'}) AND
-                        type IN (${'{commit_types}'})
-                    GROUP BY commit_sha,author_email
-                    )AS distinct_commits
-                ) AS buckets_per_commit
-        GROUP BY author_email, bucket
-        ORDER BY author_email, bucket
-    $$,
-    $$
-        SELECT bucket
-        FROM (VALUES ('S'), ('M'), ('L')) T(bucket)
-    $$
-
-    ) AS final_result(
-        author_email varchar,
-        "S (< 50)" bigint,
-        "M (50-99)" bigint,
-        "L (100<)" bigint
-    )""",
+                sql=filter_pivot_query(
+                    source=commit_sizes,
+                    row_key='author_email',
+                    columns=[PivotColumn(name=name, condition=condition)
+                             for name, condition in COMMIT_SIZE_BUCKETS.items()],
+                ),
             ),
         ],
         gridPos=pos,
@@ -526,54 +648,129 @@ def get_commit_size_bar_chart(gitlab_group_name: str, pos: typing.Optional[GridP
     )
 
 
-def group_overview(gitlab_group_name) -> Dashboard:
-    panels = [
-        RowPanel(title="Red flags", gridPos=GridPos(y=0, x=0, h=1, w=24)),
-        long_commit_titles(gitlab_group_name, pos=GridPos(y=0, x=0, h=4, w=4)),
-        large_commits(gitlab_group_name, pos=GridPos(y=0, x=4, h=4, w=4)),
-        _duplicated_commit_titles(gitlab_group_name, pos=GridPos(y=4, x=0, w=8, h=6)),
-
-        issues_without_description(gitlab_group_name, pos=GridPos(y=0, x=12, h=4, w=4)),
-        issues_with_short_titles(gitlab_group_name, pos=GridPos(y=0, x=16, h=4, w=4)),
-
-        _changes_by_type(gitlab_group_name, pos=GridPos(y=0, x=12, w=10, h=8)),
-
-        commit_table(gitlab_group_name, pos=GridPos(y=14, x=12, h=14, w=12)),
-
-        RowPanel(title="Summary", gridPos=GridPos(y=20, x=0, h=1, w=24)),
-        get_commits_per_commit_type_barchart(gitlab_group_name, pos=GridPos(y=1, x=0, h=8, w=24)),
-        accumulated_lines_contributed(gitlab_group_name, pos=GridPos(y=8, x=0, h=8, w=12)),
-        get_accumulated_group_commits_time_series(gitlab_group_name, pos=GridPos(y=8, x=12, h=8, w=12)),
-        get_commit_size_bar_chart(gitlab_group_name, pos=GridPos(y=16, x=0, h=8, w=24)),
-    ]
-
-    for index, panel in enumerate(panels):
-        panels[index].id = index
+def user_filter_variables(gitlab_group_name: str, use_author_aliases: bool = False) -> typing.List[dict]:
+    """
+    Variables behind ${filter_users}, which always expands to the selected author emails.
+    With author aliases the user picks canonical usernames, and a hidden variable joins them
+    back to every author email of that user, so the panel queries stay unchanged.
+    Emails without an alias yet, e.g. committed since the last sync, are listed by themselves.
+    """
+    if not use_author_aliases:
+        return [{
+            "multi": True,
+            "includeAll": True,
+            "name": "filter_users",
+            "label": "Filter users",
+            "description": "Choose which users to be included in the dashboard",
+            "query": sql_query(f"""
+                    SELECT DISTINCT author_email
+                    FROM changecontribution
+                    WHERE group_id='{gitlab_group_name}'
+                    """),
+            "type": "query"
+        }]
+
+    # Every author email of the group, with its canonical username if it has one
+    authors = f"""
+            (SELECT DISTINCT author_email FROM changecontribution WHERE group_id='{gitlab_group_name}') AS contribution
+            LEFT JOIN {AUTHOR_ALIAS_TABLE} AS alias
+                ON alias.group_id='{gitlab_group_name}' AND alias.author_email = contribution.author_email
+            """
+    return [{
+        "multi": True,
+        "includeAll": True,
+        "name": "filter_authors",
+        "label": "Filter users",
+        "description": "Choose which users to be included in the dashboard",
+        "query": sql_query(f"""
+                SELECT DISTINCT COALESCE(alias.username, contribution.author_email)
+                FROM {authors}
+                """),
+        "type": "query"
+    }, {
+        "multi": True,
+        "includeAll": True,
+        "current": {"text": "All", "value": "$__all"},
+        # Hidden, follows the selection in filter_authors
+        "hide": 2,
+        "refresh": 1,
+        "name": "filter_users",
+        "query": sql_query(f"""
+                SELECT contribution.author_email
+                FROM {authors}
+                WHERE COALESCE(alias.username, contribution.author_email) IN (${'{filter_authors}'})
+                """),
+        "type": "query"
+    }]
+
+
+def group_overview(
+        gitlab_group_name,
+        use_running_totals: bool = False,
+        use_milestone_table: bool = False,
+        activity_range: typing.Optional[typing.Tuple[datetime, datetime]] = None,
+        use_author_aliases: bool = False,
+        uid: typing.Optional[str] = None,
+        use_text_metrics: bool = False,
+) -> Dashboard:
+    """
+    :param use_running_totals: let the accumulated panels read the maintained accumulatedcontribution table,
+        see generate_dashboards.schema.running_totals
+    :param use_milestone_table: read milestone annotations from the precomputed milestone table,
+        see generate_dashboards.schema.milestones
+    :param activity_range: first and last activity of the group, used as the default time range.
+        See manage_users.db_connector.get_group_activity_range
+    :param use_author_aliases: let users pick canonical GitLab usernames instead of raw author emails,
+        see manage_users.aliases
+    :param uid: see manage_users.uids, Grafana generates a random uid if None
+    :param use_text_metrics: let the red flag and commit panels read the stored title and description columns,
+        see generate_dashboards.schema.text_metrics
+    """
+    # Only the cheap stat panels are expanded, every other row is queried once the user expands it
+    panels = layout([
+        LayoutRow(title="Red flags", panels=[
+            SizedPanel(long_commit_titles(gitlab_group_name, pos=None, use_text_metrics=use_text_metrics), _STAT_SIZE),
+            SizedPanel(large_commits(gitlab_group_name, pos=None), _STAT_SIZE),
+            SizedPanel(issues_without_description(gitlab_group_name, pos=None, use_text_metrics=use_text_metrics),
+                       _STAT_SIZE),
+            SizedPanel(issues_with_short_titles(gitlab_group_name, pos=None, use_text_metrics=use_text_metrics),
+                       _STAT_SIZE),
+        ]),
+        LayoutRow(title="Activity", collapsed=True, panels=[
+            SizedPanel(_changes_by_type(gitlab_group_name, pos=None), PanelSize(w=12, h=8)),
+            SizedPanel(_duplicated_commit_titles(gitlab_group_name, pos=None, use_text_metrics=use_text_metrics),
+                       PanelSize(w=12, h=8)),
+            SizedPanel(commit_table(gitlab_group_name, pos=None, use_text_metrics=use_text_metrics),
+                       PanelSize(w=24, h=14)),
+        ]),
+        LayoutRow(title="Summary", collapsed=True, panels=[
+            SizedPanel(get_commits_per_commit_type_barchart(gitlab_group_name, pos=None), PanelSize(w=24, h=8)),
+            SizedPanel(accumulated_lines_contributed(gitlab_group_name, pos=None,
+                                                     use_running_totals=use_running_totals), PanelSize(w=12, h=8)),
+            SizedPanel(get_accumulated_group_commits_time_series(gitlab_group_name, pos=None,
+                                                                 use_running_totals=use_running_totals),
+                       PanelSize(w=12, h=8)),
+            SizedPanel(get_commit_size_bar_chart(gitlab_group_name, pos=None), PanelSize(w=24, h=8)),
+        ]),
+    ])
 
     dashboard = Dashboard(
         title=f"Overview",
+        uid=uid,
         version=1000,
         panels=panels,
         editable=True,
         schemaVersion=32,
-        time=Time(start="now-5y", end="now"),
+        tags=[gitlab_group_name, 'overview'],
+        links=[dashboards_link_by_tags('Commit drilldown', tags=[gitlab_group_name, 'drilldown'])],
+        time=time_range_from_activity(activity_range),
         annotations=Annotations(
-            list=[annotate_with_milestones(gitlab_group_name, color='super-light-purple')],
+            list=[annotate_with_milestones(gitlab_group_name, color='super-light-purple',
+                                           use_milestone_table=use_milestone_table)],
         ),
-        templating=Templating(
-            list=[{
-                "multi": True,
-                "includeAll": True,
-                "name": "filter_users",
-                "label": "Filter users",
-                "description": "Choose which users to be included in the dashboard",
-                "query": sql_query(f"""
-                        SELECT DISTINCT author_email
-                        FROM changecontribution
-                        WHERE group_id='{gitlab_group_name}'
-                        """),
-                "type": "query"
-            }, {
+        templating=Templating(list=[
+            *user_filter_variables(gitlab_group_name, use_author_aliases=use_author_aliases),
+            {
                 "multi": True,
                 "includeAll": True,
                 "name": "commit_types",
@@ -586,11 +783,57 @@ def group_overview(gitlab_group_name) -> Dashboard:
                         """.strip(),
                 "type": "query"
             }
-            ])
+        ])
     )
 
     return dashboard
 
+
+def commit_drilldown(
+        gitlab_group_name: str,
+        activity_range: typing.Optional[typing.Tuple[datetime, datetime]] = None,
+        uid: typing.Optional[str] = None,
+        use_text_metrics: bool = False,
+) -> Dashboard:
+    """
+    Every commit and duplicated title of the group, paged on the server through dashboard variables.
+    Linked from the overview, which only shows the top rows.
+
+    :param uid: see manage_users.uids, Grafana generates a random uid if None
+    :param use_text_metrics: see group_overview
+    """
+    panels = [
+        commit_table(gitlab_group_name, pos=GridPos(y=0, x=0, h=20, w=16),
+                     limit=_DRILLDOWN_LIMIT, cursor_variable='commits_before', use_text_metrics=use_text_metrics),
+        _duplicated_commit_titles(gitlab_group_name, pos=GridPos(y=0, x=16, h=20, w=8), limit=_DRILLDOWN_LIMIT,
+                                  use_text_metrics=use_text_metrics, page_variable='titles_page'),
+    ]
+
+    for index, panel in enumerate(panels):
+        panels[index].id = index
+
+    return Dashboard(
+        title="Commit drilldown",
+        uid=uid,
+        version=1000,
+        panels=panels,
+        editable=True,
+        schemaVersion=32,
+        tags=[gitlab_group_name, 'drilldown'],
+        links=[dashboards_link_by_tags('Overview', tags=[gitlab_group_name, 'overview'])],
+        time=time_range_from_activity(activity_range),
+        templating=Templating(
+            list=[
+                page_size_variable('page_size', sizes=_DRILLDOWN_PAGE_SIZES, default=_DRILLDOWN_PAGE_SIZES[1]),
+                keyset_cursor_variable(
+                    'commits_before',
+                    label='Commits before',
+                    description='Cursor of the last commit on the current page, leave empty for the newest commits',
+                ),
+                page_number_variable('titles_page', label='Duplicate titles page'),
+            ]),
+    )
+
 # Time Taken on issue
 #     {
 #       "datasource": null,
@@ -664,7 +907,7 @@ def group_overview(gitlab_group_name) -> Dashboard:
 #           "group": [],
 #           "metricColumn": "none",
 #           "rawQuery": true,
-#           "rawSql": "SELECT\n  $__timeGroup(created_at, '1d') as \"time\",\n  CONCAT('#', issue_iid, ' ', title->>'raw') as \"Issue\",\n  now() as \"closed_at\",\n  case\n    -- 14 days in seconds\n    when issue_iid < 12 then 1209600\n    else EXTRACT(EPOCH FROM (now() - created_at))\n  end as \"value\"\nFROM\n  issueaggregate\nWHERE\n  $__timeFilter(created_at)\n",
+#           "rawSql": "SELECT\n  $__timeGroup(created_at, $__interval) as \"time\",\n  CONCAT('#', issue_iid, ' ', title->>'raw') as \"Issue\",\n  now() as \"closed_at\",\n  case\n    -- 14 days in seconds\n    when issue_iid < 12 then 1209600\n    else EXTRACT(EPOCH FROM (now() - created_at))\n  end as \"value\"\nFROM\n  issueaggregate\nWHERE\n  $__timeFilter(created_at)\n",
 #           "refId": "A",
 #           "select": [
 #             [
@@ -0,0 +1,87 @@
+import dataclasses
+from typing import List
+
+from grafanalib.core import GridPos, Panel, RowPanel
+
+"""
+Packs panels into Grafana's 24 column grid from size hints, so dashboards never hand-assign
+(and accidentally overlap) GridPos values.
+
+Rows can be collapsed. Grafana does not query the panels of a collapsed row before it is expanded,
+which keeps expensive panels out of the initial dashboard load.
+"""
+
+GRID_WIDTH = 24
+ROW_HEIGHT = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class PanelSize:
+    w: int
+    h: int
+
+
+@dataclasses.dataclass(frozen=True)
+class SizedPanel:
+    panel: Panel
+    size: PanelSize
+
+
+@dataclasses.dataclass(frozen=True)
+class LayoutRow:
+    title: str
+    panels: List[SizedPanel]
+    collapsed: bool = False
+
+
+def pack_panels(panels: List[SizedPanel], y: int) -> int:
+    """
+    Assigns a gridPos to every panel, in order, starting at row y.
+    Each panel is placed as high up as possible, then as far left as possible.
+
+    :return: the first free y below the packed panels
+    """
+    column_heights = [y] * GRID_WIDTH
+    for sized in panels:
+        width = min(sized.size.w, GRID_WIDTH)
+        top, x = min(
+            (max(column_heights[x:x + width]), x)
+            for x in range(GRID_WIDTH - width + 1)
+        )
+        sized.panel.gridPos = GridPos(x=x, y=top, w=width, h=sized.size.h)
+        column_heights[x:x + width] = [top + sized.size.h] * width
+    return max(column_heights)
+
+
+def layout(rows: List[LayoutRow]) -> List[Panel]:
+    """
+    Lays out the rows below each other and assigns unique panel ids.
+    Panels of collapsed rows are nested in their RowPanel, as expected by Grafana.
+
+    :return: the top level panels of a dashboard
+    """
+    dashboard_panels = []
+    y = 0
+    for row in rows:
+        row_panel = RowPanel(
+            title=row.title,
+            collapsed=row.collapsed,
+            gridPos=GridPos(x=0, y=y, w=GRID_WIDTH, h=ROW_HEIGHT),
+        )
+        y += ROW_HEIGHT
+        bottom = pack_panels(row.panels, y)
+
+        dashboard_panels.append(row_panel)
+        if row.collapsed:
+            row_panel.panels = [sized.panel for sized in row.panels]
+        else:
+            dashboard_panels.extend(sized.panel for sized in row.panels)
+            y = bottom
+
+    panel_id = 0
+    for panel in dashboard_panels:
+        for nested in [panel, *getattr(panel, 'panels', [])]:
+            nested.id = panel_id
+            panel_id += 1
+
+    return dashboard_panels
@@ -1,7 +1,11 @@
 import dataclasses
-from typing import List, Union
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, Union
 
-from grafanalib.core import SqlTarget, TABLE_TARGET_FORMAT, TIME_SERIES_TARGET_FORMAT
+from grafanalib.core import SqlTarget, TABLE_TARGET_FORMAT, TIME_SERIES_TARGET_FORMAT, Time
+
+from generate_dashboards.schema.tables import MILESTONE_TABLE
 
 
 def sql_query(raw_str: str) -> dict:
@@ -22,6 +26,71 @@ class TableSqlQuery(SqlTarget):
         self.format = TABLE_TARGET_FORMAT
 
 
+@dataclasses.dataclass(frozen=True)
+class PivotColumn:
+    name: str
+    condition: str
+
+
+def filter_pivot_query(
+        source: str,
+        row_key: str,
+        columns: List[PivotColumn],
+        aggregate: str = 'COUNT(*)',
+        where: Optional[str] = None,
+) -> str:
+    """
+    Builds a pivot table which scans `source` only once.
+    Each column is computed as `aggregate FILTER (WHERE condition)`, which replaces
+    crosstab() from the tablefunc extension and its separate category query.
+    Categories without any rows are reported as 0 instead of NULL.
+
+    :param source: table or aliased subquery to read from
+    :param row_key: column identifying each row in the pivot table, e.g. author_email
+    :param columns: one output column per category
+    :param aggregate: aggregate applied to each category
+    :param where: optional condition applied to all rows before pivoting
+    :return: raw SQL string
+    """
+    pivot_columns = ',\n'.join(
+        f'  {aggregate} FILTER (WHERE {column.condition}) AS "{column.name}"'
+        for column in columns
+    )
+
+    lines = ['SELECT', f'  {row_key},', pivot_columns, f'FROM {source}']
+    if where:
+        lines.append(f'WHERE {where}')
+    lines += [f'GROUP BY {row_key}', f'ORDER BY {row_key}']
+    return sql_query('\n'.join(lines))
+
+
+# Used when a group has no recorded activity yet
+DEFAULT_TIME_RANGE = Time(start='now-6M', end='now')
+# Margin added around the activity of a group in its default time range
+_ACTIVITY_PADDING = timedelta(days=1)
+
+
+def time_range_from_activity(activity_range: Optional[Tuple[datetime, datetime]]) -> Time:
+    """
+    Default dashboard time range spanning the first and last activity of a group.
+    Groups that are still active keep 'now' as the end of the range.
+
+    :param activity_range: (first, last) activity, or None if unknown
+    """
+    if activity_range is None or None in activity_range:
+        return DEFAULT_TIME_RANGE
+
+    first, last = (
+        moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+        for moment in activity_range
+    )
+    start = (first - _ACTIVITY_PADDING).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    if last + _ACTIVITY_PADDING >= datetime.now(timezone.utc):
+        return Time(start=start, end='now')
+    end = (last + _ACTIVITY_PADDING).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    return Time(start=start, end=end)
+
+
 def rename_by_regex(regex: str, rename: str) -> dict:
     return {
         'id': 'renameByRegex',
@@ -41,24 +110,112 @@ def sql_annotation(name: str, raw_query: str, color: str = 'purple') -> dict:
     }
 
 
-def annotate_with_milestones(group_id: str, color: str) -> dict:
-    return sql_annotation(
-        name='Milestones',
-        color=color,
-        raw_query=f'''
+def annotate_with_milestones(group_id: str, color: str, use_milestone_table: bool = False) -> dict:
+    """
+    Annotates the issues overlapping the visible time range.
+    Open issues last until the end of the visible time range.
+
+    :param use_milestone_table: read the precomputed milestone table instead of issueaggregate,
+        see generate_dashboards.schema.milestones
+    """
+    if use_milestone_table:
+        raw_query = f'''
+        select
+            $__timeEpoch(created_at),
+            COALESCE(extract(epoch from closed_at), $__unixEpochTo()) AS "timeend",
+            text,
+            tags
+        from {MILESTONE_TABLE}
+        WHERE group_id = '{group_id}'
+            AND created_at <= $__timeTo()
+            AND (closed_at IS NULL OR closed_at >= $__timeFrom())
+        '''
+    else:
+        raw_query = f'''
         select
             $__timeEpoch(created_at),
             CASE
                 WHEN state = 'CLOSED' THEN extract(epoch from closed_at)
-                -- Open issues have no close date  
-                ELSE extract(epoch from now())
+                -- Open issues have no close date
+                ELSE $__unixEpochTo()
             END AS "timeend",
             title->>'raw' as "text",
             CONCAT('author:  ', author) AS "tags"
         from issueaggregate
         WHERE group_id = '{group_id}'
-        ''',
-    )
+            AND created_at <= $__timeTo()
+            AND (state <> 'CLOSED' OR closed_at >= $__timeFrom())
+        '''
+
+    return sql_annotation(name='Milestones', color=color, raw_query=raw_query)
+
+
+def page_size_variable(name: str, sizes: List[int], default: int) -> dict:
+    """
+    Dashboard variable selecting the LIMIT of paged table queries
+    """
+    return {
+        'name': name,
+        'label': 'Page size',
+        'description': 'Maximum number of rows fetched by each table',
+        'type': 'custom',
+        'query': ','.join(str(size) for size in sizes),
+        'current': {'text': str(default), 'value': str(default)},
+        'multi': False,
+        'includeAll': False,
+    }
+
+
+def sql_string(variable: str) -> str:
+    """
+    Reference to a dashboard variable which Grafana quotes as an SQL string literal, escaping quotes.
+    Free text variables must only be used this way, the user controls their value.
+    """
+    return f'${{{variable}:sqlstring}}'
+
+
+def keyset_cursor_variable(name: str, label: str, description: str) -> dict:
+    """
+    Free text dashboard variable holding the last key of the previous page. Empty for the first page.
+    Use through sql_string.
+    """
+    return {
+        'name': name,
+        'label': label,
+        'description': description,
+        'type': 'textbox',
+        'query': '',
+        'current': {'text': '', 'value': ''},
+    }
+
+
+def page_number_variable(name: str, label: str) -> dict:
+    """
+    Free text dashboard variable holding a page number, starting at 1. Use through sql_string.
+    """
+    return {
+        'name': name,
+        'label': label,
+        'description': 'Page of the table, starting at 1',
+        'type': 'textbox',
+        'query': '1',
+        'current': {'text': '1', 'value': '1'},
+    }
+
+
+def dashboards_link_by_tags(title: str, tags: List[str]) -> dict:
+    """
+    Dashboard link to every dashboard having all of the given tags
+    """
+    return {
+        'title': title,
+        'type': 'dashboards',
+        'tags': tags,
+        'asDropdown': False,
+        'keepTime': True,
+        'includeVars': True,
+        'targetBlank': False,
+    }
 
 
 @dataclasses.dataclass(frozen=True)
@@ -81,3 +238,86 @@ def override_by_name(name: str, properties: List[OverrideProperty]) -> dict:
             for prop in properties
         ]
     }
+
+
+_DURATION = re.compile(r'^(\d+)(ms|s|m|h|d|w|M|y)$')
+_DURATION_SECONDS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800,
+                     'M': 30 * 86400, 'y': 365 * 86400}
+_RELATIVE_TIME = re.compile(r'^now(?:-(\d+[smhdwMy]))?$')
+_VARIABLE = re.compile(r'\$\{(\w+)(?::(\w+))?}|\$(\w+)|\[\[(\w+)]]')
+_MACRO = re.compile(r'\$__(\w+)\(([^)]*)\)')
+
+
+def duration_seconds(duration: str) -> float:
+    """
+    Seconds of a Grafana duration such as '1d' or '30s', months and years are 30 and 365 days
+    """
+    match = _DURATION.match(duration.strip().strip("'"))
+    if not match:
+        raise ValueError(f"Invalid duration {duration}")
+    return int(match.group(1)) * _DURATION_SECONDS[match.group(2)]
+
+
+def resolve_time(value: str, now: datetime) -> datetime:
+    """
+    Moment of a dashboard time range boundary, either relative like 'now-6M' or an ISO 8601 timestamp
+    """
+    relative = _RELATIVE_TIME.match(value)
+    if relative:
+        return now - timedelta(seconds=duration_seconds(relative.group(1))) if relative.group(1) else now
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _sql_value(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def expand_variables(sql: str, variables: Dict[str, Union[str, List[str]]]) -> str:
+    """
+    Interpolates dashboard variables like Grafana does for SQL datasources.
+    Multi value variables become a list of quoted values, an empty selection becomes NULL.
+    The sqlstring format quotes single values as well. Unknown variables and macros are left as they are.
+
+    :param variables: selected value per variable name, built-ins like __interval included
+    """
+    def replace(match: re.Match) -> str:
+        name = match.group(1) or match.group(3) or match.group(4)
+        if name not in variables:
+            return match.group(0)
+        value = variables[name]
+        if isinstance(value, str):
+            return _sql_value(value) if match.group(2) == 'sqlstring' else value
+        return ','.join(_sql_value(item) for item in value) if value else 'NULL'
+    return _VARIABLE.sub(replace, sql)
+
+
+def _time_group(args: List[str]) -> str:
+    seconds = duration_seconds(args[1])
+    return f'floor(extract(epoch from {args[0]})/{seconds:g})*{seconds:g}'
+
+
+def expand_macros(sql: str, time_from: datetime, time_to: datetime) -> str:
+    """
+    Expands the Postgres macros of Grafana, as the Postgres datasource does before running a query
+    """
+    start, end = (moment.astimezone(timezone.utc).strftime("'%Y-%m-%dT%H:%M:%SZ'") for moment in (time_from, time_to))
+    epoch_from, epoch_to = int(time_from.timestamp()), int(time_to.timestamp())
+    macros = {
+        'time': lambda args: f'{args[0]} AS "time"',
+        'timeEpoch': lambda args: f'extract(epoch from {args[0]}) AS "time"',
+        'timeFilter': lambda args: f'{args[0]} BETWEEN {start} AND {end}',
+        'timeFrom': lambda args: start,
+        'timeTo': lambda args: end,
+        'timeGroup': _time_group,
+        'timeGroupAlias': lambda args: f'{_time_group(args)} AS "time"',
+        'unixEpochFilter': lambda args: f'{args[0]} >= {epoch_from} AND {args[0]} <= {epoch_to}',
+        'unixEpochFrom': lambda args: str(epoch_from),
+        'unixEpochTo': lambda args: str(epoch_to),
+    }
+
+    def replace(match: re.Match) -> str:
+        if match.group(1) not in macros:
+            raise ValueError(f"Unsupported macro $__{match.group(1)}")
+        return macros[match.group(1)]([arg.strip() for arg in match.group(2).split(',')])
+    return _MACRO.sub(replace, sql)
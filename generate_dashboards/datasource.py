@@ -0,0 +1,141 @@
+import dataclasses
+import json
+import math
+from typing import Dict, List, Optional
+
+from grafana_api.grafana_face import GrafanaFace
+
+from manage_users.api.grafana import upsert_datasource
+from manage_users.config import Config
+
+"""
+Definitions of the Postgres datasources queried by the dashboards, upserted through the API
+or written as a provisioning file for /etc/grafana/provisioning/datasources.
+
+The connection pool of a datasource is shared by every viewer of every dashboard. Its size is derived from
+the number of viewers opening a dashboard at the same time, at the start of a lab, and the queries each
+dashboard runs when it loads.
+
+With a read replica, the "default" datasource used by every panel points at the replica, and the primary is
+only reachable through a small separate pool, so dashboard load can't exhaust the connections of the primary.
+"""
+
+# Datasource of every panel and query variable
+DASHBOARD_DATASOURCE = 'default'
+# Datasource of the primary when the dashboards are served by a replica
+PRIMARY_DATASOURCE = 'analytics-primary'
+
+# Requests a browser runs at once against Grafana, the other panel queries of a dashboard wait for them
+BROWSER_CONCURRENCY = 6
+# Grafana's own default, connections are recycled after 4 hours
+CONN_MAX_LIFETIME_S = 14400
+# Grafana only distinguishes versions up to 12+
+POSTGRES_VERSION = 1200
+
+
+@dataclasses.dataclass(frozen=True)
+class PoolSizing:
+    max_open_conns: int
+    max_idle_conns: int
+    conn_max_lifetime_s: int = CONN_MAX_LIFETIME_S
+
+
+# Ad hoc queries against the primary
+PRIMARY_POOL = PoolSizing(max_open_conns=2, max_idle_conns=1)
+
+
+def queries_on_load(dashboard: Dict) -> int:
+    """
+    Queries a dashboard runs when it is opened, from its JSON model.
+    Panels of collapsed rows are nested in the row and only queried once it is expanded.
+    Enabled SQL annotations are queried along with the panels, see benchmarks.dashboard_load.
+    """
+    panel_queries = sum(len(panel.get('targets', [])) for panel in dashboard.get('panels', []))
+    variable_queries = sum(1 for variable in dashboard.get('templating', {}).get('list', [])
+                           if variable.get('type') == 'query')
+    annotation_queries = sum(1 for annotation in dashboard.get('annotations', {}).get('list', [])
+                             if annotation.get('enable') and annotation.get('rawQuery'))
+    return panel_queries + variable_queries + annotation_queries
+
+
+def pool_sizing(concurrent_viewers: int, queries_per_load: int, connection_budget: Optional[int] = None,
+                grafana_instances: int = 1, browser_concurrency: int = BROWSER_CONCURRENCY) -> PoolSizing:
+    """
+    :param concurrent_viewers: viewers opening a dashboard at the same time
+    :param queries_per_load: see queries_on_load
+    :param connection_budget: Postgres connections which may be used by all Grafana instances together
+    :param grafana_instances: Grafana servers sharing the database, each has its own pool
+    """
+    peak = math.ceil(concurrent_viewers * min(queries_per_load, browser_concurrency) / grafana_instances)
+    if connection_budget is not None:
+        peak = min(peak, connection_budget // grafana_instances)
+    max_open_conns = max(peak, 2)
+    # Idle connections absorb the refreshes following a burst without reconnecting
+    return PoolSizing(max_open_conns=max_open_conns, max_idle_conns=math.ceil(max_open_conns / 2))
+
+
+def postgres_datasource(name: str, host: str, database: str, user: str, password: str, sizing: PoolSizing,
+                        is_default: bool = False, sslmode: str = 'disable') -> Dict:
+    return {
+        'name': name,
+        'type': 'postgres',
+        'access': 'proxy',
+        'url': host,
+        'database': database,
+        'user': user,
+        'isDefault': is_default,
+        'jsonData': {
+            'sslmode': sslmode,
+            'postgresVersion': POSTGRES_VERSION,
+            'maxOpenConns': sizing.max_open_conns,
+            'maxIdleConns': sizing.max_idle_conns,
+            'connMaxLifetime': sizing.conn_max_lifetime_s,
+        },
+        'secureJsonData': {'password': password},
+    }
+
+
+def analytics_datasources(config: Config, sizing: PoolSizing, password: Optional[str] = None) -> List[Dict]:
+    """
+    :param password: defaults to the database password of the config
+    """
+    password = config.db_password if password is None else password
+    if not config.db_replica_host:
+        return [postgres_datasource(DASHBOARD_DATASOURCE, config.db_host, config.db_name, config.db_user, password,
+                                    sizing, is_default=True)]
+    return [
+        postgres_datasource(DASHBOARD_DATASOURCE, config.db_replica_host, config.db_name, config.db_user, password,
+                            sizing, is_default=True),
+        postgres_datasource(PRIMARY_DATASOURCE, config.db_host, config.db_name, config.db_user, password,
+                            PRIMARY_POOL),
+    ]
+
+
+def statement_timeout_sql(user: str, statement_timeout_ms: int) -> str:
+    """
+    Grafana has no query timeout for Postgres datasources, the timeout is set on the role instead
+    """
+    return f'ALTER ROLE "{user}" SET statement_timeout = {int(statement_timeout_ms)};'
+
+
+def provisioning_yaml(datasources: List[Dict]) -> str:
+    """
+    Provisioning file of the datasources, secrets are read by Grafana from $DB_PASSWORD.
+    Written as JSON, which is valid YAML, if PyYAML is not installed.
+    """
+    document = {
+        'apiVersion': 1,
+        'datasources': [
+            {**datasource, 'orgId': 1, 'editable': False, 'secureJsonData': {'password': '$DB_PASSWORD'}}
+            for datasource in datasources
+        ],
+    }
+    try:
+        import yaml
+    except ImportError:
+        return json.dumps(document, indent=2) + '\n'
+    return yaml.safe_dump(document, sort_keys=False)
+
+
+def provision_datasources(grafana_api: GrafanaFace, datasources: List[Dict]) -> List[Dict]:
+    return [upsert_datasource(grafana_api, datasource) for datasource in datasources]
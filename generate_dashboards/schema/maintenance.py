@@ -0,0 +1,113 @@
+import dataclasses
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from psycopg2.extensions import connection
+
+from generate_dashboards.schema.milestones import create_milestone_index, create_milestone_table, refresh_milestones
+from generate_dashboards.schema.partitions import PARTITIONED_TABLES, create_future_partitions, \
+    detach_partitions_before, get_partitions, partition_granularity
+from generate_dashboards.schema.running_totals import create_accumulated_contribution_table, \
+    refresh_stale_accumulated_contributions
+from generate_dashboards.schema.tables import ACCUMULATED_CONTRIBUTION_TABLE, COMMIT_COUNT_TABLE, MILESTONE_TABLE
+from generate_dashboards.schema.text_metrics import TEXT_METRIC_COLUMNS, create_text_metric_columns
+from manage_users.tables import AUTHOR_ALIAS_TABLE
+from manage_users.db_connector import query_db_conn
+
+"""
+Applies the optional tables and columns behind the dashboards, keeps the precomputed tables fresh
+and tells the dashboard generation which of them exist.
+
+    python cli.py migrate    # once, creates and fills the tables
+    python cli.py refresh    # after each ingestion, e.g. from cron
+    python cli.py partitions --detach-before 2021-01-01    # archives old semesters of partitioned tables
+
+Dashboards only read a precomputed table once detect_schema finds it, so regenerating dashboards
+never breaks against a database that was not migrated.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class SchemaFeatures:
+    # accumulatedcontribution and its commit counts, see generate_dashboards.schema.running_totals
+    running_totals: bool = False
+    # Generated title and description columns, see generate_dashboards.schema.text_metrics
+    text_metrics: bool = False
+    # issuemilestone, see generate_dashboards.schema.milestones
+    milestone_table: bool = False
+    # authoralias, filled by sync-users and provision, see manage_users.aliases
+    author_aliases: bool = False
+
+
+def _columns_exist(columns: Dict[str, List[str]]) -> str:
+    pairs = ', '.join(f"('{table}', '{column}')" for table, names in columns.items() for column in names)
+    return f'''(
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = current_schema() AND (table_name, column_name) IN ({pairs})
+    ) = {sum(len(names) for names in columns.values())}'''
+
+
+# SQL predicate telling whether each feature exists
+_FEATURE_PREDICATES = {
+    # The commit counts were added last
+    'running_totals': f"to_regclass('{COMMIT_COUNT_TABLE}') IS NOT NULL",
+    'text_metrics': _columns_exist(TEXT_METRIC_COLUMNS),
+    'milestone_table': f"to_regclass('{MILESTONE_TABLE}') IS NOT NULL",
+    'author_aliases': f"to_regclass('{AUTHOR_ALIAS_TABLE}') IS NOT NULL",
+}
+
+
+def detect_schema(conn: connection) -> SchemaFeatures:
+    predicates = ',\n'.join(_FEATURE_PREDICATES.values())
+    row = query_db_conn(conn, f'SELECT\n{predicates}', None)[0]
+    return SchemaFeatures(**dict(zip(_FEATURE_PREDICATES, row)))
+
+
+def migrate(conn: connection) -> SchemaFeatures:
+    """
+    Creates every optional table, column and index, then fills the precomputed tables
+    """
+    create_accumulated_contribution_table(conn)
+    create_text_metric_columns(conn)
+    create_milestone_index(conn)
+    create_milestone_table(conn)
+    refresh(conn)
+    return detect_schema(conn)
+
+
+def refresh(conn: connection, group_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Batch job bringing the precomputed tables up to date with the ingested data
+    :param group_ids: restrict the refresh to these groups
+    :return: number of refreshed groups or rows per table, and of created partitions per partitioned table
+    """
+    refreshed = {
+        ACCUMULATED_CONTRIBUTION_TABLE: len(refresh_stale_accumulated_contributions(conn, group_ids)),
+        MILESTONE_TABLE: refresh_milestones(conn, group_ids),
+    }
+    for table, created in maintain_partitions(conn).items():
+        refreshed[table] = len(created)
+    _LOG.info(f"Refreshed {refreshed}")
+    return refreshed
+
+
+def maintain_partitions(conn: connection, periods_ahead: int = 2, detach_before: Optional[datetime] = None,
+                        archive_schema: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Creates the coming partitions of every partitioned table, at the granularity of its latest partition,
+    so inserts never run out of partitions, and optionally detaches the partitions ending before detach_before.
+    Tables which are not partitioned are left alone, see generate_dashboards.schema.partitions.
+    :return: names of the created and detached partitions, keyed by "{table} partitions" and "{table} detached"
+    """
+    changed = {}
+    for table in PARTITIONED_TABLES:
+        granularity = partition_granularity(get_partitions(conn, table.name))
+        if granularity is None:
+            continue
+        changed[f'{table.name} partitions'] = create_future_partitions(conn, table, granularity, periods_ahead)
+        if detach_before is not None:
+            changed[f'{table.name} detached'] = detach_partitions_before(conn, table, detach_before, archive_schema)
+    return changed
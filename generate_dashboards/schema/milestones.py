@@ -0,0 +1,94 @@
+import logging
+from typing import List, Optional
+
+from psycopg2.extensions import connection
+
+from generate_dashboards.schema.tables import MILESTONE_TABLE
+from manage_users.db_connector import execute_db_conn
+
+"""
+Indexes and the optional precomputed table behind the milestone annotations.
+Created by `python cli.py migrate` and kept up to date by `python cli.py refresh`,
+see generate_dashboards.schema.maintenance.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+CREATE_MILESTONE_INDEX_SQL = '''
+CREATE INDEX IF NOT EXISTS issueaggregate_milestone_idx
+    ON issueaggregate (group_id, created_at, closed_at);
+'''
+
+CREATE_MILESTONE_TABLE_SQL = f'''
+CREATE TABLE IF NOT EXISTS {MILESTONE_TABLE} (
+    group_id varchar NOT NULL,
+    issue_iid integer NOT NULL,
+    created_at timestamp NOT NULL,
+    -- NULL while the issue is open
+    closed_at timestamp,
+    text varchar NOT NULL,
+    tags varchar NOT NULL,
+    PRIMARY KEY (group_id, issue_iid)
+);
+
+CREATE INDEX IF NOT EXISTS {MILESTONE_TABLE}_window_idx
+    ON {MILESTONE_TABLE} (group_id, created_at, closed_at)
+    INCLUDE (text, tags);
+'''
+
+_REFRESH_MILESTONES_SQL = f'''
+INSERT INTO {MILESTONE_TABLE} (group_id, issue_iid, created_at, closed_at, text, tags)
+SELECT
+    group_id,
+    issue_iid,
+    created_at,
+    CASE WHEN state = 'CLOSED' THEN closed_at END,
+    COALESCE(title->>'raw', ''),
+    CONCAT('author:  ', author)
+FROM issueaggregate
+{{where}}
+ON CONFLICT (group_id, issue_iid) DO UPDATE SET
+    created_at = EXCLUDED.created_at,
+    closed_at = EXCLUDED.closed_at,
+    text = EXCLUDED.text,
+    tags = EXCLUDED.tags
+'''
+
+
+# Issues which were deleted, or moved to another group or iid
+_DELETE_STALE_MILESTONES_SQL = f'''
+DELETE FROM {MILESTONE_TABLE} AS milestone
+WHERE NOT EXISTS (
+    SELECT 1 FROM issueaggregate AS issue
+    WHERE issue.group_id = milestone.group_id AND issue.issue_iid = milestone.issue_iid
+) {{and_where}}
+'''
+
+
+def create_milestone_index(conn: connection) -> None:
+    execute_db_conn(conn, CREATE_MILESTONE_INDEX_SQL)
+
+
+def create_milestone_table(conn: connection) -> None:
+    execute_db_conn(conn, CREATE_MILESTONE_TABLE_SQL)
+
+
+def refresh_milestones(conn: connection, group_ids: Optional[List[str]] = None) -> int:
+    """
+    Upserts the milestones of the given groups, or of every group, from issueaggregate
+    and deletes those whose issue is gone, in a single transaction
+    :return: number of milestones written
+    """
+    params = None
+    where, and_where = '', ''
+    if group_ids is not None:
+        params = {'group_ids': group_ids}
+        where, and_where = 'WHERE group_id = ANY(%(group_ids)s)', 'AND milestone.group_id = ANY(%(group_ids)s)'
+    with conn:
+        with conn.cursor() as curs:
+            curs.execute(_DELETE_STALE_MILESTONES_SQL.format(and_where=and_where), params)
+            deleted = curs.rowcount
+            curs.execute(_REFRESH_MILESTONES_SQL.format(where=where), params)
+            row_count = curs.rowcount
+    _LOG.info(f"Refreshed {row_count} milestones, deleted {deleted}")
+    return row_count
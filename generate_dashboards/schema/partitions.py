@@ -0,0 +1,390 @@
+import dataclasses
+import json
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from psycopg2.extensions import connection
+
+from generate_dashboards.dashboard.util import expand_macros, expand_variables
+from manage_users.db_connector import query_db_conn
+
+"""
+Range partitioning of the analytics tables by month or semester.
+
+Panel queries always filter on the partition column through $__timeFilter, so Postgres only scans
+the partitions of the visible time range, and old semesters can be detached or archived without
+slowing down current dashboards.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+MONTH = 'month'
+SEMESTER = 'semester'
+
+
+@dataclasses.dataclass(frozen=True)
+class PartitionedTable:
+    name: str
+    column: str
+
+
+PARTITIONED_TABLES = [
+    PartitionedTable(name='changecontribution', column='"timestamp"'),
+    PartitionedTable(name='commitaggregate', column='commit_time'),
+]
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(moment: datetime, granularity: str) -> datetime:
+    """
+    Start of the month, or semester, containing moment. Spring semesters start in January, autumn in July.
+    """
+    if granularity == MONTH:
+        return datetime(moment.year, moment.month, 1)
+    if granularity == SEMESTER:
+        return datetime(moment.year, 1 if moment.month < 7 else 7, 1)
+    raise ValueError(f"Unknown partition granularity {granularity}")
+
+
+def next_period_start(start: datetime, granularity: str) -> datetime:
+    months = 1 if granularity == MONTH else 6
+    month_index = start.month - 1 + months
+    return datetime(start.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_ranges(first: datetime, last: datetime, granularity: str) -> List[Tuple[datetime, datetime]]:
+    """
+    Consecutive [start, end) ranges covering every moment from first to last
+    """
+    ranges = []
+    start = period_start(first, granularity)
+    while start <= last:
+        end = next_period_start(start, granularity)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _periods_after(moment: datetime, granularity: str, periods: int) -> datetime:
+    start = period_start(moment, granularity)
+    for _ in range(periods):
+        start = next_period_start(start, granularity)
+    return start
+
+
+def partition_name(table: str, start: datetime, granularity: str) -> str:
+    if granularity == SEMESTER:
+        return f'{table}_{start.year}_{"spring" if start.month < 7 else "autumn"}'
+    return f'{table}_{start.year}_{start.month:02d}'
+
+
+def _bounds_sql(start: datetime, end: datetime) -> str:
+    return f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+
+
+def create_partition_sql(table: str, start: datetime, end: datetime, granularity: str) -> str:
+    return f'''
+    CREATE TABLE IF NOT EXISTS {partition_name(table, start, granularity)}
+        PARTITION OF {table}
+        {_bounds_sql(start, end)}
+    '''
+
+
+def attach_partition_sql(table: PartitionedTable, columns: str, start: datetime, end: datetime,
+                         granularity: str, from_default: bool = True) -> List[str]:
+    """
+    Statements creating the partition of [start, end) when {table}_default may already hold rows of that range.
+    Postgres refuses to create such a partition, so the partition is created on its own, the rows are moved
+    out of the default partition and the partition is attached afterwards.
+
+    :param from_default: whether table has a default partition
+    """
+    name = partition_name(table.name, start, granularity)
+    statements = [f'CREATE TABLE {name} (LIKE {table.name} INCLUDING ALL EXCLUDING INDEXES)']
+    if from_default:
+        statements.append(f'''
+        WITH moved AS (
+            DELETE FROM {table.name}_default
+            WHERE {table.column} >= '{start.isoformat()}' AND {table.column} < '{end.isoformat()}'
+            RETURNING {columns}
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+        ''')
+    # Indexes of the partitioned table are created on the partition when it is attached
+    statements.append(f'ALTER TABLE {table.name} ATTACH PARTITION {name} {_bounds_sql(start, end)}')
+    return statements
+
+
+def _column_names(conn: connection, table: str) -> List[str]:
+    # Generated columns are recomputed by the new table and cannot be inserted into
+    rows = query_db_conn(conn, '''
+    SELECT column_name
+    FROM information_schema.columns
+    WHERE table_name = %s AND table_schema = current_schema() AND is_generated = 'NEVER'
+    ORDER BY ordinal_position
+    ''', (table,))
+    return [f'"{row[0]}"' for row in rows]
+
+
+def _index_definitions(conn: connection, table: str) -> List[Tuple[str, str, bool, bool]]:
+    """
+    :return: name, definition, whether it is unique and whether it backs a primary key or unique constraint
+    """
+    return query_db_conn(conn, '''
+    SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid), pg_index.indisunique, EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conindid = pg_index.indexrelid AND conrelid = pg_index.indrelid AND contype IN ('p', 'u')
+    )
+    FROM pg_index
+    JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+    WHERE pg_index.indrelid = to_regclass(%s)
+    ''', (table,))
+
+
+def _key_constraints(conn: connection, table: str) -> List[Tuple[str, str, List[str]]]:
+    """
+    :return: name, PRIMARY KEY or UNIQUE, and columns of every key constraint of table
+    """
+    return query_db_conn(conn, '''
+    SELECT conname, CASE contype WHEN 'p' THEN 'PRIMARY KEY' ELSE 'UNIQUE' END,
+        array_agg(attname::text ORDER BY key_column.ordinal)
+    FROM pg_constraint
+    CROSS JOIN LATERAL unnest(conkey) WITH ORDINALITY AS key_column(attnum, ordinal)
+    JOIN pg_attribute ON attrelid = conrelid AND pg_attribute.attnum = key_column.attnum
+    WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u')
+    GROUP BY conname, contype
+    ''', (table,))
+
+
+def _owned_sequences(conn: connection, table: str) -> List[Tuple[str, str]]:
+    """
+    :return: sequence and column of every serial column of table
+    """
+    return query_db_conn(conn, '''
+    SELECT sequence.relname, attname
+    FROM pg_depend
+    JOIN pg_class sequence ON sequence.oid = pg_depend.objid AND sequence.relkind = 'S'
+    JOIN pg_attribute ON attrelid = pg_depend.refobjid AND attnum = pg_depend.refobjsubid
+    WHERE pg_depend.refobjid = to_regclass(%s) AND pg_depend.deptype = 'a'
+    ''', (table,))
+
+
+def _partitioned_key_sql(table: PartitionedTable, constraints: List[Tuple[str, str, List[str]]]) -> List[str]:
+    # Keys of a partitioned table must include the partition column
+    partition_column = table.column.strip('"')
+    statements = []
+    for name, kind, columns in constraints:
+        if partition_column not in columns:
+            _LOG.warning(f"{kind} {name} of {table.name} now includes {partition_column}, "
+                         f"so it is only unique per {partition_column}")
+            columns = [*columns, partition_column]
+        key = ', '.join(f'"{column}"' for column in columns)
+        statements.append(f'ALTER TABLE {table.name} ADD CONSTRAINT {name} {kind} ({key})')
+    return statements
+
+
+def convert_to_partitioned(conn: connection, table: PartitionedTable, granularity: str, periods_ahead: int = 2) -> None:
+    """
+    Replaces table by a range partitioned copy in a single transaction.
+    The original table is kept as {table}_unpartitioned until it is dropped by hand.
+    Rows outside the created partitions end up in {table}_default.
+
+    Primary keys and unique constraints are recreated with the partition column added, which Postgres requires,
+    so they only hold per partition column value. Serial columns keep their sequence, now owned by the new table.
+    Unique indexes which don't back a constraint can't be recreated like that, tables with one are refused.
+    """
+    indexes = _index_definitions(conn, table.name)
+    unique_indexes = [name for name, _, unique, backs_constraint in indexes if unique and not backs_constraint]
+    if unique_indexes:
+        raise ValueError(f"{table.name} has unique indexes {unique_indexes}, which would not hold across partitions. "
+                         f"Replace them by UNIQUE constraints, which are recreated with the partition column added")
+    constraints = _key_constraints(conn, table.name)
+    sequences = _owned_sequences(conn, table.name)
+    columns = ', '.join(_column_names(conn, table.name))
+    first, last = query_db_conn(conn, f'SELECT MIN({table.column}), MAX({table.column}) FROM {table.name}', None)[0]
+    now = datetime.now()
+    ranges = partition_ranges(first or now, _periods_after(max(last or now, now), granularity, periods_ahead),
+                              granularity)
+
+    with conn:
+        with conn.cursor() as curs:
+            curs.execute(f'ALTER TABLE {table.name} RENAME TO {table.name}_unpartitioned')
+            # Frees the names of the constraints, their indexes are renamed along
+            for name, _, _ in constraints:
+                curs.execute(f'ALTER TABLE {table.name}_unpartitioned RENAME CONSTRAINT {name} TO {name}_unpartitioned')
+            for index_name, _, unique, _ in indexes:
+                if not unique:
+                    curs.execute(f'ALTER INDEX {index_name} RENAME TO {index_name}_unpartitioned')
+            curs.execute(f'''
+            CREATE TABLE {table.name} (LIKE {table.name}_unpartitioned INCLUDING ALL EXCLUDING INDEXES)
+                PARTITION BY RANGE ({table.column})
+            ''')
+            for statement in _partitioned_key_sql(table, constraints):
+                curs.execute(statement)
+            # Dropping the original table must not drop the sequences behind the defaults of the new one
+            for sequence, column in sequences:
+                curs.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table.name}."{column}"')
+            for start, end in ranges:
+                curs.execute(create_partition_sql(table.name, start, end, granularity))
+            curs.execute(f'CREATE TABLE {table.name}_default PARTITION OF {table.name} DEFAULT')
+            # The definitions were read before the rename, so they target the new table
+            for _, index_definition, unique, _ in indexes:
+                if not unique:
+                    curs.execute(index_definition)
+            curs.execute(f'''
+            INSERT INTO {table.name} ({columns})
+            SELECT {columns} FROM {table.name}_unpartitioned
+            ''')
+    _LOG.info(f"Partitioned {table.name} into {len(ranges)} {granularity} partitions")
+
+
+def create_future_partitions(conn: connection, table: PartitionedTable, granularity: str,
+                             periods_ahead: int = 2) -> List[str]:
+    """
+    Creates the partitions of the current and the next periods_ahead periods if they are missing.
+    Rows of a new partition which were stored in the default partition are moved into it.
+    Run by `python cli.py refresh` and `python cli.py partitions`, see generate_dashboards.schema.maintenance.
+    :return: names of the created partitions
+    """
+    now = datetime.now()
+    ranges = partition_ranges(now, _periods_after(now, granularity, periods_ahead), granularity)
+    existing = {name for name, _, _ in get_partitions(conn, table.name)}
+    missing = [(start, end) for start, end in ranges if partition_name(table.name, start, granularity) not in existing]
+    if missing:
+        columns = ', '.join(_column_names(conn, table.name))
+        [(has_default,)] = query_db_conn(conn, 'SELECT to_regclass(%s) IS NOT NULL', (f'{table.name}_default',))
+        with conn:
+            with conn.cursor() as curs:
+                # Keeps rows of the moved ranges from being inserted into the default partition meanwhile
+                curs.execute(f'LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE')
+                for start, end in missing:
+                    for statement in attach_partition_sql(table, columns, start, end, granularity, has_default):
+                        curs.execute(statement)
+    _LOG.info(f"Created {len(missing)} partitions of {table.name}")
+    return [partition_name(table.name, start, granularity) for start, _ in missing]
+
+
+def get_partitions(conn: connection, table: str) -> List[Tuple[str, datetime, datetime]]:
+    """
+    :return: (name, start, end) of every range partition of table, the default partition is left out
+    """
+    rows = query_db_conn(conn, '''
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = %s
+    ''', (table,))
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def partition_granularity(partitions: List[Tuple[str, datetime, datetime]]) -> Optional[str]:
+    """
+    Granularity of the latest of partitions, see get_partitions, None if there are none
+    """
+    if not partitions:
+        return None
+    _, start, end = partitions[-1]
+    return MONTH if next_period_start(start, MONTH) == end else SEMESTER
+
+
+def detach_partitions_before(conn: connection, table: PartitionedTable, before: datetime,
+                             archive_schema: Optional[str] = None) -> List[str]:
+    """
+    Detaches every partition ending at or before `before`, optionally moving it to archive_schema.
+    Detached partitions keep their data but are no longer visible to the dashboards.
+    Run by `python cli.py partitions --detach-before`, see generate_dashboards.schema.maintenance.
+    :return: names of the detached partitions
+    """
+    detached = [name for name, _, end in get_partitions(conn, table.name) if end <= before]
+    with conn:
+        with conn.cursor() as curs:
+            if archive_schema:
+                curs.execute(f'CREATE SCHEMA IF NOT EXISTS {archive_schema}')
+            for name in detached:
+                curs.execute(f'ALTER TABLE {table.name} DETACH PARTITION {name}')
+                if archive_schema:
+                    curs.execute(f'ALTER TABLE {name} SET SCHEMA {archive_schema}')
+    _LOG.info(f"Detached {len(detached)} partitions of {table.name}")
+    return detached
+
+
+def scanned_relations(conn: connection, query: str, query_params=None) -> Set[str]:
+    """
+    Relations read by the plan of query, found through EXPLAIN
+    """
+    plan = query_db_conn(conn, f'EXPLAIN (FORMAT JSON) {query}', query_params)[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    relations = set()
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if 'Relation Name' in node:
+            relations.add(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return relations
+
+
+def time_filtered_panel_queries(dashboard: Dict, table: PartitionedTable) -> Dict[str, str]:
+    """
+    Raw SQL of the panels reading table with $__timeFilter on its partition column, by panel title.
+    Panels of collapsed rows are included.
+
+    :param dashboard: JSON model, see generate_dashboards.api.get_dashboard_model
+    """
+    panels = [nested for panel in dashboard.get('panels', []) for nested in [panel, *panel.get('panels', [])]]
+    reads_table = re.compile(rf'\bFROM\s+{table.name}\b')
+    time_filter = f'$__timeFilter({table.column})'
+    return {
+        panel['title']: target['rawSql']
+        for panel in panels for target in panel.get('targets', [])
+        if reads_table.search(target.get('rawSql', '')) and time_filter in target['rawSql']
+    }
+
+
+def _explain_variables(dashboard: Dict) -> Dict:
+    # The plan does not depend on the selected users or types, any value of the query variables will do
+    variables = {'__interval': '1d'}
+    for variable in dashboard.get('templating', {}).get('list', []):
+        if variable.get('type') == 'query':
+            variables[variable['name']] = ['']
+        else:
+            variables[variable['name']] = variable.get('current', {}).get('value', '')
+    return variables
+
+
+def verify_time_filter_pruning(conn: connection, table: PartitionedTable, dashboard: Dict,
+                               start: datetime, end: datetime) -> Dict[str, Set[str]]:
+    """
+    EXPLAINs the panel queries of dashboard reading table, with the dashboard time range set to [start, end],
+    and checks that they only scan the partitions overlapping it (plus the default partition).
+
+    :param dashboard: JSON model, see generate_dashboards.api.get_dashboard_model
+    :return: partitions scanned outside the range by panel title, empty if every query is pruned
+    """
+    partitions = get_partitions(conn, table.name)
+    expected = {name for name, partition_start, partition_end in partitions
+                if partition_start <= end and partition_end > start}
+    candidates = {name for name, _, _ in partitions} - expected
+    # Partition bounds are timestamps without time zone, $__timeFilter compares them in UTC
+    time_from, time_to = (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc) for moment in (start, end))
+    variables = _explain_variables(dashboard)
+
+    unpruned = {}
+    for title, sql in time_filtered_panel_queries(dashboard, table).items():
+        query = expand_macros(expand_variables(sql, variables), time_from, time_to)
+        outside = scanned_relations(conn, query) & candidates
+        if outside:
+            _LOG.warning(f"{title} scanned partitions of {table.name} outside the range: {sorted(outside)}")
+            unpruned[title] = outside
+    return unpruned
@@ -0,0 +1,159 @@
+import logging
+from typing import List, Optional
+
+from psycopg2.extensions import connection
+
+from generate_dashboards.schema.tables import ACCUMULATED_CONTRIBUTION_TABLE, COMMIT_COUNT_TABLE
+from manage_users.db_connector import execute_db_conn, query_db_conn
+
+"""
+Maintains daily aggregates of changecontribution, so the accumulated panels sum a row per day
+instead of grouping the full history of changecontribution on every dashboard refresh:
+
+- accumulatedcontribution: lines and commits per group, author, change type and day
+- accumulatedcontribution_commits: distinct commits per group, day and set of change types. A commit
+  touching several types is counted once, in the row of its set of types, so the commits of any selection
+  of types are the rows whose set overlaps it.
+
+The panels accumulate these rows from the start of the visible time range, like the queries on
+changecontribution they replace, see generate_dashboards.dashboard.group_overview.
+
+Created by `python cli.py migrate` and kept up to date by `python cli.py refresh`,
+see generate_dashboards.schema.maintenance.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+CREATE_ACCUMULATED_CONTRIBUTION_SQL = f'''
+CREATE TABLE IF NOT EXISTS {ACCUMULATED_CONTRIBUTION_TABLE} (
+    group_id varchar NOT NULL,
+    author_email varchar NOT NULL,
+    type varchar NOT NULL,
+    day date NOT NULL,
+    -- Net lines (added - removed) and distinct commits of this day
+    lines_changed bigint NOT NULL,
+    commits bigint NOT NULL,
+    -- Running totals from the first contribution of the author up to and including this day
+    accumulated_lines bigint NOT NULL,
+    accumulated_commits bigint NOT NULL,
+    PRIMARY KEY (group_id, day, author_email, type)
+);
+
+CREATE TABLE IF NOT EXISTS {COMMIT_COUNT_TABLE} (
+    group_id varchar NOT NULL,
+    day date NOT NULL,
+    -- Sorted distinct change types of the counted commits
+    types varchar[] NOT NULL,
+    commits bigint NOT NULL,
+    PRIMARY KEY (group_id, day, types)
+);
+
+-- Fingerprint of changecontribution per group at the time of the last refresh
+CREATE TABLE IF NOT EXISTS {ACCUMULATED_CONTRIBUTION_TABLE}_refresh (
+    group_id varchar PRIMARY KEY,
+    change_count bigint NOT NULL,
+    last_change timestamp NOT NULL,
+    refreshed_at timestamp NOT NULL DEFAULT now()
+);
+'''
+
+_REFRESH_GROUPS_SQL = f'''
+WITH daily AS (
+    SELECT
+        group_id,
+        author_email,
+        type,
+        "timestamp"::date AS day,
+        SUM(lines_added - lines_removed) AS lines_changed,
+        COUNT(DISTINCT commit_sha) AS commits
+    FROM changecontribution
+    WHERE group_id = ANY(%(group_ids)s)
+    GROUP BY 1, 2, 3, 4
+)
+INSERT INTO {ACCUMULATED_CONTRIBUTION_TABLE}
+SELECT
+    group_id,
+    author_email,
+    type,
+    day,
+    lines_changed,
+    commits,
+    SUM(lines_changed) OVER running,
+    SUM(commits) OVER running
+FROM daily
+WINDOW running AS (PARTITION BY group_id, author_email, type ORDER BY day)
+'''
+
+_REFRESH_COMMIT_COUNTS_SQL = f'''
+INSERT INTO {COMMIT_COUNT_TABLE} (group_id, day, types, commits)
+SELECT group_id, day, types, COUNT(*)
+FROM (
+    SELECT group_id, commit_sha, "timestamp"::date AS day, array_agg(DISTINCT type ORDER BY type) AS types
+    FROM changecontribution
+    WHERE group_id = ANY(%(group_ids)s)
+    GROUP BY group_id, commit_sha, "timestamp"::date
+) AS commit_types
+GROUP BY group_id, day, types
+'''
+
+# Groups refreshed before the commit counts existed have no rows in them yet
+_STALE_GROUPS_SQL = f'''
+SELECT current.group_id
+FROM (
+    SELECT group_id, COUNT(*) AS change_count, MAX("timestamp") AS last_change
+    FROM changecontribution
+    GROUP BY group_id
+) AS current
+LEFT JOIN {ACCUMULATED_CONTRIBUTION_TABLE}_refresh AS refreshed USING (group_id)
+WHERE refreshed.group_id IS NULL
+    OR refreshed.change_count <> current.change_count
+    OR refreshed.last_change <> current.last_change
+    OR NOT EXISTS (SELECT 1 FROM {COMMIT_COUNT_TABLE} AS counted WHERE counted.group_id = current.group_id)
+'''
+
+
+def create_accumulated_contribution_table(conn: connection) -> None:
+    execute_db_conn(conn, CREATE_ACCUMULATED_CONTRIBUTION_SQL)
+
+
+def refresh_accumulated_contributions(conn: connection, group_ids: List[str]) -> int:
+    """
+    Recomputes the daily aggregates of the given groups in a single transaction
+    :return: number of rows written to accumulatedcontribution
+    """
+    params = {'group_ids': group_ids}
+    with conn:
+        with conn.cursor() as curs:
+            for table in (ACCUMULATED_CONTRIBUTION_TABLE, COMMIT_COUNT_TABLE):
+                curs.execute(f'DELETE FROM {table} WHERE group_id = ANY(%(group_ids)s)', params)
+            curs.execute(_REFRESH_GROUPS_SQL, params)
+            row_count = curs.rowcount
+            curs.execute(_REFRESH_COMMIT_COUNTS_SQL, params)
+            curs.execute(f'''
+            INSERT INTO {ACCUMULATED_CONTRIBUTION_TABLE}_refresh (group_id, change_count, last_change)
+            SELECT group_id, COUNT(*), MAX("timestamp")
+            FROM changecontribution
+            WHERE group_id = ANY(%(group_ids)s)
+            GROUP BY group_id
+            ON CONFLICT (group_id) DO UPDATE SET
+                change_count = EXCLUDED.change_count,
+                last_change = EXCLUDED.last_change,
+                refreshed_at = now()
+            ''', params)
+    _LOG.info(f"Refreshed {row_count} running totals for {len(group_ids)} groups")
+    return row_count
+
+
+def refresh_stale_accumulated_contributions(conn: connection, group_ids: Optional[List[str]] = None) -> List[str]:
+    """
+    Batch job refreshing only the groups whose contributions changed since their last refresh.
+    Run by `python cli.py refresh` after each ingestion of changecontribution.
+    :param group_ids: restrict the refresh to these groups
+    :return: the refreshed group ids
+    """
+    stale = [row[0] for row in query_db_conn(conn, _STALE_GROUPS_SQL, None)]
+    if group_ids is not None:
+        stale = [group_id for group_id in stale if group_id in group_ids]
+    if stale:
+        refresh_accumulated_contributions(conn, stale)
+    return stale
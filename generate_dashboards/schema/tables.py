@@ -0,0 +1,11 @@
+"""
+Names of the tables maintained by generate_dashboards.schema.
+The dashboards read them, so this module must not import psycopg2 or anything else beyond the standard library.
+"""
+
+# Daily lines and running totals per group, author and change type, see generate_dashboards.schema.running_totals
+ACCUMULATED_CONTRIBUTION_TABLE = 'accumulatedcontribution'
+# Daily distinct commits per group and set of change types, see generate_dashboards.schema.running_totals
+COMMIT_COUNT_TABLE = 'accumulatedcontribution_commits'
+# Annotations of the issues, see generate_dashboards.schema.milestones
+MILESTONE_TABLE = 'issuemilestone'
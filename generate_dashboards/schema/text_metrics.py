@@ -0,0 +1,56 @@
+from psycopg2.extensions import connection
+
+from manage_users.db_connector import execute_db_conn
+
+"""
+Stored generated columns for the title and description heuristics of the red flag panels.
+Postgres computes them once on insert, so the panels no longer parse JSON per row and
+the covering indexes below allow index-only scans.
+
+Added by `python cli.py migrate`, the dashboards only read the columns once they exist.
+"""
+
+# Generated columns added to each table
+TEXT_METRIC_COLUMNS = {
+    'commitaggregate': ['title_length', 'title_word_count', 'title_hash'],
+    'issueaggregate': ['title_length', 'title_word_count', 'description_length'],
+}
+
+CREATE_TEXT_METRIC_COLUMNS_SQL = '''
+ALTER TABLE commitaggregate
+    ADD COLUMN IF NOT EXISTS title_length integer
+        GENERATED ALWAYS AS ((title->>'length')::integer) STORED,
+    ADD COLUMN IF NOT EXISTS title_word_count integer
+        GENERATED ALWAYS AS (array_length(string_to_array(title->>'raw', ' '), 1)) STORED,
+    ADD COLUMN IF NOT EXISTS title_hash uuid
+        GENERATED ALWAYS AS (md5(title->>'raw')::uuid) STORED;
+
+ALTER TABLE issueaggregate
+    ADD COLUMN IF NOT EXISTS title_length integer
+        GENERATED ALWAYS AS ((title->>'length')::integer) STORED,
+    ADD COLUMN IF NOT EXISTS title_word_count integer
+        GENERATED ALWAYS AS (array_length(string_to_array(title->>'raw', ' '), 1)) STORED,
+    ADD COLUMN IF NOT EXISTS description_length integer
+        GENERATED ALWAYS AS ((description->>'length')::integer) STORED;
+
+-- Covers "Commits with long Titles" and the grouping of "Duplicate commit titles"
+CREATE INDEX IF NOT EXISTS commitaggregate_title_metrics_idx
+    ON commitaggregate (group_id, commit_time)
+    INCLUDE (is_merge_commit, title_length, title_hash, project_path);
+
+-- Looks up the title text of a duplicated title hash
+CREATE INDEX IF NOT EXISTS commitaggregate_title_hash_idx
+    ON commitaggregate (group_id, title_hash);
+
+-- Covers "Issues without description" and "Issues with short titles"
+CREATE INDEX IF NOT EXISTS issueaggregate_text_metrics_idx
+    ON issueaggregate (group_id, created_at)
+    INCLUDE (title_word_count, description_length);
+'''
+
+
+def create_text_metric_columns(conn: connection) -> None:
+    """
+    Adds the generated columns and indexes. Existing rows are rewritten once by Postgres.
+    """
+    execute_db_conn(conn, CREATE_TEXT_METRIC_COLUMNS_SQL)
@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+from benchmarks.dashboard_load import ANNOTATION, PANEL, VARIABLE, GrafanaBackend, LoadResult, dashboard_queries, \
+    percentiles, run_load, saturation_point
+from benchmarks.standins import GrafanaStandIn
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import group_overview
+from generate_dashboards.datasource import queries_on_load
+
+
+class RecordingBackend:
+    def __init__(self):
+        self.sql = []
+        self.lock = threading.Lock()
+
+    def query(self, sql, time_from, time_to, interval_s):
+        with self.lock:
+            self.sql.append(sql)
+        return (['student1@stud.ntnu.no', 'student2@stud.ntnu.no'] if 'author_email' in sql.split('FROM')[0]
+                else []), 0.0
+
+
+class DashboardLoadCases(unittest.TestCase):
+    def setUp(self):
+        self.dashboard = get_dashboard_model(group_overview('group0'))
+
+    def test_queries_of_a_dashboard_load(self):
+        variables, queries = dashboard_queries(self.dashboard)
+        self.assertEqual([query.name for query in variables], ['filter_users', 'commit_types'])
+        self.assertEqual([query.kind for query in queries], [ANNOTATION] + [PANEL] * 4)
+        # The pool sizing of the datasource counts the same queries
+        self.assertEqual(queries_on_load(self.dashboard), len(variables) + len(queries))
+        self.assertEqual(len(dashboard_queries(self.dashboard, expand_rows=True)[1]), 12)
+
+    def test_viewers_resolve_variables_before_panels(self):
+        backend = RecordingBackend()
+        result = run_load(backend, [self.dashboard], viewers=3, expand_rows=True)
+        self.assertEqual(len(result.timings), 3 * (2 + 12))
+        self.assertEqual(len(result.load_seconds), 3)
+        self.assertFalse([timing.error for timing in result.timings if timing.error])
+        self.assertEqual({timing.kind for timing in result.timings}, {VARIABLE, ANNOTATION, PANEL})
+        panel_sql = [sql for sql in backend.sql if "'student1@stud.ntnu.no','student2@stud.ntnu.no'" in sql]
+        self.assertTrue(panel_sql)
+        self.assertTrue(all(sql.count("'student1@stud.ntnu.no'") == 1 for sql in panel_sql))
+        # Macros are left to the backend, variables are expanded
+        self.assertFalse([sql for sql in backend.sql if '${' in sql or '$__interval' in sql])
+        self.assertEqual(set(result.to_json_data()['dashboard_load']), {'p50', 'p95', 'p99'})
+
+    def test_through_grafana(self):
+        with GrafanaStandIn() as grafana_server:
+            grafana_server.datasources[1] = {'id': 1, 'uid': 'analytics', 'name': 'default', 'type': 'postgres'}
+            result = run_load(GrafanaBackend(grafana_server.address, 'api-key'), [self.dashboard], viewers=2)
+            self.assertEqual(len(grafana_server.datasource_queries), 2 * 7)
+            self.assertFalse([timing.error for timing in result.timings if timing.error])
+
+    def test_percentiles_and_saturation(self):
+        self.assertEqual(percentiles([float(n) for n in range(1, 101)]), {'p50': 50.0, 'p95': 95.0, 'p99': 99.0})
+        results = [LoadResult(viewers, 1.0, [None] * queries, []) for viewers, queries in
+                   [(10, 100), (20, 195), (40, 260), (80, 270)]]
+        self.assertEqual(saturation_point(results).viewers, 40)
+        self.assertIsNone(saturation_point(results[:2]))
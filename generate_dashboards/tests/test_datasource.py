@@ -0,0 +1,64 @@
+import dataclasses
+import json
+import unittest
+
+from benchmarks.standins import GrafanaStandIn
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import group_overview
+from generate_dashboards.datasource import DASHBOARD_DATASOURCE, PRIMARY_DATASOURCE, PRIMARY_POOL, PoolSizing, \
+    analytics_datasources, pool_sizing, provision_datasources, provisioning_yaml, queries_on_load
+from manage_users.api import grafana
+from manage_users.config import Config
+
+try:
+    from yaml import safe_load as load_yaml
+except ImportError:
+    # provisioning_yaml writes JSON without PyYAML
+    load_yaml = json.loads
+
+CONFIG = Config(db_host='primary:5432', db_name='grafana', db_user='grafana', db_password='somepassword')
+
+
+class DatasourceCases(unittest.TestCase):
+    def test_queries_on_load_skip_collapsed_rows(self):
+        dashboard = get_dashboard_model(group_overview('group0'))
+        # Four stat panels, the filter_users and commit_types variables and the milestone annotation,
+        # the panels of the collapsed rows wait
+        self.assertEqual(queries_on_load(dashboard), 7)
+
+    def test_pool_sizing(self):
+        self.assertEqual(pool_sizing(concurrent_viewers=30, queries_per_load=4), PoolSizing(120, 60))
+        # Browsers run at most six requests at once
+        self.assertEqual(pool_sizing(30, 20).max_open_conns, 180)
+        self.assertEqual(pool_sizing(30, 20, connection_budget=80, grafana_instances=2).max_open_conns, 40)
+        self.assertEqual(pool_sizing(0, 4), PoolSizing(2, 1))
+
+    def test_replica_serves_the_dashboards(self):
+        sizing = pool_sizing(30, 6)
+        [single] = analytics_datasources(CONFIG, sizing)
+        self.assertEqual((single['name'], single['url'], single['isDefault']),
+                         (DASHBOARD_DATASOURCE, 'primary:5432', True))
+
+        default, primary = analytics_datasources(dataclasses.replace(CONFIG, db_replica_host='replica:5432'), sizing)
+        self.assertEqual((default['name'], default['url']), (DASHBOARD_DATASOURCE, 'replica:5432'))
+        self.assertEqual(default['jsonData']['maxOpenConns'], sizing.max_open_conns)
+        self.assertEqual((primary['name'], primary['url'], primary['isDefault']),
+                         (PRIMARY_DATASOURCE, 'primary:5432', False))
+        self.assertEqual(primary['jsonData']['maxOpenConns'], PRIMARY_POOL.max_open_conns)
+
+    def test_provisioning_yaml_keeps_secrets_out(self):
+        document = load_yaml(provisioning_yaml(analytics_datasources(CONFIG, pool_sizing(30, 6))))
+        self.assertEqual(document['apiVersion'], 1)
+        [datasource] = document['datasources']
+        self.assertEqual(datasource['secureJsonData'], {'password': '$DB_PASSWORD'})
+        self.assertEqual(datasource['jsonData']['maxIdleConns'], 90)
+
+    def test_upsert_through_the_api(self):
+        with GrafanaStandIn() as grafana_server:
+            grafana_api = grafana.auth(host=grafana_server.address, username='admin', password='admin')
+            created = provision_datasources(grafana_api, analytics_datasources(CONFIG, pool_sizing(10, 6)))
+            updated = provision_datasources(grafana_api, analytics_datasources(CONFIG, pool_sizing(40, 6)))
+            self.assertEqual([response['id'] for response in created], [response['id'] for response in updated])
+            [stored] = grafana_server.datasources.values()
+            self.assertEqual(stored['jsonData']['maxOpenConns'], 240)
+            self.assertEqual(stored['secureJsonFields'], {'password': True})
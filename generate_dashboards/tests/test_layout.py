@@ -0,0 +1,51 @@
+import itertools
+import unittest
+
+from grafanalib.core import RowPanel, Stat
+
+from generate_dashboards.dashboard.group_overview import group_overview
+from generate_dashboards.dashboard.layout import layout, pack_panels, LayoutRow, SizedPanel, PanelSize, GRID_WIDTH
+
+
+def overlaps(a, b) -> bool:
+    return a.x < b.x + b.w and b.x < a.x + a.w and a.y < b.y + b.h and b.y < a.y + a.h
+
+
+class LayoutCases(unittest.TestCase):
+    def test_pack_panels_fills_columns_without_overlap(self):
+        panels = [SizedPanel(Stat(title=str(n)), PanelSize(w=w, h=h))
+                  for n, (w, h) in enumerate([(6, 4), (6, 4), (12, 8), (24, 2), (8, 3), (30, 1)])]
+        bottom = pack_panels(panels, y=1)
+
+        positions = [sized.panel.gridPos for sized in panels]
+        self.assertEqual([(pos.x, pos.y) for pos in positions[:3]], [(0, 1), (6, 1), (12, 1)])
+        for pos in positions:
+            self.assertLessEqual(pos.x + pos.w, GRID_WIDTH)
+        for a, b in itertools.combinations(positions, 2):
+            self.assertFalse(overlaps(a, b), msg=f"{a} overlaps {b}")
+        self.assertEqual(bottom, max(pos.y + pos.h for pos in positions))
+
+    def test_collapsed_rows_nest_their_panels(self):
+        panels = layout([
+            LayoutRow(title='open', panels=[SizedPanel(Stat(title='cheap'), PanelSize(w=6, h=4))]),
+            LayoutRow(title='closed', collapsed=True, panels=[SizedPanel(Stat(title='heavy'), PanelSize(w=6, h=4))]),
+        ])
+        self.assertEqual([panel.title for panel in panels], ['open', 'cheap', 'closed'])
+        self.assertEqual([panel.title for panel in panels[2].panels], ['heavy'])
+        self.assertEqual(panels[2].gridPos.y, 5, msg="The collapsed row should be placed below the open row")
+        self.assertEqual(panels[2].panels[0].gridPos.y, 6)
+
+    def test_overview_only_loads_stats_initially(self):
+        dashboard = group_overview('group')
+        top_level = [panel for panel in dashboard.panels if not isinstance(panel, RowPanel)]
+        self.assertTrue(top_level)
+        self.assertTrue(all(isinstance(panel, Stat) for panel in top_level))
+
+        ids = [panel.id for panel in dashboard.panels] + [
+            nested.id for panel in dashboard.panels if isinstance(panel, RowPanel) for nested in panel.panels
+        ]
+        self.assertEqual(len(ids), len(set(ids)), msg="Panel ids should be unique")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from generate_dashboards.schema import maintenance
+from generate_dashboards.schema.maintenance import SchemaFeatures, detect_schema
+from generate_dashboards.schema.partitions import SEMESTER
+from generate_dashboards.schema.tables import ACCUMULATED_CONTRIBUTION_TABLE, COMMIT_COUNT_TABLE, MILESTONE_TABLE
+from generate_dashboards.tests.test_running_totals import executed_sql, recording_connection
+from manage_users.tables import AUTHOR_ALIAS_TABLE
+
+
+class MaintenanceCases(unittest.TestCase):
+    def test_detect_schema(self):
+        conn = recording_connection(rows=[(True, False, True, False)])
+        self.assertEqual(detect_schema(conn), SchemaFeatures(running_totals=True, milestone_table=True))
+        [query] = executed_sql(conn)
+        self.assertIn(f"to_regclass('{COMMIT_COUNT_TABLE}')", query)
+        self.assertIn(f"to_regclass('{MILESTONE_TABLE}')", query)
+        self.assertIn(f"to_regclass('{AUTHOR_ALIAS_TABLE}')", query)
+
+    def test_migrate_creates_then_fills_the_tables(self):
+        conn = recording_connection(rows=[(True, True, True, False)])
+        calls = mock.Mock()
+        calls.refresh_running_totals.return_value = ['group0']
+        calls.refresh_milestones.return_value = 12
+        calls.maintain_partitions.return_value = {}
+        with mock.patch.multiple(maintenance, create_accumulated_contribution_table=calls.running_totals,
+                                 create_text_metric_columns=calls.text_metrics,
+                                 create_milestone_index=calls.milestone_index,
+                                 create_milestone_table=calls.milestone_table,
+                                 refresh_stale_accumulated_contributions=calls.refresh_running_totals,
+                                 refresh_milestones=calls.refresh_milestones,
+                                 maintain_partitions=calls.maintain_partitions):
+            self.assertEqual(maintenance.migrate(conn), SchemaFeatures(True, True, True))
+        self.assertEqual([name for name, _, _ in calls.mock_calls], [
+            'running_totals', 'text_metrics', 'milestone_index', 'milestone_table',
+            'refresh_running_totals', 'refresh_milestones', 'maintain_partitions',
+        ])
+
+    def test_refresh_reports_every_table(self):
+        with mock.patch.object(maintenance, 'refresh_stale_accumulated_contributions', return_value=['group1']), \
+                mock.patch.object(maintenance, 'refresh_milestones', return_value=7) as refresh_milestones, \
+                mock.patch.object(maintenance, 'maintain_partitions',
+                                  return_value={'changecontribution partitions': ['changecontribution_2023_03']}):
+            self.assertEqual(maintenance.refresh(mock.Mock(), ['group1']), {
+                ACCUMULATED_CONTRIBUTION_TABLE: 1, MILESTONE_TABLE: 7, 'changecontribution partitions': 1,
+            })
+            self.assertEqual(refresh_milestones.call_args.args[1], ['group1'])
+
+    def test_partitions_of_partitioned_tables_are_maintained(self):
+        conn = mock.Mock()
+        semester = [('changecontribution_2022_autumn', datetime(2022, 7, 1), datetime(2023, 1, 1))]
+        with mock.patch.object(maintenance, 'get_partitions', side_effect=lambda _, table: (
+                semester if table == 'changecontribution' else [])), \
+                mock.patch.object(maintenance, 'create_future_partitions', return_value=[]) as create, \
+                mock.patch.object(maintenance, 'detach_partitions_before', return_value=['old']) as detach:
+            self.assertEqual(maintenance.maintain_partitions(conn), {'changecontribution partitions': []})
+            [(_, table, granularity, periods_ahead)] = [call.args for call in create.call_args_list]
+            self.assertEqual((table.name, granularity, periods_ahead), ('changecontribution', SEMESTER, 2))
+            detach.assert_not_called()
+
+            self.assertEqual(maintenance.maintain_partitions(conn, detach_before=datetime(2022, 1, 1)), {
+                'changecontribution partitions': [], 'changecontribution detached': ['old'],
+            })
+            self.assertEqual(detach.call_args.args[2:], (datetime(2022, 1, 1), None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import subprocess
+import sys
+import unittest
+
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import group_overview
+from generate_dashboards.schema.milestones import refresh_milestones
+from generate_dashboards.schema.tables import MILESTONE_TABLE
+from generate_dashboards.tests.test_running_totals import recording_connection
+
+
+class MilestoneCases(unittest.TestCase):
+    def test_annotation_reads_the_table_only_when_enabled(self):
+        [annotation] = get_dashboard_model(group_overview('group0'))['annotations']['list']
+        self.assertIn('from issueaggregate', annotation['rawQuery'])
+
+        [annotation] = get_dashboard_model(group_overview('group0', use_milestone_table=True))['annotations']['list']
+        self.assertIn(f'from {MILESTONE_TABLE}', annotation['rawQuery'])
+        self.assertIn('created_at <= $__timeTo()', annotation['rawQuery'])
+
+    def test_refresh_upserts_and_deletes_all_or_some_groups(self):
+        conn = recording_connection()
+        conn.cursor.return_value.rowcount = 3
+        self.assertEqual(refresh_milestones(conn), 3)
+        delete, upsert = conn.cursor.return_value.execute.call_args_list
+        self.assertIn(f'DELETE FROM {MILESTONE_TABLE}', delete.args[0])
+        self.assertIn('WHERE NOT EXISTS', delete.args[0])
+        self.assertNotIn('ANY', delete.args[0])
+        self.assertNotIn('WHERE', upsert.args[0])
+        self.assertIn('ON CONFLICT (group_id, issue_iid) DO UPDATE', upsert.args[0])
+        self.assertEqual((delete.args[1], upsert.args[1]), (None, None))
+        conn.__exit__.assert_called_once()
+
+        conn.reset_mock()
+        refresh_milestones(conn, ['group0', 'group1'])
+        delete, upsert = conn.cursor.return_value.execute.call_args_list
+        self.assertIn('AND milestone.group_id = ANY(%(group_ids)s)', delete.args[0])
+        self.assertIn('WHERE group_id = ANY(%(group_ids)s)', upsert.args[0])
+        self.assertEqual(upsert.args[1], {'group_ids': ['group0', 'group1']})
+        self.assertEqual(delete.args[1], upsert.args[1])
+        conn.__exit__.assert_called_once()
+
+    def test_dashboards_do_not_import_psycopg2(self):
+        script = 'import sys, generate_dashboards.dashboard.group_overview; ' \
+                 'print([module for module in ("psycopg2", "grafana_api") if module in sys.modules])'
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
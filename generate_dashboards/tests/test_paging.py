@@ -0,0 +1,47 @@
+import unittest
+
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import commit_drilldown, commit_table, _duplicated_commit_titles
+from generate_dashboards.dashboard.util import expand_variables
+
+
+class PagingCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.commits, self.titles = commit_drilldown('group0').panels
+
+    def test_free_text_variables_are_quoted(self):
+        for panel in (self.commits, self.titles):
+            sql = panel.targets[0].rawSql
+            self.assertNotIn("'${", sql)
+            self.assertNotIn('${page_size}', sql)
+
+        sql = expand_variables(self.commits.targets[0].rawSql,
+                               {'commits_before': "2022-01-01'); DROP TABLE commitaggregate; --", 'page_size': '100'})
+        self.assertIn("split_part('2022-01-01''); DROP TABLE commitaggregate; --', ',', 1)", sql)
+        self.assertIn("LIMIT '100'::integer", sql)
+
+    def test_commits_are_paged_on_time_and_sha(self):
+        sql = self.commits.targets[0].rawSql
+        self.assertIn('(commit_time, commit_sha) < (', sql)
+        self.assertIn('ORDER BY time DESC, commit_sha DESC', sql)
+        # The cursor of the last row is the value of the next page
+        self.assertIn("""CONCAT(commit_time, ',', commit_sha) AS "Cursor\"""", sql)
+
+        overview_sql = commit_table('group0', pos=None).targets[0].rawSql
+        self.assertNotIn('Cursor', overview_sql)
+        self.assertIn('LIMIT 50', overview_sql)
+
+    def test_duplicated_titles_are_paged(self):
+        sql = expand_variables(self.titles.targets[0].rawSql, {'titles_page': '3', 'page_size': '50'})
+        self.assertIn("OFFSET (GREATEST(COALESCE(NULLIF('3', '')::integer, 1), 1) - 1) * '50'::integer", sql)
+        self.assertIn('ORDER BY duplicates desc, 1, project_path', sql)
+        self.assertNotIn('OFFSET', _duplicated_commit_titles('group0', pos=None).targets[0].rawSql)
+
+        variables = {variable['name']: variable for variable in
+                     get_dashboard_model(commit_drilldown('group0'))['templating']['list']}
+        self.assertEqual(variables['titles_page']['current']['value'], '1')
+        self.assertEqual(variables['commits_before']['type'], 'textbox')
+
+
+if __name__ == '__main__':
+    unittest.main()
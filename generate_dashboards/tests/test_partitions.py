@@ -0,0 +1,138 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import group_overview
+from generate_dashboards.schema import partitions
+from generate_dashboards.schema.partitions import partition_ranges, partition_name, create_partition_sql, \
+    attach_partition_sql, convert_to_partitioned, partition_granularity, time_filtered_panel_queries, \
+    verify_time_filter_pruning, PartitionedTable, MONTH, SEMESTER
+from generate_dashboards.tests.test_running_totals import executed_sql, recording_connection
+
+COMMITS = PartitionedTable(name='commitaggregate', column='commit_time')
+CHANGES = PartitionedTable(name='changecontribution', column='"timestamp"')
+
+
+class PartitionRangeCases(unittest.TestCase):
+    def test_month_ranges_cover_interval(self):
+        ranges = partition_ranges(datetime(2021, 11, 15), datetime(2022, 2, 1), MONTH)
+        self.assertEqual(ranges, [
+            (datetime(2021, 11, 1), datetime(2021, 12, 1)),
+            (datetime(2021, 12, 1), datetime(2022, 1, 1)),
+            (datetime(2022, 1, 1), datetime(2022, 2, 1)),
+            (datetime(2022, 2, 1), datetime(2022, 3, 1)),
+        ])
+
+    def test_semester_ranges_cover_interval(self):
+        ranges = partition_ranges(datetime(2021, 8, 20), datetime(2022, 3, 1), SEMESTER)
+        self.assertEqual(ranges, [
+            (datetime(2021, 7, 1), datetime(2022, 1, 1)),
+            (datetime(2022, 1, 1), datetime(2022, 7, 1)),
+        ])
+
+    def test_partition_names(self):
+        self.assertEqual(partition_name('changecontribution', datetime(2022, 3, 1), MONTH),
+                         'changecontribution_2022_03')
+        self.assertEqual(partition_name('commitaggregate', datetime(2021, 7, 1), SEMESTER),
+                         'commitaggregate_2021_autumn')
+
+    def test_create_partition_sql(self):
+        sql = create_partition_sql('commitaggregate', datetime(2022, 1, 1), datetime(2022, 7, 1), SEMESTER)
+        self.assertIn('commitaggregate_2022_spring', sql)
+        self.assertIn("FROM ('2022-01-01T00:00:00') TO ('2022-07-01T00:00:00')", sql)
+
+    def test_rows_are_moved_out_of_the_default_partition(self):
+        create, move, attach = attach_partition_sql(COMMITS, '"group_id", "commit_time"', datetime(2022, 7, 1),
+                                                    datetime(2023, 1, 1), SEMESTER)
+        self.assertIn('CREATE TABLE commitaggregate_2022_autumn (LIKE commitaggregate', create)
+        self.assertIn('DELETE FROM commitaggregate_default', move)
+        self.assertIn("commit_time >= '2022-07-01T00:00:00' AND commit_time < '2023-01-01T00:00:00'", move)
+        self.assertIn('INSERT INTO commitaggregate_2022_autumn ("group_id", "commit_time")', move)
+        self.assertEqual(attach, "ALTER TABLE commitaggregate ATTACH PARTITION commitaggregate_2022_autumn "
+                                 "FOR VALUES FROM ('2022-07-01T00:00:00') TO ('2023-01-01T00:00:00')")
+
+        statements = attach_partition_sql(COMMITS, '"group_id"', datetime(2022, 7, 1), datetime(2023, 1, 1), SEMESTER,
+                                          from_default=False)
+        self.assertEqual(len(statements), 2)
+
+    def test_unknown_granularity(self):
+        with self.assertRaises(ValueError):
+            partition_ranges(datetime(2022, 1, 1), datetime(2022, 2, 1), 'week')
+
+    def test_granularity_of_the_latest_partition(self):
+        self.assertIsNone(partition_granularity([]))
+        self.assertEqual(partition_granularity([('a', datetime(2022, 12, 1), datetime(2023, 1, 1))]), MONTH)
+        self.assertEqual(partition_granularity([('a', datetime(2022, 7, 1), datetime(2023, 1, 1))]), SEMESTER)
+
+
+class ConversionCases(unittest.TestCase):
+    def convert(self, indexes):
+        conn = recording_connection()
+        catalog = {
+            '_index_definitions': indexes,
+            '_key_constraints': [('changecontribution_pkey', 'PRIMARY KEY', ['group_id', 'commit_sha', 'type']),
+                                 ('changecontribution_uq', 'UNIQUE', ['id', 'timestamp'])],
+            '_owned_sequences': [('changecontribution_id_seq', 'id')],
+            '_column_names': ['"id"', '"group_id"'],
+        }
+        bounds = [(datetime(2022, 8, 1), datetime(2022, 9, 1))]
+        catalog_mocks = {name: mock.Mock(return_value=rows) for name, rows in catalog.items()}
+        with mock.patch.multiple(partitions, **catalog_mocks), \
+                mock.patch.object(partitions, 'query_db_conn', return_value=bounds):
+            convert_to_partitioned(conn, CHANGES, SEMESTER)
+        return executed_sql(conn)
+
+    def test_keys_and_sequences_move_to_the_partitioned_table(self):
+        statements = self.convert([
+            ('changecontribution_pkey', 'CREATE UNIQUE INDEX changecontribution_pkey ...', True, True),
+            ('changecontribution_group_idx', 'CREATE INDEX changecontribution_group_idx ...', False, False),
+        ])
+        self.assertIn('ALTER TABLE changecontribution_unpartitioned RENAME CONSTRAINT changecontribution_pkey '
+                      'TO changecontribution_pkey_unpartitioned', statements)
+        self.assertIn('ALTER INDEX changecontribution_group_idx RENAME TO changecontribution_group_idx_unpartitioned',
+                      statements)
+        self.assertIn('ALTER TABLE changecontribution ADD CONSTRAINT changecontribution_pkey '
+                      'PRIMARY KEY ("group_id", "commit_sha", "type", "timestamp")', statements)
+        self.assertIn('ALTER TABLE changecontribution ADD CONSTRAINT changecontribution_uq UNIQUE ("id", "timestamp")',
+                      statements)
+        self.assertIn('ALTER SEQUENCE changecontribution_id_seq OWNED BY changecontribution."id"', statements)
+        self.assertIn('CREATE INDEX changecontribution_group_idx ...', statements)
+        self.assertNotIn('CREATE UNIQUE INDEX changecontribution_pkey ...', statements)
+
+    def test_unique_indexes_are_refused(self):
+        with self.assertRaises(ValueError):
+            self.convert([('changecontribution_sha_idx', 'CREATE UNIQUE INDEX ...', True, False)])
+
+
+class PruningCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dashboard = get_dashboard_model(group_overview('group0'))
+
+    def test_panel_queries_with_time_filter(self):
+        self.assertEqual(set(time_filtered_panel_queries(self.dashboard, COMMITS)),
+                         {'Commits with long Titles', 'Large Commits', 'Duplicate commit titles', 'Commits'})
+        self.assertEqual(set(time_filtered_panel_queries(self.dashboard, CHANGES)),
+                         {'Changes by type', 'Accumulated lines contributed', 'Total Commits accumulated'})
+
+    def test_explains_the_expanded_panel_sql(self):
+        spring, autumn = [('commitaggregate_2022_spring', datetime(2022, 1, 1), datetime(2022, 7, 1)),
+                          ('commitaggregate_2022_autumn', datetime(2022, 7, 1), datetime(2023, 1, 1))]
+
+        def scanned(conn, query):
+            self.assertNotIn('$', query)
+            # Only the commit table reads the later semester
+            return {spring[0], autumn[0]} if 'LIMIT 50' in query else {spring[0], 'commitaggregate_default'}
+
+        with mock.patch.object(partitions, 'get_partitions', return_value=[spring, autumn]), \
+                mock.patch.object(partitions, 'scanned_relations', side_effect=scanned) as scanned_relations:
+            unpruned = verify_time_filter_pruning(mock.Mock(), COMMITS, self.dashboard,
+                                                  datetime(2022, 2, 1), datetime(2022, 3, 1))
+        self.assertEqual(unpruned, {'Commits': {autumn[0]}})
+        self.assertEqual(scanned_relations.call_count, 4)
+        self.assertIn("commit_time BETWEEN '2022-02-01T00:00:00Z' AND '2022-03-01T00:00:00Z'",
+                      scanned_relations.call_args_list[0].args[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import random
+import sqlite3
+import unittest
+from collections import defaultdict
+
+from generate_dashboards.dashboard.group_overview import get_commits_per_commit_type_barchart, \
+    get_commit_size_bar_chart, CHANGE_TYPES, COMMIT_SIZE_BUCKETS
+
+AUTHORS = ['ola@stud.ntnu.no', 'kari@stud.ntnu.no', 'per@stud.ntnu.no']
+
+# Source queries of the former crosstab() panels, crosstab only pivots their output
+LEGACY_COMMITS_PER_TYPE_SQL = '''
+SELECT author_email, type, count(DISTINCT commit_sha)
+FROM changecontribution
+WHERE group_id='group' AND author_email IN (${filter_users})
+GROUP BY author_email, type
+ORDER BY author_email, type
+'''
+
+LEGACY_COMMIT_SIZE_SQL = '''
+SELECT author_email, bucket, COUNT(bucket)
+FROM (
+    SELECT
+        author_email,
+        (CASE
+            WHEN total_lines_added <= 50 THEN 'S (< 50)'
+            WHEN total_lines_added <= 100 THEN 'M (50-99)'
+            ELSE 'L (100<)'
+        END) as bucket
+    FROM (
+        SELECT author_email, SUM(lines_added) AS total_lines_added
+        FROM changecontribution
+        WHERE
+            group_id='group' AND
+            author_email IN (${filter_users}) AND
+            type IN (${commit_types})
+        GROUP BY commit_sha, author_email
+    ) AS distinct_commits
+) AS buckets_per_commit
+GROUP BY author_email, bucket
+ORDER BY author_email, bucket
+'''
+
+
+def expand_variables(sql: str) -> str:
+    quoted_users = ','.join(f"'{author}'" for author in AUTHORS)
+    quoted_types = ','.join(f"'{change_type}'" for change_type in CHANGE_TYPES)
+    return sql.replace('${filter_users}', quoted_users).replace('${commit_types}', quoted_types)
+
+
+def crosstab(rows, categories):
+    """
+    Pivots (row_key, category, value) rows the same way as crosstab(), missing categories are 0
+    """
+    table = defaultdict(lambda: {category: 0 for category in categories})
+    for row_key, category, value in rows:
+        table[row_key][category] = value
+    return [(row_key, *[table[row_key][category] for category in categories]) for row_key in sorted(table)]
+
+
+def populate(conn: sqlite3.Connection, n_commits: int, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    conn.execute('''
+    CREATE TABLE changecontribution (
+        group_id TEXT, author_email TEXT, commit_sha TEXT, type TEXT, lines_added INTEGER, lines_removed INTEGER
+    )
+    ''')
+    rows = []
+    for n in range(n_commits):
+        author = rnd.choice(AUTHORS)
+        group_id = 'group' if rnd.random() < 0.9 else 'other-group'
+        # A commit consists of one or more changes, possibly of different types
+        for _ in range(rnd.randint(1, 4)):
+            rows.append((group_id, author, f'sha{n}', rnd.choice(list(CHANGE_TYPES)), rnd.randint(0, 80), 0))
+    conn.executemany('INSERT INTO changecontribution VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+
+class PivotCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(':memory:')
+        populate(self.conn, n_commits=2000)
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+    def test_commits_per_type_matches_crosstab(self):
+        panel = get_commits_per_commit_type_barchart('group', pos=None)
+        pivot = self.conn.execute(expand_variables(panel.targets[0].rawSql)).fetchall()
+        legacy = crosstab(self.conn.execute(expand_variables(LEGACY_COMMITS_PER_TYPE_SQL)).fetchall(), CHANGE_TYPES)
+        self.assertEqual(pivot, legacy)
+
+    def test_commit_size_matches_crosstab(self):
+        panel = get_commit_size_bar_chart('group', pos=None)
+        pivot = self.conn.execute(expand_variables(panel.targets[0].rawSql)).fetchall()
+        legacy = crosstab(self.conn.execute(expand_variables(LEGACY_COMMIT_SIZE_SQL)).fetchall(), COMMIT_SIZE_BUCKETS)
+        self.assertEqual(pivot, legacy)
+
+    def test_no_crosstab_dependency(self):
+        for panel in [get_commits_per_commit_type_barchart('group', None), get_commit_size_bar_chart('group', None)]:
+            self.assertNotIn('crosstab', panel.targets[0].rawSql)
+            self.assertEqual(panel.targets[0].rawSql.count('FROM changecontribution'), 1,
+                             msg="changecontribution should only be scanned once")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import unittest
+from datetime import timedelta, timezone
+from unittest import mock
+
+import psycopg2
+
+from benchmarks.synthetic_dataset import CREATE_TABLES_SQL, DatasetSpec, changecontribution_rows, copy_rows
+from generate_dashboards.dashboard.group_overview import accumulated_lines_contributed, \
+    get_accumulated_group_commits_time_series
+from generate_dashboards.dashboard.util import expand_macros, expand_variables
+from generate_dashboards.schema.running_totals import create_accumulated_contribution_table, \
+    refresh_accumulated_contributions, refresh_stale_accumulated_contributions
+from generate_dashboards.schema.tables import ACCUMULATED_CONTRIBUTION_TABLE, COMMIT_COUNT_TABLE
+from manage_users.db_connector import execute_db_conn, query_db_conn
+
+# Postgres database the panel queries are compared on, e.g. "dbname=grafana user=grafana host=localhost".
+# The tests work in a schema of their own, which is dropped afterwards.
+TEST_DSN = os.environ.get('ANALYTICS_TEST_DSN')
+
+
+def recording_connection(rows=()) -> mock.MagicMock:
+    # Plain and `with` cursors are the same mock, so every executed statement is recorded in order
+    conn = mock.MagicMock()
+    curs = conn.cursor.return_value
+    curs.__enter__.return_value = curs
+    curs.fetchall.return_value = list(rows)
+    return conn
+
+
+def executed_sql(conn: mock.MagicMock) -> list:
+    return [call.args[0] for call in conn.cursor.return_value.execute.call_args_list]
+
+
+class RunningTotalCases(unittest.TestCase):
+    def test_panels_read_the_table_only_when_enabled(self):
+        for panel in (accumulated_lines_contributed, get_accumulated_group_commits_time_series):
+            self.assertNotIn(ACCUMULATED_CONTRIBUTION_TABLE, panel('group0', pos=None).targets[0].rawSql)
+            sql = panel('group0', pos=None, use_running_totals=True).targets[0].rawSql
+            self.assertIn(f'FROM {ACCUMULATED_CONTRIBUTION_TABLE}', sql)
+            self.assertIn('$__timeFilter(day)', sql)
+        # A commit touching several types is counted once
+        commits_sql = get_accumulated_group_commits_time_series('group0', pos=None, use_running_totals=True)
+        self.assertIn(f'FROM {COMMIT_COUNT_TABLE}\n', commits_sql.targets[0].rawSql)
+
+    def test_refresh_replaces_the_groups_in_one_transaction(self):
+        conn = recording_connection()
+        refresh_accumulated_contributions(conn, ['group0', 'group1'])
+        delete, delete_commits, insert, insert_commits, fingerprint = executed_sql(conn)
+        self.assertIn(f'DELETE FROM {ACCUMULATED_CONTRIBUTION_TABLE} ', delete)
+        self.assertIn(f'DELETE FROM {COMMIT_COUNT_TABLE} ', delete_commits)
+        self.assertIn(f'INSERT INTO {ACCUMULATED_CONTRIBUTION_TABLE}\n', insert)
+        self.assertIn(f'INSERT INTO {COMMIT_COUNT_TABLE} ', insert_commits)
+        self.assertIn(f'INSERT INTO {ACCUMULATED_CONTRIBUTION_TABLE}_refresh', fingerprint)
+        conn.__exit__.assert_called_once()
+
+    def test_only_stale_groups_are_refreshed(self):
+        conn = recording_connection(rows=[('group0',), ('group2',)])
+        with mock.patch('generate_dashboards.schema.running_totals.refresh_accumulated_contributions') as refresh:
+            self.assertEqual(refresh_stale_accumulated_contributions(conn, ['group1', 'group2']), ['group2'])
+            refresh.assert_called_once_with(conn, ['group2'])
+
+            refresh.reset_mock()
+            conn.cursor.return_value.fetchall.return_value = []
+            self.assertEqual(refresh_stale_accumulated_contributions(conn), [])
+            refresh.assert_not_called()
+
+
+@unittest.skipUnless(TEST_DSN, 'set ANALYTICS_TEST_DSN to compare the panel queries on Postgres')
+class RunningTotalQueryCases(unittest.TestCase):
+    """
+    Both queries of every accumulated panel return the same series on the same synthetic contributions
+    """
+    spec = DatasetSpec(groups=2, authors_per_group=4, commits_per_author=60, issues_per_group=0)
+
+    def setUp(self):
+        self.conn = psycopg2.connect(TEST_DSN)
+        self.schema = f'test_running_totals_{os.getpid()}'
+        execute_db_conn(self.conn, f"CREATE SCHEMA {self.schema}; SET search_path TO {self.schema}")
+        execute_db_conn(self.conn, "SET TIME ZONE 'UTC'")
+        execute_db_conn(self.conn, CREATE_TABLES_SQL)
+        copy_rows(self.conn, 'changecontribution', changecontribution_rows(self.spec))
+        create_accumulated_contribution_table(self.conn)
+        refresh_accumulated_contributions(self.conn, [self.spec.group_name(number) for number in range(2)])
+
+    def tearDown(self):
+        execute_db_conn(self.conn, f'DROP SCHEMA {self.schema} CASCADE')
+        self.conn.close()
+
+    def series(self, sql: str, interval: str) -> list:
+        authors = [row[0] for row in query_db_conn(
+            self.conn, "SELECT DISTINCT author_email FROM changecontribution WHERE group_id = 'group0'", None)]
+        variables = {'filter_users': authors[:3], 'commit_types': ['FUNCTIONAL', 'TEST'], '__interval': interval}
+        # Whole days, the table is aggregated by day
+        start = self.spec.start.replace(tzinfo=timezone.utc) + timedelta(days=20)
+        end = start + timedelta(days=60, seconds=-1)
+        return sorted(query_db_conn(self.conn, expand_macros(expand_variables(sql, variables), start, end), None))
+
+    def test_running_totals_match_the_contributions(self):
+        for panel in (accumulated_lines_contributed, get_accumulated_group_commits_time_series):
+            for interval in ('1d', '1w'):
+                with self.subTest(panel=panel.__name__, interval=interval):
+                    expected = self.series(panel('group0', pos=None).targets[0].rawSql, interval)
+                    self.assertTrue(expected)
+                    self.assertEqual(
+                        self.series(panel('group0', pos=None, use_running_totals=True).targets[0].rawSql, interval),
+                        expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
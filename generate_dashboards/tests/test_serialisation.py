@@ -0,0 +1,41 @@
+import gzip
+import json
+import unittest
+
+from benchmarks.standins import GrafanaStandIn
+from generate_dashboards.api import SERIALISERS, get_dashboard_json, get_dashboard_payload, serialise, \
+    upload_to_grafana
+from generate_dashboards.dashboard.group_overview import group_overview
+from manage_users.instrumentation import METRICS
+
+
+class SerialisationCases(unittest.TestCase):
+    def setUp(self):
+        self.payload = get_dashboard_payload(group_overview('group0'), folder_uid='folder0')
+
+    def test_serialisers_encode_the_same_dashboard(self):
+        expected = json.loads(get_dashboard_json(group_overview('group0'), folder_uid='folder0'))
+        for serialiser in SERIALISERS:
+            with self.subTest(serialiser=serialiser):
+                body = b''.join(serialise(self.payload, serialiser))
+                self.assertEqual(json.loads(body), expected)
+                compressed = b''.join(serialise(self.payload, serialiser, compress=True))
+                self.assertEqual(gzip.decompress(compressed), body)
+                self.assertLess(len(compressed), len(body) / 3)
+
+    def test_compact_is_smaller_than_pretty(self):
+        pretty = b''.join(serialise(self.payload, 'pretty'))
+        compact = b''.join(serialise(self.payload, 'compact'))
+        self.assertLess(len(compact), len(pretty) * 0.6)
+
+    def test_streamed_and_compressed_uploads(self):
+        with GrafanaStandIn() as grafana_server:
+            grafana_server.folders['folder0'] = {'id': 1, 'uid': 'folder0', 'title': 'group0'}
+            METRICS.reset()
+            versions = [upload_to_grafana(self.payload, grafana_server.address, 'api-key', serialiser=serialiser,
+                                          compress=compress)['version']
+                        for serialiser in SERIALISERS for compress in (False, True)]
+            self.assertEqual(versions, list(range(1, 2 * len(SERIALISERS) + 1)))
+            stored = next(iter(grafana_server.dashboards.values()))
+            self.assertEqual(stored['dashboard']['title'], self.payload['dashboard']['title'])
+            self.assertGreater(METRICS.report()['grafana.upload_to_grafana']['bytes_sent'], 0)
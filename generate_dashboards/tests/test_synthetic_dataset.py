@@ -0,0 +1,55 @@
+import json
+import re
+import unittest
+from datetime import datetime
+
+from benchmarks.synthetic_dataset import CopyStream, _copy_value
+
+_COPY_ESCAPES = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r'}
+
+
+def parse_copy_line(line: str) -> list:
+    # Decodes a line the way COPY ... FROM STDIN in the text format does
+    return [None if field == '\\N' else re.sub(r'\\[\\tnr]', lambda match: _COPY_ESCAPES[match.group()], field)
+            for field in line.rstrip('\n').split('\t')]
+
+
+class CopyTextCases(unittest.TestCase):
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(_copy_value('a\tb'), 'a\\tb')
+        self.assertEqual(_copy_value('a\nb\r'), 'a\\nb\\r')
+        self.assertEqual(_copy_value('C:\\temp'), 'C:\\\\temp')
+        self.assertEqual(_copy_value('\\N'), '\\\\N')
+        self.assertEqual(_copy_value(None), '\\N')
+        self.assertEqual(_copy_value(''), '')
+
+    def test_other_types(self):
+        self.assertEqual(_copy_value(True), 't')
+        self.assertEqual(_copy_value(False), 'f')
+        self.assertEqual(_copy_value(42), '42')
+        self.assertEqual(_copy_value(datetime(2019, 9, 1, 12, 30)), '2019-09-01 12:30:00')
+        self.assertEqual(_copy_value([1, 2]), '{1,2}')
+
+    def test_json_survives_the_round_trip(self):
+        title = {'raw': 'Fix "tab"\there\nand C:\\path', 'length': 26}
+        [field] = parse_copy_line(_copy_value(json.dumps(title)))
+        self.assertEqual(json.loads(field), title)
+
+    def test_rows_survive_the_round_trip(self):
+        rows = [('group0', None, 'a\tb\nc\\d', True), ('group1', 3, '\\N', False)]
+        lines = CopyStream(rows).read().splitlines(keepends=True)
+        self.assertEqual([parse_copy_line(line) for line in lines],
+                         [['group0', None, 'a\tb\nc\\d', 't'], ['group1', '3', '\\N', 'f']])
+
+    def test_read_in_chunks(self):
+        rows = [(number, f'title {number}') for number in range(100)]
+        whole = CopyStream(rows).read()
+        stream = CopyStream(rows)
+        chunks = iter(lambda: stream.read(7), '')
+        self.assertEqual(''.join(chunks), whole)
+        self.assertEqual(stream.rows, 100)
+        self.assertEqual(whole.count('\n'), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import re
+import unittest
+
+from generate_dashboards.api import get_dashboard_model
+from generate_dashboards.dashboard.group_overview import commit_drilldown, group_overview, long_commit_titles, \
+    issues_without_description, issues_with_short_titles, commit_table, _duplicated_commit_titles
+from generate_dashboards.schema.maintenance import _FEATURE_PREDICATES
+from generate_dashboards.schema.text_metrics import CREATE_TEXT_METRIC_COLUMNS_SQL, TEXT_METRIC_COLUMNS
+
+STORED_COLUMNS = re.compile(r'\b(title_length|title_word_count|title_hash|description_length)\b')
+
+
+def panel_sql(panels) -> str:
+    return '\n'.join(target['rawSql'] for panel in panels for target in panel.get('targets', []))
+
+
+def dashboard_sql(dashboard) -> str:
+    model = get_dashboard_model(dashboard)
+    panels = [nested for panel in model['panels'] for nested in [panel, *panel.get('panels', [])]]
+    return panel_sql(panels)
+
+
+class TextMetricCases(unittest.TestCase):
+    def test_dashboards_parse_json_until_migrated(self):
+        for dashboard in (group_overview('group0'), commit_drilldown('group0')):
+            self.assertIsNone(STORED_COLUMNS.search(dashboard_sql(dashboard)))
+
+    def test_panels_read_stored_columns(self):
+        expected = {
+            long_commit_titles: 'title_length > 60',
+            issues_without_description: 'description_length < 1',
+            issues_with_short_titles: 'title_word_count < 3',
+            commit_table: 'title_length as "Title length"',
+            _duplicated_commit_titles: 'titles.title_hash = duplicated.title_key',
+        }
+        for panel, condition in expected.items():
+            self.assertNotIn(condition, panel('group0', pos=None).targets[0].rawSql)
+            self.assertIn(condition, panel('group0', pos=None, use_text_metrics=True).targets[0].rawSql)
+
+        sql = dashboard_sql(group_overview('group0', use_text_metrics=True))
+        self.assertEqual(set(STORED_COLUMNS.findall(sql)),
+                         {'title_length', 'title_word_count', 'title_hash', 'description_length'})
+
+    def test_ddl_adds_every_detected_column(self):
+        for table, columns in TEXT_METRIC_COLUMNS.items():
+            statement = re.search(rf'ALTER TABLE {table}\n(.*?);', CREATE_TEXT_METRIC_COLUMNS_SQL, re.S).group(1)
+            self.assertEqual(re.findall(r'ADD COLUMN IF NOT EXISTS (\w+)', statement), columns)
+            self.assertEqual(statement.count('GENERATED ALWAYS AS'), len(columns))
+        for index in re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', CREATE_TEXT_METRIC_COLUMNS_SQL):
+            self.assertTrue(index.startswith(('commitaggregate_', 'issueaggregate_')))
+
+        predicate = _FEATURE_PREDICATES['text_metrics']
+        self.assertIn("('commitaggregate', 'title_hash')", predicate)
+        self.assertIn("('issueaggregate', 'description_length')", predicate)
+        self.assertTrue(predicate.endswith('= 6'))
+
+
+if __name__ == '__main__':
+    unittest.main()
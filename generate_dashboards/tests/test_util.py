@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from generate_dashboards.dashboard.util import time_range_from_activity, DEFAULT_TIME_RANGE, expand_macros, \
+    expand_variables, resolve_time
+
+
+class TimeRangeCases(unittest.TestCase):
+    def test_unknown_activity_uses_default(self):
+        self.assertEqual(time_range_from_activity(None), DEFAULT_TIME_RANGE)
+        self.assertEqual(time_range_from_activity((None, None)), DEFAULT_TIME_RANGE)
+
+    def test_finished_group_uses_absolute_range(self):
+        time = time_range_from_activity((datetime(2022, 1, 10, 12), datetime(2022, 5, 1, 8)))
+        self.assertEqual(time.start, '2022-01-09T12:00:00.000Z')
+        self.assertEqual(time.end, '2022-05-02T08:00:00.000Z')
+
+    def test_active_group_ends_now(self):
+        now = datetime.now(timezone.utc)
+        time = time_range_from_activity((now - timedelta(days=30), now - timedelta(hours=1)))
+        self.assertEqual(time.end, 'now')
+
+
+class MacroCases(unittest.TestCase):
+    FROM = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    TO = datetime(2022, 1, 2, tzinfo=timezone.utc)
+
+    def test_variables_are_quoted_like_grafana(self):
+        sql = "author_email IN (${filter_users}) AND type IN ($commit_types) LIMIT [[page_size]]"
+        self.assertEqual(
+            expand_variables(sql, {'filter_users': ["o'neil@x", 'a@x'], 'commit_types': [], 'page_size': '50'}),
+            "author_email IN ('o''neil@x','a@x') AND type IN (NULL) LIMIT 50")
+        self.assertEqual(expand_variables('$__timeFilter(day) AND $unknown', {}), '$__timeFilter(day) AND $unknown')
+        self.assertEqual(expand_variables("${cursor:sqlstring}, ${cursor}", {'cursor': "a'b"}), "'a''b', a'b")
+
+    def test_macros(self):
+        self.assertEqual(expand_macros('WHERE $__timeFilter("timestamp")', self.FROM, self.TO),
+                         "WHERE \"timestamp\" BETWEEN '2022-01-01T00:00:00Z' AND '2022-01-02T00:00:00Z'")
+        self.assertEqual(expand_macros('$__timeGroup(commit_time, 1d)', self.FROM, self.TO),
+                         'floor(extract(epoch from commit_time)/86400)*86400')
+        self.assertEqual(expand_macros('$__timeEpoch(created_at), $__unixEpochTo()', self.FROM, self.TO),
+                         'extract(epoch from created_at) AS "time", 1641081600')
+        with self.assertRaises(ValueError):
+            expand_macros('$__timeGroup(day, soon)', self.FROM, self.TO)
+
+    def test_resolve_time(self):
+        now = datetime(2022, 6, 1, tzinfo=timezone.utc)
+        self.assertEqual(resolve_time('now', now), now)
+        self.assertEqual(resolve_time('now-7d', now), datetime(2022, 5, 25, tzinfo=timezone.utc))
+        self.assertEqual(resolve_time('2022-01-09T12:00:00.000Z', now), datetime(2022, 1, 9, 12, tzinfo=timezone.utc))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,25 @@
 import logging
-from typing import Dict
+from typing import Any, Callable, Dict, List, Optional
 
-import dotenv
 from grafana_api.grafana_face import GrafanaFace
 
+from manage_users.aliases import AuthorAlias, sync_author_aliases
 from manage_users.api.gitlab import get_groups_and_members
 from manage_users.api.grafana import auth as grafana_auth
 from manage_users.api.grafana import create_user, create_team, add_user_to_team, create_folder, \
-    give_team_folder_read_rights
+    give_team_folder_read_rights, delete_all_non_admin_users, delete_all_teams, delete_all_folders
+from manage_users.config import GITLAB_API_URL, Config, load_config
+from manage_users.db_connector import connect
+from manage_users.instrumentation import METRICS
 from manage_users.models import User, Team
+from manage_users.orchestrator import provision as orchestrated_provision
+from manage_users.uids import folder_uid
 
 _LOG = logging.getLogger(__name__)
 
 
-def retrieve_gitlab_data(gitlab_token, parent_group_id) -> Dict:
-    return get_groups_and_members(gitlab_token, parent_group_id)
+def retrieve_gitlab_data(gitlab_token, parent_group_id, api_url: str = GITLAB_API_URL) -> Dict:
+    return get_groups_and_members(gitlab_token, parent_group_id, api_url)
 
 
 def generate_grafana_users(grafana_api: GrafanaFace, gitlab_groups_and_users) -> Dict:
@@ -37,7 +42,7 @@ def generate_grafana_users(grafana_api: GrafanaFace, gitlab_groups_and_users) ->
 
 def generate_folders_and_assign_privileges(grafana_api: GrafanaFace, grafana_teams):
     for group_name, team_dict in grafana_teams.items():
-        new_folder = create_folder(grafana_api, group_name)
+        new_folder = create_folder(grafana_api, group_name, folder_uid(team_dict['gitlab_group']['group_id']))
         give_team_folder_read_rights(grafana_api, new_folder['uid'], team_dict['team_id'])
         grafana_teams[group_name] = {**team_dict, "folder_uid": new_folder['uid']}
     return grafana_teams
@@ -67,21 +72,69 @@ def generate_teams_and_assign_users(grafana_api: GrafanaFace, gitlab_groups_and_
     return teams
 
 
-def main() -> None:
-    TOKEN = dotenv.get_key("../.env", "GITLAB_ACCESS_TOKEN")
-    PARENT_GROUP_ID = 11911  # Mock project
-    # PARENT_GROUP_ID = 1042  # IT2810-H2018
+def sync_aliases(config: Config, grafana_api: GrafanaFace, gitlab_groups_and_users) -> Optional[List[AuthorAlias]]:
+    """
+    Maps the author emails of the analytics database to the synced users, skipped without DB_HOST.
+    Dashboards generated afterwards filter on these users, see generate_dashboards.schema.maintenance
+    """
+    if not config.db_host:
+        return None
+    conn = connect(dbname=config.db_name, user=config.db_user, host=config.db_host, password=config.db_password)
+    try:
+        return sync_author_aliases(conn, grafana_api, gitlab_groups_and_users)
+    finally:
+        conn.close()
+
 
-    GRAFANA_API = grafana_auth(host='localhost:3000', username="admin", password="admin")
+def sync_users(config: Config) -> Dict:
+    GRAFANA_API = grafana_auth(host=config.grafana_host, username=config.grafana_user,
+                               password=config.grafana_password)
 
-    # get all gitlab members from the sub groups of PARENT_GROUP_ID
-    gitlab_groups_and_users = retrieve_gitlab_data(TOKEN, PARENT_GROUP_ID)
+    # get all gitlab members from the sub groups of the parent group
+    gitlab_groups_and_users = retrieve_gitlab_data(config.gitlab_token, config.parent_group_id, config.gitlab_api_url)
     # create a grafana user for all gitlab members
     grafana_users = generate_grafana_users(GRAFANA_API, gitlab_groups_and_users)
     # create a grafana team for each gitlab group and add the corresponding grafana users to the team
     grafana_teams = generate_teams_and_assign_users(GRAFANA_API, gitlab_groups_and_users, grafana_users)
     # create every team and folder with right privilegies. Then add the correct users to the grafana team
     grafana_teams = generate_folders_and_assign_privileges(GRAFANA_API, grafana_teams)
+    # map the commit authors to the grafana users
+    sync_aliases(config, GRAFANA_API, gitlab_groups_and_users)
+    return grafana_teams
+
+
+def provision(config: Config, max_workers: int = 8,
+              upload_dashboards: Optional[Callable[[str, int], Any]] = None) -> Dict:
+    """
+    sync_users, optionally followed by the dashboard upload of every group, with the Grafana calls
+    running concurrently as soon as their inputs exist, see manage_users.orchestrator
+    """
+    GRAFANA_API = grafana_auth(host=config.grafana_host, username=config.grafana_user,
+                               password=config.grafana_password)
+    gitlab_groups_and_users = retrieve_gitlab_data(config.gitlab_token, config.parent_group_id, config.gitlab_api_url)
+    report = orchestrated_provision(GRAFANA_API, gitlab_groups_and_users, upload_dashboards, max_workers)
+    # The dashboards filter on the aliases once the table exists, so from the next run on for a new database
+    sync_aliases(config, GRAFANA_API, gitlab_groups_and_users)
+    return report
+
+
+def teardown(config: Config) -> None:
+    """
+    Deletes every non-admin user, team and folder, including the dashboards in the folders
+    """
+    GRAFANA_API = grafana_auth(host=config.grafana_host, username=config.grafana_user,
+                               password=config.grafana_password)
+    delete_all_non_admin_users(GRAFANA_API)
+    delete_all_teams(GRAFANA_API)
+    delete_all_folders(GRAFANA_API)
+
+
+def main() -> None:
+    config = load_config()
+    sync_users(config)
+
+    if config.metrics_dir:
+        METRICS.write_reports(config.metrics_dir, name='manage_users')
 
 
 if __name__ == "__main__":
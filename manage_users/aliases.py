@@ -0,0 +1,153 @@
+import dataclasses
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from grafana_api.grafana_face import GrafanaFace
+from psycopg2.extensions import connection
+from psycopg2.extras import execute_values
+
+from manage_users.api.grafana import get_all_users
+from manage_users.db_connector import execute_db_conn, get_group_repository_authors
+from manage_users.tables import AUTHOR_ALIAS_TABLE
+
+"""
+Resolves the author emails of changecontribution to the Grafana users created by manage_users.
+Commits are often authored with private emails, while generate_grafana_users assigns {username}@stud.ntnu.no.
+
+Every lookup is a set or dict access on indexes built once, so a whole course resolves in a single pass
+without queries or API calls per author.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+STUDENT_EMAIL_DOMAIN = 'stud.ntnu.no'
+
+# How an author email was matched to a user
+MATCHED_USERNAME = 'username'
+MATCHED_GRAFANA_EMAIL = 'grafana_email'
+MATCHED_NAME = 'name'
+UNMATCHED = 'unmatched'
+
+CREATE_AUTHOR_ALIAS_TABLE_SQL = f'''
+CREATE TABLE IF NOT EXISTS {AUTHOR_ALIAS_TABLE} (
+    group_id varchar NOT NULL,
+    author_email varchar NOT NULL,
+    -- GitLab username, or the author email itself if it could not be matched
+    username varchar NOT NULL,
+    grafana_user_id integer,
+    matched_by varchar NOT NULL,
+    PRIMARY KEY (group_id, author_email)
+);
+
+CREATE INDEX IF NOT EXISTS {AUTHOR_ALIAS_TABLE}_username_idx
+    ON {AUTHOR_ALIAS_TABLE} (group_id, username) INCLUDE (author_email);
+'''
+
+
+@dataclasses.dataclass(frozen=True)
+class AuthorAlias:
+    group_id: str
+    author_email: str
+    username: str
+    grafana_user_id: Optional[int]
+    matched_by: str
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def resolve_author_aliases(
+        group_authors: Dict[str, Iterable[str]],
+        gitlab_groups_and_users: Dict,
+        grafana_users: List[Dict],
+) -> List[AuthorAlias]:
+    """
+    Matches every author email of every group to a canonical GitLab username, in this order:
+    the local part is the username of a group member, the email belongs to a Grafana user,
+    or the local part equals the name of a group member ignoring case and punctuation.
+
+    :param group_authors: Dict({ group_id: [ author_email, ... ] }), e.g. from db_connector.get_group_repository_authors
+    :param gitlab_groups_and_users: output of api.gitlab.get_groups_and_members
+    :param grafana_users: output of api.grafana.get_all_users
+    """
+    grafana_by_email = {user['email'].lower(): user for user in grafana_users if user.get('email')}
+    grafana_by_login = {user['login']: user for user in grafana_users if user.get('login')}
+
+    aliases = []
+    for group_id, author_emails in group_authors.items():
+        members = gitlab_groups_and_users.get(group_id, {}).get('members', [])
+        usernames = {member['username'] for member in members}
+        username_by_name = {_normalize(member['name']): member['username'] for member in members}
+
+        for author_email in author_emails:
+            email = author_email.lower()
+            local_part = email.split('@')[0]
+
+            if local_part in usernames:
+                username, matched_by = local_part, MATCHED_USERNAME
+            elif email in grafana_by_email and grafana_by_email[email].get('login'):
+                username, matched_by = grafana_by_email[email]['login'], MATCHED_GRAFANA_EMAIL
+            elif _normalize(local_part) in username_by_name:
+                username, matched_by = username_by_name[_normalize(local_part)], MATCHED_NAME
+            else:
+                username, matched_by = author_email, UNMATCHED
+
+            grafana_user = grafana_by_login.get(username) or grafana_by_email.get(f'{username}@{STUDENT_EMAIL_DOMAIN}')
+            aliases.append(AuthorAlias(
+                group_id=group_id,
+                author_email=author_email,
+                username=username,
+                grafana_user_id=grafana_user['id'] if grafana_user else None,
+                matched_by=matched_by,
+            ))
+
+    unmatched = sum(1 for alias in aliases if alias.matched_by == UNMATCHED)
+    _LOG.info(f"Resolved {len(aliases) - unmatched} of {len(aliases)} author emails")
+    return aliases
+
+
+def create_author_alias_table(conn: connection) -> None:
+    execute_db_conn(conn, CREATE_AUTHOR_ALIAS_TABLE_SQL)
+
+
+def save_author_aliases(conn: connection, aliases: List[AuthorAlias], page_size: int = 1000,
+                        prune: bool = False) -> None:
+    """
+    Upserts the aliases in batches of page_size rows
+    :param prune: also delete the stored aliases which are not in aliases, in the same transaction
+    """
+    with conn:
+        with conn.cursor() as curs:
+            execute_values(curs, f'''
+            INSERT INTO {AUTHOR_ALIAS_TABLE} (group_id, author_email, username, grafana_user_id, matched_by)
+            VALUES %s
+            ON CONFLICT (group_id, author_email) DO UPDATE SET
+                username = EXCLUDED.username,
+                grafana_user_id = EXCLUDED.grafana_user_id,
+                matched_by = EXCLUDED.matched_by
+            ''', [dataclasses.astuple(alias) for alias in aliases], page_size=page_size)
+            if prune:
+                curs.execute(f'''
+                DELETE FROM {AUTHOR_ALIAS_TABLE}
+                WHERE (group_id, author_email) NOT IN (
+                    SELECT * FROM unnest(%s::varchar[], %s::varchar[])
+                )
+                ''', ([alias.group_id for alias in aliases], [alias.author_email for alias in aliases]))
+                _LOG.info(f"Deleted {curs.rowcount} aliases which no longer resolve")
+
+
+def sync_author_aliases(conn: connection, grafana_api: GrafanaFace, gitlab_groups_and_users: Dict) -> List[AuthorAlias]:
+    """
+    Resolves and persists the aliases of every group with one query, one paged Grafana user listing
+    and one batched upsert. Stored aliases of authors and groups which are gone are deleted.
+    """
+    group_authors = {
+        group_id: {email for emails in repositories.values() for email in emails}
+        for group_id, repositories in get_group_repository_authors(conn).items()
+    }
+    aliases = resolve_author_aliases(group_authors, gitlab_groups_and_users, get_all_users(grafana_api))
+    create_author_alias_table(conn)
+    save_author_aliases(conn, aliases, prune=True)
+    return aliases
@@ -3,35 +3,44 @@ from typing import List, Dict
 
 import requests
 
+from manage_users.config import GITLAB_API_URL
+from manage_users.instrumentation import METRICS, instrumented
+
 _LOG = logging.getLogger(__name__)
 
 
-def get_members_by_group_id(gitlab_token, group_id) -> List:
+@instrumented('gitlab')
+def get_members_by_group_id(gitlab_token, group_id, api_url: str = GITLAB_API_URL) -> List:
     r = requests.get(
-        f"https://gitlab.stud.idi.ntnu.no/api/v4/groups/{group_id}/members/all",
+        f"{api_url}/groups/{group_id}/members/all",
         verify=False,
         headers={
             "PRIVATE-TOKEN": gitlab_token},
+        hooks={'response': METRICS.response_hook},
     )
     return r.json()
 
 
-def get_subgroups_from_parent_group_id(gitlab_token, parent_group_id) -> List:
+@instrumented('gitlab')
+def get_subgroups_from_parent_group_id(gitlab_token, parent_group_id, api_url: str = GITLAB_API_URL) -> List:
     r = requests.get(
-        f"https://gitlab.stud.idi.ntnu.no/api/v4/groups/{parent_group_id}/subgroups",
+        f"{api_url}/groups/{parent_group_id}/subgroups",
         verify=False,
         headers={
             "PRIVATE-TOKEN": gitlab_token
-        }
+        },
+        hooks={'response': METRICS.response_hook},
     )
     return r.json()
 
 
-def get_groups_and_members(gitlab_token, parent_group_id: int) -> Dict:
+@instrumented('gitlab')
+def get_groups_and_members(gitlab_token, parent_group_id: int, api_url: str = GITLAB_API_URL) -> Dict:
     """
     Retrieves all subgroups and their members from a specific parent group
     :param gitlab_token: a gitlab access token
     :param parent_group_id: the id of the parent group
+    :param api_url: base url of the GitLab v4 API
     :return: Dict({
         "group_id": int,
         "group_name": str,
@@ -41,9 +50,9 @@ def get_groups_and_members(gitlab_token, parent_group_id: int) -> Dict:
     """
     groups = {}
 
-    for group in get_subgroups_from_parent_group_id(gitlab_token, parent_group_id):
+    for group in get_subgroups_from_parent_group_id(gitlab_token, parent_group_id, api_url):
         members = []
-        for member in get_members_by_group_id(gitlab_token, group['id']):
+        for member in get_members_by_group_id(gitlab_token, group['id'], api_url):
             members.append({"member_id": member['id'], "username": member['username'], "name": member['name']})
         group_dict = {
             "group_id": group['id'],
@@ -1,11 +1,13 @@
 import itertools
 import logging
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
-from grafana_api.grafana_api import GrafanaException
+from grafana_api.grafana_api import GrafanaClientError, GrafanaException
 from grafana_api.grafana_face import GrafanaFace
 
+from manage_users.instrumentation import METRICS, instrumented
 from manage_users.models import User, Team
+from manage_users.uids import is_group_uid
 
 _LOG = logging.getLogger(__name__)
 cached_user_emails = set()
@@ -13,9 +15,12 @@ cached_user_emails = set()
 
 def auth(host: str, username: str, password: str) -> GrafanaFace:
     _LOG.info(f'User {username} initiated auth to {host}')
-    return GrafanaFace(auth=(username, password), host=host, verify=False)
+    grafana_api = GrafanaFace(auth=(username, password), host=host, verify=False)
+    grafana_api.api.s.hooks['response'].append(METRICS.response_hook)
+    return grafana_api
 
 
+@instrumented('grafana')
 def get_all_cached_users(grafana_api: GrafanaFace) -> Set:
     global cached_user_emails
     if len(cached_user_emails) == 0:
@@ -23,6 +28,7 @@ def get_all_cached_users(grafana_api: GrafanaFace) -> Set:
     return cached_user_emails
 
 
+@instrumented('grafana')
 def create_user(grafana_api: GrafanaFace, user: User) -> Dict:
     try:
         user_emails = get_all_cached_users(grafana_api)
@@ -39,6 +45,7 @@ def create_user(grafana_api: GrafanaFace, user: User) -> Dict:
     return new_user
 
 
+@instrumented('grafana')
 def get_all_users(grafana_api: GrafanaFace) -> List[Dict]:
     per_page = 1000
     users = []
@@ -50,6 +57,7 @@ def get_all_users(grafana_api: GrafanaFace) -> List[Dict]:
     return users
 
 
+@instrumented('grafana')
 def delete_user_by_id(grafana_api: GrafanaFace, user_id: int):
     try:
         grafana_api.admin.delete_user(user_id)
@@ -59,6 +67,7 @@ def delete_user_by_id(grafana_api: GrafanaFace, user_id: int):
         raise ge
 
 
+@instrumented('grafana')
 def delete_team_by_id(grafana_api: GrafanaFace, team_id: int):
     try:
         grafana_api.teams.delete_team(team_id)
@@ -68,6 +77,7 @@ def delete_team_by_id(grafana_api: GrafanaFace, team_id: int):
         raise ge
 
 
+@instrumented('grafana')
 def create_team(grafana_api: GrafanaFace, team: Team) -> Dict:
     response = grafana_api.teams.add_team(team)
     if response["message"] == "Team created":
@@ -77,6 +87,7 @@ def create_team(grafana_api: GrafanaFace, team: Team) -> Dict:
     raise GrafanaException(999, response, "Team creation failed for some unknown reason")
 
 
+@instrumented('grafana')
 def get_all_teams(grafana_api: GrafanaFace) -> List[Dict]:
     per_page = 1000
     teams = []
@@ -88,6 +99,7 @@ def get_all_teams(grafana_api: GrafanaFace) -> List[Dict]:
     return teams
 
 
+@instrumented('grafana')
 def get_team_by_id(grafana_api: GrafanaFace, team_id: int):
     try:
         response = grafana_api.teams.get_team(team_id)
@@ -98,6 +110,7 @@ def get_team_by_id(grafana_api: GrafanaFace, team_id: int):
     return response
 
 
+@instrumented('grafana')
 def add_user_to_team(grafana_api: GrafanaFace, user_id: int, team_id: int):
     response = grafana_api.teams.add_team_member(team_id, user_id)
     if response["message"] == "Member added to Team":
@@ -107,6 +120,18 @@ def add_user_to_team(grafana_api: GrafanaFace, user_id: int, team_id: int):
     raise GrafanaException(999, response, "User was not added to team")
 
 
+@instrumented('grafana')
+def remove_user_from_team(grafana_api: GrafanaFace, user_id: int, team_id: int):
+    try:
+        response = grafana_api.teams.remove_team_member(team_id, user_id)
+        _LOG.info(f"Removed user: {user_id} from team {team_id}")
+    except GrafanaException as ge:
+        _LOG.exception(f"Failed to remove user {user_id} from team {team_id}")
+        raise ge
+    return response
+
+
+@instrumented('grafana')
 def get_team_members_by_team_id(grafana_api: GrafanaFace, team_id: int):
     try:
         response = grafana_api.teams.get_team_members(team_id)
@@ -117,6 +142,7 @@ def get_team_members_by_team_id(grafana_api: GrafanaFace, team_id: int):
     return response
 
 
+@instrumented('grafana')
 def get_user_by_id(grafana_api: GrafanaFace, user_id: int):
     try:
         response = grafana_api.users.get_user(user_id)
@@ -127,6 +153,7 @@ def get_user_by_id(grafana_api: GrafanaFace, user_id: int):
     return response
 
 
+@instrumented('grafana')
 def delete_all_non_admin_users(grafana_api: GrafanaFace) -> None:
     _LOG.warning("Initiated deletion of all non-admin users")
     users = get_all_users(grafana_api)
@@ -136,6 +163,7 @@ def delete_all_non_admin_users(grafana_api: GrafanaFace) -> None:
         _LOG.info(f"Deleted user: {user['id']}")
 
 
+@instrumented('grafana')
 def delete_all_teams(grafana_api: GrafanaFace):
     _LOG.warning("Initiated deletion of all teams")
     teams = get_all_teams(grafana_api)
@@ -144,20 +172,72 @@ def delete_all_teams(grafana_api: GrafanaFace):
         _LOG.info(f"Deleted team: {team['id']}")
 
 
-def create_folder(grafana_api: GrafanaFace, folder_title: str) -> Dict:
+@instrumented('grafana')
+def create_folder(grafana_api: GrafanaFace, folder_title: str, uid: Optional[str] = None) -> Dict:
+    """
+    :param uid: see manage_users.uids, Grafana generates a random uid if None.
+        If a folder with this uid exists already, that folder is returned, renamed to folder_title if needed.
+        A folder titled folder_title with a uid generated by Grafana is moved to this uid
+    """
     _LOG.info("Generating folder for")
-    return grafana_api.folder.create_folder(title=folder_title)
+    try:
+        return grafana_api.folder.create_folder(title=folder_title, uid=uid)
+    except GrafanaClientError as ce:
+        if uid is None or ce.status_code != 409:
+            _LOG.exception(f"Create folder {folder_title} failed")
+            raise ce
+    # Grafana answers 409 for an existing uid as well as for an existing title with another uid
+    try:
+        folder = get_folder_by_uid(grafana_api, uid)
+    except GrafanaClientError as ce:
+        if ce.status_code != 404:
+            raise ce
+        return _adopt_folder(grafana_api, folder_title, uid)
+    if folder['title'] != folder_title:
+        # The GitLab group was renamed
+        _LOG.info(f"Renaming folder {folder['title']} to {folder_title}")
+        folder = update_folder(grafana_api, uid, folder_title)
+    return folder
+
+
+def _adopt_folder(grafana_api: GrafanaFace, folder_title: str, uid: str) -> Dict:
+    # Folders created before their uids were derived from the GitLab groups have uids generated by Grafana
+    folder = next((folder for folder in get_all_folders(grafana_api) if folder['title'] == folder_title), None)
+    if folder is None or is_group_uid(folder['uid']):
+        _LOG.error(f"Folder {folder_title} exists with another uid than {uid}")
+        raise ValueError(f"Folder {folder_title} exists with another uid than {uid}")
+    _LOG.info(f"Moving folder {folder_title} from uid {folder['uid']} to {uid}")
+    return update_folder(grafana_api, folder['uid'], folder_title, new_uid=uid)
+
+
+@instrumented('grafana')
+def update_folder(grafana_api: GrafanaFace, uid: str, title: str, new_uid: Optional[str] = None) -> Dict:
+    """
+    :param new_uid: changes the uid of the folder, its dashboards and permissions stay with it
+    """
+    body = {'title': title, 'overwrite': True}
+    if new_uid is not None:
+        body['uid'] = new_uid
+    try:
+        # Folder.update_folder of grafana_api can't change the uid
+        return grafana_api.api.PUT(f'/folders/{uid}', json=body)
+    except GrafanaException as ge:
+        _LOG.exception(f"Update folder {uid} failed")
+        raise ge
 
 
+@instrumented('grafana')
 def get_folder_by_uid(grafana_api: GrafanaFace, uid: str) -> Dict:
     retrieved_folder = grafana_api.folder.get_folder(uid)
     return retrieved_folder
 
 
+@instrumented('grafana')
 def get_all_folders(grafana_api: GrafanaFace) -> List[Dict]:
     return grafana_api.folder.get_all_folders()
 
 
+@instrumented('grafana')
 def delete_folder_by_uid(grafana_api: GrafanaFace, uid: str):
     try:
         response = grafana_api.folder.delete_folder(uid)
@@ -168,6 +248,7 @@ def delete_folder_by_uid(grafana_api: GrafanaFace, uid: str):
     return response
 
 
+@instrumented('grafana')
 def delete_all_folders(grafana_api: GrafanaFace):
     _LOG.warning("Initiated deletion of all folder users")
     folders = get_all_folders(grafana_api)
@@ -175,10 +256,12 @@ def delete_all_folders(grafana_api: GrafanaFace):
         delete_folder_by_uid(grafana_api, folder['uid'])
 
 
+@instrumented('grafana')
 def update_folder_permissions(grafana_api: GrafanaFace, uid: str, permission_items):
     grafana_api.folder.update_folder_permissions(uid, {"items": permission_items})
 
 
+@instrumented('grafana')
 def give_team_folder_read_rights(grafana_api: GrafanaFace, uid: str, team_id: int):
     permission_items = [
         {
@@ -193,6 +276,27 @@ def give_team_folder_read_rights(grafana_api: GrafanaFace, uid: str, team_id: in
     update_folder_permissions(grafana_api, uid, permission_items)
 
 
+@instrumented('grafana')
+def upsert_datasource(grafana_api: GrafanaFace, datasource: Dict) -> Dict:
+    """
+    Creates the datasource, or replaces the datasource with the same name
+    """
+    try:
+        existing = grafana_api.datasource.get_datasource_by_name(datasource['name'])
+    except GrafanaClientError as ce:
+        if ce.status_code != 404:
+            _LOG.exception(f"Failed to get datasource {datasource['name']}")
+            raise ce
+        existing = None
+    try:
+        if existing:
+            return grafana_api.datasource.update_datasource(existing['id'], {**datasource, 'id': existing['id']})
+        return grafana_api.datasource.create_datasource(datasource)
+    except GrafanaException as ge:
+        _LOG.exception(f"Failed to upsert datasource {datasource['name']}")
+        raise ge
+
+
 # GRAFANA_API = auth(host='localhost:3000', username="admin", password="admin")
 # delete_all_non_admin_users(GRAFANA_API)
 # delete_all_teams(GRAFANA_API)
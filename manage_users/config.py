@@ -0,0 +1,73 @@
+import dataclasses
+import os
+from typing import Optional
+
+"""
+Settings of a run, read once from the .env file at the root of the repository.
+Environment variables with the same names take precedence over the file.
+
+Kept free of heavy imports, it is loaded by every CLI subcommand.
+"""
+
+DEFAULT_ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+GITLAB_API_URL = 'https://gitlab.stud.idi.ntnu.no/api/v4'
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    gitlab_token: Optional[str] = None
+    gitlab_api_url: str = GITLAB_API_URL
+    # 11911 is the mock project, 1042 is IT2810-H2018
+    parent_group_id: int = 11911
+    grafana_host: str = 'localhost:3000'
+    grafana_user: str = 'admin'
+    grafana_password: str = 'admin'
+    # Dashboards are uploaded with an API key, to grafana_host unless grafana_server is set
+    grafana_server: Optional[str] = None
+    grafana_api_key: Optional[str] = None
+    # The analytics database is optional
+    db_host: Optional[str] = None
+    db_name: Optional[str] = None
+    db_user: Optional[str] = None
+    db_password: Optional[str] = None
+    # Read-only replica serving the dashboard queries, see generate_dashboards.datasource
+    db_replica_host: Optional[str] = None
+    metrics_dir: Optional[str] = None
+    # Expected X-Gitlab-Token of webhook requests received by the sync daemon
+    webhook_secret: Optional[str] = None
+
+    @property
+    def dashboard_server(self) -> str:
+        return self.grafana_server or self.grafana_host
+
+
+# .env key of every Config field
+_KEYS = {
+    'gitlab_token': 'GITLAB_ACCESS_TOKEN',
+    'gitlab_api_url': 'GITLAB_API_URL',
+    'parent_group_id': 'PARENT_GROUP_ID',
+    'grafana_host': 'GRAFANA_HOST',
+    'grafana_user': 'GRAFANA_USER',
+    'grafana_password': 'GRAFANA_PASSWORD',
+    'grafana_server': 'GRAFANA_SERVER',
+    'grafana_api_key': 'GRAFANA_API_KEY',
+    'db_host': 'DB_HOST',
+    'db_name': 'DB_NAME',
+    'db_user': 'DB_USER',
+    'db_password': 'DB_PASSWORD',
+    'db_replica_host': 'DB_REPLICA_HOST',
+    'metrics_dir': 'METRICS_DIR',
+    'webhook_secret': 'WEBHOOK_SECRET',
+}
+
+
+def load_config(env_file: str = DEFAULT_ENV_FILE) -> Config:
+    import dotenv
+
+    values = dotenv.dotenv_values(env_file) if os.path.exists(env_file) else {}
+    settings = {}
+    for field in dataclasses.fields(Config):
+        value = os.environ.get(_KEYS[field.name]) or values.get(_KEYS[field.name])
+        if value:
+            settings[field.name] = int(value) if field.type is int else value
+    return Config(**settings)
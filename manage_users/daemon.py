@@ -0,0 +1,325 @@
+import dataclasses
+import hmac
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from grafana_api.grafana_face import GrafanaFace
+
+from manage_users.api.gitlab import get_groups_and_members
+from manage_users.api.grafana import add_user_to_team, create_folder, create_team, create_user, get_all_folders, \
+    get_all_teams, get_all_users, get_team_members_by_team_id, give_team_folder_read_rights, remove_user_from_team
+from manage_users.config import Config
+from manage_users.models import User, Team
+from manage_users.uids import folder_uid
+
+"""
+Long running sync of GitLab group memberships to Grafana.
+
+A local HTTP receiver accepts GitLab system hooks and group webhooks. Membership events are collected
+until no new event arrived for the debounce window, then only the affected users, teams and folders are
+changed. A full reconciliation against the GitLab groups runs periodically, as a backstop for missed events.
+Between events the daemon only waits on a condition variable.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+ADD_MEMBER = 'add_member'
+REMOVE_MEMBER = 'remove_member'
+ADD_GROUP = 'add_group'
+
+_MEMBER_EVENTS = {
+    'user_add_to_group': ADD_MEMBER,
+    'user_update_for_group': ADD_MEMBER,
+    'user_remove_from_group': REMOVE_MEMBER,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class MembershipChange:
+    action: str
+    group_name: str
+    username: Optional[str] = None
+    # Display name of the user
+    name: Optional[str] = None
+    # GitLab group id, the folder uid is derived from it
+    group_id: Optional[int] = None
+
+    @property
+    def key(self) -> Tuple[str, Optional[str]]:
+        # Later changes of the same membership replace earlier ones
+        return self.group_name, self.username
+
+
+def changes_from_event(event: Dict) -> List[MembershipChange]:
+    """
+    Translates a GitLab system hook or group webhook payload, events without membership changes are dropped
+    """
+    event_name = event.get('event_name')
+    if event_name in _MEMBER_EVENTS:
+        return [MembershipChange(_MEMBER_EVENTS[event_name], event['group_name'], event['user_username'],
+                                 event.get('user_name'), event.get('group_id'))]
+    if event_name == 'group_create':
+        return [MembershipChange(ADD_GROUP, event['name'], group_id=event.get('group_id'))]
+    return []
+
+
+class ChangeBuffer:
+    """
+    Coalesces changes until none arrived for debounce_s, or the oldest pending change waited max_delay_s
+    """
+
+    def __init__(self, debounce_s: float = 2.0, max_delay_s: float = 30.0):
+        self._debounce_s = debounce_s
+        self._max_delay_s = max_delay_s
+        self._pending: Dict[Tuple[str, Optional[str]], MembershipChange] = {}
+        self._first_at: Optional[float] = None
+        self._last_at: Optional[float] = None
+        self._reconcile = False
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def add(self, changes: List[MembershipChange]) -> None:
+        if not changes:
+            return
+        with self._condition:
+            now = time.monotonic()
+            for change in changes:
+                # Re-inserting moves the key last, changes are applied in the order of their latest event
+                self._pending.pop(change.key, None)
+                self._pending[change.key] = change
+            self._first_at = self._first_at or now
+            self._last_at = now
+            self._condition.notify()
+
+    def request_reconcile(self) -> None:
+        with self._condition:
+            self._reconcile = True
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _flush_at(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return min(self._last_at + self._debounce_s, self._first_at + self._max_delay_s)
+
+    def wait(self, timeout_s: float) -> Tuple[List[MembershipChange], bool]:
+        """
+        Blocks until a batch is due, a reconciliation is requested, the buffer is stopped or timeout_s passed
+        :return: the coalesced changes, and whether a reconciliation was requested
+        """
+        deadline = time.monotonic() + timeout_s
+        with self._condition:
+            while not self._stopped and not self._reconcile:
+                flush_at = self._flush_at()
+                wake_at = min(deadline, flush_at) if flush_at else deadline
+                if time.monotonic() >= wake_at:
+                    break
+                self._condition.wait(wake_at - time.monotonic())
+
+            due = bool(self._pending) and (self._stopped or self._reconcile or time.monotonic() >= self._flush_at())
+            changes = list(self._pending.values()) if due else []
+            if due:
+                self._pending.clear()
+                self._first_at = self._last_at = None
+            reconcile, self._reconcile = self._reconcile, False
+            return changes, reconcile
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+
+@dataclasses.dataclass
+class GrafanaState:
+    users: Dict[str, int]
+    teams: Dict[str, int]
+    team_members: Dict[int, Set[int]]
+    folders: Dict[str, str]
+
+    @classmethod
+    def load(cls, grafana_api: GrafanaFace) -> 'GrafanaState':
+        teams = {team['name']: team['id'] for team in get_all_teams(grafana_api)}
+        return cls(
+            users={user['login']: user['id'] for user in get_all_users(grafana_api)},
+            teams=teams,
+            team_members={team_id: {member['userId'] for member in get_team_members_by_team_id(grafana_api, team_id)}
+                          for team_id in teams.values()},
+            folders={folder['title']: folder['uid'] for folder in get_all_folders(grafana_api)},
+        )
+
+
+def _ensure_group(grafana_api: GrafanaFace, state: GrafanaState, group_name: str, group_id: Optional[int]) -> int:
+    if group_name not in state.teams:
+        state.teams[group_name] = create_team(grafana_api, Team({"name": group_name}))['teamId']
+        state.team_members[state.teams[group_name]] = set()
+    if group_name not in state.folders:
+        folder = create_folder(grafana_api, group_name, folder_uid(group_id) if group_id is not None else None)
+        give_team_folder_read_rights(grafana_api, folder['uid'], state.teams[group_name])
+        state.folders[group_name] = folder['uid']
+    return state.teams[group_name]
+
+
+def _ensure_user(grafana_api: GrafanaFace, state: GrafanaState, username: str, name: Optional[str]) -> int:
+    if username not in state.users:
+        state.users[username] = create_user(grafana_api, User({
+            'name': name or username,
+            'login': username,
+            'password': 'somepassword',
+            'email': f'{username}@stud.ntnu.no'
+        }))['id']
+    return state.users[username]
+
+
+def apply_changes(grafana_api: GrafanaFace, state: GrafanaState, changes: List[MembershipChange]) -> int:
+    """
+    Applies the changes, skipping the Grafana calls of changes which are already in effect
+    :return: the number of changed memberships and groups
+    """
+    applied = 0
+    for change in changes:
+        if change.action == ADD_GROUP:
+            applied += int(change.group_name not in state.teams)
+            _ensure_group(grafana_api, state, change.group_name, change.group_id)
+        elif change.action == ADD_MEMBER:
+            team_id = _ensure_group(grafana_api, state, change.group_name, change.group_id)
+            user_id = _ensure_user(grafana_api, state, change.username, change.name)
+            if user_id not in state.team_members[team_id]:
+                add_user_to_team(grafana_api, user_id, team_id)
+                state.team_members[team_id].add(user_id)
+                applied += 1
+        elif change.action == REMOVE_MEMBER:
+            team_id = state.teams.get(change.group_name)
+            user_id = state.users.get(change.username)
+            if team_id is not None and user_id in state.team_members[team_id]:
+                remove_user_from_team(grafana_api, user_id, team_id)
+                state.team_members[team_id].discard(user_id)
+                applied += 1
+    return applied
+
+
+def reconciliation_changes(gitlab_groups_and_users: Dict, state: GrafanaState) -> List[MembershipChange]:
+    """
+    Changes turning the Grafana teams of the GitLab groups into exact copies of the groups.
+    Teams of other groups are left alone.
+    """
+    changes = []
+    logins_by_id = {user_id: login for login, user_id in state.users.items()}
+    for group_name, group in gitlab_groups_and_users.items():
+        changes.append(MembershipChange(ADD_GROUP, group_name, group_id=group['group_id']))
+        usernames = set()
+        for member in group['members']:
+            usernames.add(member['username'])
+            changes.append(MembershipChange(ADD_MEMBER, group_name, member['username'], member['name'],
+                                            group['group_id']))
+        for user_id in state.team_members.get(state.teams.get(group_name), set()):
+            login = logins_by_id.get(user_id)
+            if login and login not in usernames:
+                changes.append(MembershipChange(REMOVE_MEMBER, group_name, login, group_id=group['group_id']))
+    return changes
+
+
+class SyncDaemon:
+    """
+    Applies coalesced webhook changes and reconciles every reconcile_every_s seconds, until stop() is called
+    """
+
+    def __init__(self, config: Config, grafana_api: GrafanaFace, buffer: ChangeBuffer,
+                 reconcile_every_s: float = 3600.0):
+        self._config = config
+        self._grafana_api = grafana_api
+        self._buffer = buffer
+        self._reconcile_every_s = reconcile_every_s
+        self._state: Optional[GrafanaState] = None
+        # GitLab subgroups of the parent group, as of the last reconciliation
+        self.known_groups: Set[str] = set()
+
+    def submit(self, event: Dict) -> None:
+        changes = changes_from_event(event)
+        if any(change.action == ADD_GROUP for change in changes):
+            # group_create does not tell the parent group, the next reconciliation finds out
+            self._buffer.request_reconcile()
+        self._buffer.add([change for change in changes if change.group_name in self.known_groups])
+
+    def _grafana_state(self) -> GrafanaState:
+        if self._state is None:
+            self._state = GrafanaState.load(self._grafana_api)
+        return self._state
+
+    def reconcile(self) -> int:
+        start = time.perf_counter()
+        gitlab_groups_and_users = get_groups_and_members(self._config.gitlab_token, self._config.parent_group_id,
+                                                         self._config.gitlab_api_url)
+        self.known_groups = set(gitlab_groups_and_users)
+        # Reloaded, changes made to Grafana by hand are picked up as well
+        self._state = None
+        state = self._grafana_state()
+        applied = apply_changes(self._grafana_api, state, reconciliation_changes(gitlab_groups_and_users, state))
+        _LOG.info(f"Reconciled {len(gitlab_groups_and_users)} groups in {time.perf_counter() - start:.1f} s, "
+                  f"{applied} changes")
+        return applied
+
+    def _apply(self, changes: List[MembershipChange]) -> None:
+        start = time.perf_counter()
+        try:
+            applied = apply_changes(self._grafana_api, self._grafana_state(), changes)
+            _LOG.info(f"Applied {applied} of {len(changes)} changes in {time.perf_counter() - start:.2f} s")
+        except Exception:
+            _LOG.exception("Applying changes failed, reconciling")
+            self._state = None
+            self._buffer.request_reconcile()
+
+    def run(self) -> None:
+        next_reconcile = time.monotonic()
+        while not self._buffer.stopped:
+            if time.monotonic() >= next_reconcile:
+                try:
+                    self.reconcile()
+                except Exception:
+                    _LOG.exception("Reconciliation failed")
+                next_reconcile = time.monotonic() + self._reconcile_every_s
+
+            changes, reconcile = self._buffer.wait(max(next_reconcile - time.monotonic(), 0.0))
+            if changes:
+                self._apply(changes)
+            if reconcile:
+                next_reconcile = time.monotonic()
+
+    def stop(self) -> None:
+        self._buffer.stop()
+
+
+def webhook_server(submit: Callable[[Dict], None], host: str = '127.0.0.1', port: int = 8090,
+                   secret_token: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    HTTP server passing every JSON payload POSTed to it to submit, call serve_forever() to start it.
+    Answers right away, GitLab disables hooks which respond slowly.
+    """
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            token = self.headers.get('X-Gitlab-Token') or ''
+            # Constant time, so the response time doesn't reveal how much of the token matched
+            if secret_token and not hmac.compare_digest(token.encode(), secret_token.encode()):
+                self.send_response(401)
+            else:
+                try:
+                    submit(json.loads(body))
+                    self.send_response(202)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    _LOG.warning("Ignored malformed webhook payload")
+                    self.send_response(400)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            _LOG.debug(format % args)
+
+    return ThreadingHTTPServer((host, port), WebhookHandler)
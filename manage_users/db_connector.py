@@ -1,7 +1,16 @@
 import psycopg2
-from psycopg2.extensions import connection
+from psycopg2.extensions import connection, TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool
 import logging
-from typing import List, Tuple, Optional
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple, Optional, Union
+
+from manage_users.instrumentation import METRICS, instrumented
+from manage_users.statements import STATEMENTS
 
 _LOG = logging.getLogger(__name__)
 
@@ -16,6 +25,105 @@ def connect(dbname: str, user: str, host: str, password: str) -> connection:
         raise e
 
 
+class ConnectionPool:
+    """
+    Thread safe pool of connections shared by concurrent provisioning and generation tasks.
+    Borrowing blocks while all maxconn connections are in use, instead of failing like ThreadedConnectionPool.
+
+    Usage:
+        pool = ConnectionPool(dbname=..., user=..., host=..., password=..., maxconn=8)
+        with pool.connection() as conn:
+            query_db_conn(conn, query, params)
+    """
+
+    def __init__(self, dbname: str, user: str, host: str, password: str, minconn: int = 1, maxconn: int = 10,
+                 statement_timeout_ms: int = 30_000, health_check_after_s: float = 30.0,
+                 borrow_timeout_s: Optional[float] = None):
+        """
+        :param statement_timeout_ms: server side limit for every statement, 0 disables it
+        :param health_check_after_s: connections idle in the pool for longer than this are pinged before use
+        :param borrow_timeout_s: maximum time to wait for a free connection, None waits forever
+        """
+        self._pool = ThreadedConnectionPool(
+            minconn, maxconn,
+            dbname=dbname, user=user, host=host, password=password,
+            options=f'-c statement_timeout={statement_timeout_ms}',
+        )
+        self._available = threading.BoundedSemaphore(maxconn)
+        self._returned_at: Dict[int, float] = {}
+        self._health_check_after_s = health_check_after_s
+        self._borrow_timeout_s = borrow_timeout_s
+        _LOG.info(f"Connection pool to {dbname} established ({minconn}-{maxconn} connections)")
+
+    def _is_healthy(self, conn: connection) -> bool:
+        if conn.closed:
+            return False
+        idle_for = time.monotonic() - self._returned_at.get(id(conn), 0.0)
+        if idle_for < self._health_check_after_s:
+            return True
+        try:
+            with conn.cursor() as curs:
+                curs.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            _LOG.warning("Discarding broken pooled connection")
+            return False
+
+    def getconn(self) -> connection:
+        timeout = self._borrow_timeout_s if self._borrow_timeout_s is not None else -1
+        if not self._available.acquire(timeout=timeout):
+            raise TimeoutError("No database connection became available")
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self._discard(conn)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, conn: connection) -> None:
+        try:
+            close = bool(conn.closed)
+            if not close and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                # Never hand out a connection in the middle of someone else's transaction
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    _LOG.warning("Discarding pooled connection which failed to roll back")
+                    close = True
+            if close:
+                self._discard(conn)
+            else:
+                self._returned_at[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._available.release()
+
+    def _discard(self, conn: connection) -> None:
+        # The id of a closed connection may be reused by a new one
+        self._returned_at.pop(id(conn), None)
+        STATEMENTS.forget(conn)
+        self._pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+        """
+        Borrows a connection for the duration of the with block, uncommitted work is rolled back on return
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+@instrumented('postgres')
 def query_db_conn(conn: connection, query: str, query_params: Optional[Tuple]) -> List:
     try:
         # use try-finally because `with` statement doesn't close connections
@@ -33,12 +141,142 @@ def query_db_conn(conn: connection, query: str, query_params: Optional[Tuple]) -
     return res
 
 
+def stream_db_conn(conn: connection, query: str, query_params: Optional[Tuple] = None, itersize: int = 2000,
+                   batches: bool = False) -> Iterator[Union[Tuple, List[Tuple]]]:
+    """
+    Streams the result of query through a named server side cursor, so only itersize rows are held in memory.
+    The query runs in the current transaction of conn, which must not be in autocommit mode.
+
+    :param itersize: rows fetched from the server per round trip
+    :param batches: yield lists of up to itersize rows instead of single rows
+    """
+    curs = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+    curs.itersize = itersize
+    # Measured by hand, the generator may be consumed long after the caller's instrumented call returned
+    start = time.perf_counter()
+    error = False
+    try:
+        curs.execute(query, query_params)
+        if batches:
+            while True:
+                rows = curs.fetchmany(itersize)
+                if not rows:
+                    break
+                yield rows
+        else:
+            yield from curs
+    except Exception as e:
+        error = True
+        _LOG.exception("Streaming from db connection failed")
+        raise e
+    finally:
+        curs.close()
+        METRICS.record('postgres.stream_db_conn', time.perf_counter() - start, error=error)
+
+
+@instrumented('postgres')
+def execute_db_conn(conn: connection, query: str, query_params: Optional[Tuple] = None) -> int:
+    """
+    Executes a statement without a result set (DDL, INSERT, UPDATE, DELETE) and commits it
+    :return: number of rows affected by the statement
+    """
+    try:
+        curs = conn.cursor()
+        try:
+            curs.execute(query, query_params)
+            row_count = curs.rowcount
+        finally:
+            curs.close()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        _LOG.exception("Executing statement on db connection failed")
+        raise e
+
+    return row_count
+
+
+STATEMENTS.register(
+    'authors_by_repo_id',
+    "SELECT DISTINCT author_email FROM changecontribution WHERE repository_id=$1",
+)
+STATEMENTS.register('authors_by_repo_ids', """
+    SELECT repository_id, array_agg(DISTINCT author_email ORDER BY author_email)
+    FROM changecontribution
+    WHERE repository_id = ANY($1)
+    GROUP BY repository_id
+""")
+STATEMENTS.register('all_repositories', "SELECT DISTINCT group_id, repository_id FROM changecontribution")
+STATEMENTS.register(
+    'all_repositories_since',
+    'SELECT DISTINCT group_id, repository_id FROM changecontribution WHERE "timestamp" >= $1',
+)
+STATEMENTS.register(
+    'group_activity_range',
+    'SELECT MIN("timestamp"), MAX("timestamp") FROM changecontribution WHERE group_id=$1',
+)
+
+
 def get_authors_by_repo_id(conn: connection, repo_id: int) -> List:
-    query = "SELECT DISTINCT author_email FROM changecontribution WHERE repository_id=(%s);"
-    query_params = (repo_id,)
-    return query_db_conn(conn, query, query_params)
+    return STATEMENTS.execute(conn, 'authors_by_repo_id', (repo_id,))
+
+
+def get_authors_by_repo_ids(conn: connection, repo_ids: List[int]) -> Dict[int, List[str]]:
+    """
+    Batched get_authors_by_repo_id, resolving every repository in a single query
+    :return: Dict({ repository_id: [ author_email, ... ] }), repositories without contributions map to []
+    """
+    authors = {repo_id: [] for repo_id in repo_ids}
+    authors.update(STATEMENTS.execute(conn, 'authors_by_repo_ids', (list(repo_ids),)))
+    return authors
+
+
+def get_group_repository_authors(conn: connection, since: Optional[datetime] = None) -> Dict[str, Dict[int, List[str]]]:
+    """
+    Index of every group, its repositories and their authors, built in a single pass over changecontribution
+    :param since: only include contributions after this moment
+    :return: Dict({ group_id: Dict({ repository_id: [ author_email, ... ] }) })
+    """
+    where = 'WHERE "timestamp" >= (%s)' if since is not None else ''
+    query = f"""
+    SELECT group_id, repository_id, array_agg(DISTINCT author_email ORDER BY author_email)
+    FROM changecontribution
+    {where}
+    GROUP BY group_id, repository_id;
+    """
+    index: Dict[str, Dict[int, List[str]]] = {}
+    for group_id, repository_id, authors in query_db_conn(conn, query, (since,) if since is not None else None):
+        index.setdefault(group_id, {})[repository_id] = authors
+    return index
+
+
+def get_all_repositories(conn: connection, since: Optional[datetime] = None) -> List:
+    """
+    :param since: only include repositories with contributions after this moment.
+        Lets Postgres skip the partitions of older semesters.
+    """
+    if since is None:
+        return STATEMENTS.execute(conn, 'all_repositories')
+    return STATEMENTS.execute(conn, 'all_repositories_since', (since,))
+
+
+def stream_all_repositories(conn: connection, since: Optional[datetime] = None,
+                            itersize: int = 2000) -> Iterator[Tuple]:
+    """
+    Same as get_all_repositories, but yields (group_id, repository_id) as they arrive from the server
+    """
+    if since is None:
+        return stream_db_conn(conn, "SELECT DISTINCT group_id, repository_id FROM changecontribution;",
+                              itersize=itersize)
+    query = 'SELECT DISTINCT group_id, repository_id FROM changecontribution WHERE "timestamp" >= (%s);'
+    return stream_db_conn(conn, query, (since,), itersize=itersize)
 
 
-def get_all_repositories(conn: connection) -> List:
-    query = "SELECT DISTINCT group_id, repository_id FROM changecontribution;"
-    return query_db_conn(conn, query, query_params=None)
+def get_group_activity_range(conn: connection, group_id: str) -> Optional[Tuple[datetime, datetime]]:
+    """
+    First and last recorded contribution of a group, None if the group has no contributions
+    """
+    first, last = STATEMENTS.execute(conn, 'group_activity_range', (group_id,))[0]
+    if first is None:
+        return None
+    return first, last
@@ -0,0 +1,201 @@
+import bisect
+import contextvars
+import dataclasses
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+"""
+Call counts, latency histograms, bytes transferred, retries and errors per endpoint,
+for every Grafana, GitLab and Postgres call made by a run.
+
+API helpers are wrapped with @instrumented(prefix), HTTP sessions report their bytes through
+METRICS.response_hook, and the result is exported as JSON and as a Prometheus textfile.
+Callers repeating a failed call report it with METRICS.record_retry, e.g. StatementRegistry.execute
+preparing a lost statement again.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Endpoint of the innermost instrumented call, HTTP bytes are attributed to it
+_current_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_endpoint', default=None)
+
+
+@dataclasses.dataclass
+class EndpointMetrics:
+    buckets: Tuple[float, ...]
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    total_seconds: float = 0.0
+    bucket_counts: List[int] = dataclasses.field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.bucket_counts:
+            # One count per bucket plus the +Inf bucket
+            self.bucket_counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.total_seconds += seconds
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def to_json_data(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.calls if self.calls else 0.0,
+            'histogram': {
+                **{str(bound): count for bound, count in zip(self.buckets, self.bucket_counts)},
+                '+Inf': self.bucket_counts[-1],
+            },
+        }
+
+
+class Instrumentation:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        self._endpoints: Dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _metrics(self, endpoint: str) -> EndpointMetrics:
+        # Caller holds the lock
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = EndpointMetrics(buckets=self._buckets)
+        return self._endpoints[endpoint]
+
+    def record(self, endpoint: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            metrics = self._metrics(endpoint)
+            metrics.calls += 1
+            metrics.errors += int(error)
+            metrics.observe(seconds)
+
+    def record_retry(self, endpoint: Optional[str] = None) -> None:
+        """
+        :param endpoint: defaults to the endpoint of the innermost instrumented call
+        """
+        endpoint = endpoint or _current_endpoint.get() or 'unknown'
+        with self._lock:
+            self._metrics(endpoint).retries += 1
+
+    def record_bytes(self, sent: int = 0, received: int = 0, endpoint: Optional[str] = None) -> None:
+        endpoint = endpoint or _current_endpoint.get() or 'unknown'
+        with self._lock:
+            metrics = self._metrics(endpoint)
+            metrics.bytes_sent += sent
+            metrics.bytes_received += received
+
+    def response_hook(self, response, *args, **kwargs):
+        """
+        requests response hook, register with session.hooks['response'].append(METRICS.response_hook)
+        or hooks={'response': METRICS.response_hook}
+        """
+        body = response.request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else 0
+        self.record_bytes(sent=sent, received=len(response.content))
+        return response
+
+    @contextmanager
+    def measure(self, endpoint: str) -> Iterator[None]:
+        token = _current_endpoint.set(endpoint)
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(endpoint, time.perf_counter() - start, error=error)
+            _current_endpoint.reset(token)
+
+    def instrumented(self, prefix: str) -> Callable:
+        """
+        Decorator recording every call of the function as the endpoint {prefix}.{function name}
+        """
+        def decorator(func):
+            endpoint = f'{prefix}.{func.__name__}'
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.measure(endpoint):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {endpoint: metrics.to_json_data() for endpoint, metrics in sorted(self._endpoints.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+    def prometheus_text(self, namespace: str = 'grafana_manager') -> str:
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+            counters = [
+                ('calls_total', 'Calls per endpoint', lambda m: m.calls),
+                ('errors_total', 'Failed calls per endpoint', lambda m: m.errors),
+                ('retries_total', 'Retried calls per endpoint', lambda m: m.retries),
+                ('sent_bytes_total', 'Request bytes sent per endpoint', lambda m: m.bytes_sent),
+                ('received_bytes_total', 'Response bytes received per endpoint', lambda m: m.bytes_received),
+            ]
+            for name, description, value in counters:
+                lines += [f'# HELP {namespace}_{name} {description}', f'# TYPE {namespace}_{name} counter']
+                lines += [f'{namespace}_{name}{{endpoint="{endpoint}"}} {value(metrics)}'
+                          for endpoint, metrics in endpoints]
+
+            histogram = f'{namespace}_call_duration_seconds'
+            lines += [f'# HELP {histogram} Latency of calls per endpoint', f'# TYPE {histogram} histogram']
+            for endpoint, metrics in endpoints:
+                cumulative = 0
+                for bound, count in zip([*map(str, metrics.buckets), '+Inf'], metrics.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{histogram}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{histogram}_sum{{endpoint="{endpoint}"}} {metrics.total_seconds}')
+                lines.append(f'{histogram}_count{{endpoint="{endpoint}"}} {metrics.calls}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json_report(self, path: str) -> None:
+        _write_atomically(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus_textfile(self, path: str) -> None:
+        _write_atomically(path, self.prometheus_text())
+
+    def write_reports(self, directory: str, name: str = 'grafana_manager') -> None:
+        """
+        Writes {name}.json and {name}.prom, the latter can be picked up by node_exporter's textfile collector
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.write_json_report(os.path.join(directory, f'{name}.json'))
+        self.write_prometheus_textfile(os.path.join(directory, f'{name}.prom'))
+        _LOG.info(f"Wrote instrumentation reports to {directory}")
+
+
+def _write_atomically(path: str, content: str) -> None:
+    # Readers, like the textfile collector, never see a partially written file
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+
+
+# Shared by every instrumented helper of a run
+METRICS = Instrumentation()
+instrumented = METRICS.instrumented
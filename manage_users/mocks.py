@@ -1,7 +1,12 @@
-from manage_users.models import User, Team
-from typing import List
+import json
+import random
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
 from faker import Faker
 
+from manage_users.models import User, Team
+
 fake = Faker('no_NO')
 
 
@@ -19,3 +24,125 @@ def get_n_mock_users(n) -> List[User]:
 
 def get_n_mock_teams(n) -> List[Team]:
     return [get_mock_team() for _ in range(n)]
+
+
+# Norwegian letters are transliterated, GitLab usernames and emails are ASCII
+_ASCII = str.maketrans({'æ': 'ae', 'ø': 'o', 'å': 'a', 'é': 'e', 'ü': 'u', 'ö': 'o', 'ä': 'a'})
+
+
+def _slug(text: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', text.lower().translate(_ASCII))
+
+
+def _username(first_name: str, last_name: str, number: int) -> str:
+    return f'{_slug(first_name)[:4]}{_slug(last_name)[:4]}{number}'
+
+
+class BulkMocks:
+    """
+    Reproducible users, teams and GitLab groups for load-scale fixtures.
+
+    Faker is only called once per pool entry when the generator is created, entities are then assembled
+    from the pools with batched random.choices. Usernames, emails and team names carry a running number,
+    so they are unique for any amount of entities.
+    """
+
+    def __init__(self, seed: int = 0, pool_size: int = 500, email_domain: str = 'stud.ntnu.no'):
+        pool_faker = Faker('no_NO')
+        pool_faker.seed_instance(seed)
+        self._random = random.Random(seed)
+        self._email_domain = email_domain
+        self.first_names = sorted({pool_faker.first_name() for _ in range(pool_size)})
+        self.last_names = sorted({pool_faker.last_name() for _ in range(pool_size)})
+        self.companies = sorted({pool_faker.company() for _ in range(pool_size)})
+        # Running numbers of the next user, team, GitLab group and member
+        self._next_user = 0
+        self._next_team = 0
+        self._next_group = 0
+        self._next_member = 0
+
+    def _names(self, n: int) -> List[Tuple[str, str]]:
+        return list(zip(self._random.choices(self.first_names, k=n), self._random.choices(self.last_names, k=n)))
+
+    def users(self, n: int, start: Optional[int] = None) -> Iterator[User]:
+        """
+        Logins and emails continue from the previous call, so batches of the same instance never collide.
+        :param start: first running number instead of the next one, use distinct ranges to generate disjoint batches
+        """
+        # Reserved when called rather than when iterated, like gitlab_groups
+        numbers = self._reserve('_next_user', n, start)
+        return self._users(numbers)
+
+    def _users(self, numbers: range) -> Iterator[User]:
+        for number, (first_name, last_name) in zip(numbers, self._names(len(numbers))):
+            login = _username(first_name, last_name, number)
+            yield User({
+                "name": f"{first_name} {last_name}",
+                "login": login,
+                "email": f"{login}@{self._email_domain}",
+                "password": "password",
+            })
+
+    def teams(self, n: int, start: Optional[int] = None) -> Iterator[Team]:
+        """
+        :param start: first running number instead of the next one
+        """
+        numbers = self._reserve('_next_team', n, start)
+        return self._teams(numbers)
+
+    def _teams(self, numbers: range) -> Iterator[Team]:
+        for number, company in zip(numbers, self._random.choices(self.companies, k=len(numbers))):
+            yield Team({"name": f"{company} {number}", "email": f"team{number}@{self._email_domain}"})
+
+    def _reserve(self, counter: str, n: int, start: Optional[int]) -> range:
+        first = getattr(self, counter) if start is None else start
+        setattr(self, counter, max(getattr(self, counter), first + n))
+        return range(first, first + n)
+
+    def gitlab_groups(self, parent_group_id: int, groups: int, members_per_group: int) -> Iterator[Dict]:
+        """
+        Subgroups shaped like the GitLab API responses, with the members of /groups/{id}/members/all inlined.
+        Group ids, group names, member ids and usernames continue from the previous call,
+        so the groups of several courses generated by the same instance never collide.
+        :return: Dict({ "id": int, "name": str, "parent_id": int, "members": [ Dict({ "id", "username", "name" }) ] })
+        """
+        # Reserved when called rather than when iterated, so interleaved generators get disjoint ranges
+        first_group, first_member = self._next_group, self._next_member
+        self._next_group += groups
+        self._next_member += groups * members_per_group
+        return self._gitlab_groups(parent_group_id, range(first_group, first_group + groups), first_member,
+                                   members_per_group)
+
+    def _gitlab_groups(self, parent_group_id: int, group_numbers: range, first_member: int,
+                       members_per_group: int) -> Iterator[Dict]:
+        names = self._names(len(group_numbers) * members_per_group)
+        for index, group_number in enumerate(group_numbers):
+            members = []
+            for name_index in range(index * members_per_group, (index + 1) * members_per_group):
+                first_name, last_name = names[name_index]
+                member_number = first_member + name_index
+                members.append({
+                    "id": member_number + 1,
+                    "username": _username(first_name, last_name, member_number),
+                    "name": f"{first_name} {last_name}",
+                })
+            yield {
+                "id": group_number + 1,
+                "name": f"group{group_number}",
+                "parent_id": parent_group_id,
+                "members": members,
+            }
+
+
+def write_jsonl(entities: Iterable[Dict], path: str) -> int:
+    """
+    Streams entities to path, one JSON object per line
+    :return: the number of written entities
+    """
+    count = 0
+    with open(path, 'w') as file:
+        for entity in entities:
+            file.write(json.dumps(entity))
+            file.write('\n')
+            count += 1
+    return count
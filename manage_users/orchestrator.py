@@ -0,0 +1,268 @@
+import dataclasses
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from grafana_api.grafana_face import GrafanaFace
+from requests.adapters import HTTPAdapter
+
+from manage_users.api.grafana import add_user_to_team, create_folder, create_team, create_user, \
+    get_all_cached_users, give_team_folder_read_rights
+from manage_users.instrumentation import METRICS
+from manage_users.models import User, Team
+from manage_users.uids import folder_uid
+
+"""
+Runs provisioning as a graph of small tasks on a shared worker pool instead of sequential phases.
+
+A task is scheduled as soon as the tasks it depends on are done, so the folder of one group is created
+while users of another group are still being created, and the wall time approaches the longest chain
+of dependent calls instead of the sum of all calls.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Task:
+    name: str
+    # Called with the results of the dependencies, keyed by task name
+    run: Callable[[Dict[str, Any]], Any]
+    dependencies: Tuple[str, ...] = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class TaskTiming:
+    start: float
+    end: float
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+@dataclasses.dataclass
+class GraphRun:
+    results: Dict[str, Any]
+    timings: Dict[str, TaskTiming]
+    wall_seconds: float
+    # Chain of dependent tasks which finished last, it bounds the wall time
+    critical_path: List[str]
+
+    @property
+    def critical_path_seconds(self) -> float:
+        return sum(self.timings[name].seconds for name in self.critical_path)
+
+    @property
+    def task_seconds(self) -> float:
+        """
+        Wall time of running every task sequentially
+        """
+        return sum(timing.seconds for timing in self.timings.values())
+
+
+def _validate(tasks: Dict[str, Task]) -> None:
+    for task in tasks.values():
+        missing = [dependency for dependency in task.dependencies if dependency not in tasks]
+        if missing:
+            raise ValueError(f"Task {task.name} depends on unknown tasks {missing}")
+
+    # Kahn's algorithm, tasks left over are part of a cycle
+    remaining = {name: len(task.dependencies) for name, task in tasks.items()}
+    dependents = _dependents(tasks)
+    ready = [name for name, count in remaining.items() if count == 0]
+    while ready:
+        for dependent in dependents[ready.pop()]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    cyclic = [name for name, count in remaining.items() if count > 0]
+    if cyclic:
+        raise ValueError(f"Tasks {cyclic} form a dependency cycle")
+
+
+def _dependents(tasks: Dict[str, Task]) -> Dict[str, List[str]]:
+    dependents = {name: [] for name in tasks}
+    for task in tasks.values():
+        for dependency in task.dependencies:
+            dependents[dependency].append(task.name)
+    return dependents
+
+
+def _critical_path(tasks: Dict[str, Task], timings: Dict[str, TaskTiming]) -> List[str]:
+    if not timings:
+        return []
+    # Walk back from the last task to finish, through the dependency which finished last
+    path = [max(timings, key=lambda name: timings[name].end)]
+    while tasks[path[-1]].dependencies:
+        path.append(max(tasks[path[-1]].dependencies, key=lambda name: timings[name].end))
+    return path[::-1]
+
+
+class _Execution:
+    """
+    State of a single run_graph call, only the thread calling run() schedules tasks
+    """
+
+    def __init__(self, graph: Dict[str, Task], executor: ThreadPoolExecutor):
+        self._graph = graph
+        self._executor = executor
+        self._dependents = _dependents(graph)
+        self._waiting_for = {name: len(task.dependencies) for name, task in graph.items()}
+        self._running: Dict[Future, str] = {}
+        self._timings_lock = threading.Lock()
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, TaskTiming] = {}
+        self.failure: Optional[BaseException] = None
+
+    def _execute(self, task: Task) -> Any:
+        start = time.perf_counter()
+        try:
+            return task.run({dependency: self.results[dependency] for dependency in task.dependencies})
+        finally:
+            with self._timings_lock:
+                self.timings[task.name] = TaskTiming(start, time.perf_counter())
+
+    def _submit_ready(self, names: List[str]) -> None:
+        for name in names:
+            if self._waiting_for[name] == 0:
+                self._running[self._executor.submit(self._execute, self._graph[name])] = name
+
+    def _complete(self, future: Future) -> None:
+        name = self._running.pop(future)
+        if future.exception() is not None:
+            _LOG.error(f"Task {name} failed", exc_info=future.exception())
+            self.failure = self.failure or future.exception()
+            return
+        self.results[name] = future.result()
+        for dependent in self._dependents[name]:
+            self._waiting_for[dependent] -= 1
+        if not self.failure:
+            self._submit_ready(self._dependents[name])
+
+    def run(self) -> None:
+        self._submit_ready(list(self._graph))
+        while self._running:
+            done, _ = wait(self._running, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._complete(future)
+
+
+def run_graph(tasks: List[Task], max_workers: int = 8) -> GraphRun:
+    """
+    Runs every task once all its dependencies are done, on a pool of max_workers threads.
+    If a task fails, no further tasks are started and its exception is raised once the running tasks finish.
+    """
+    graph = {task.name: task for task in tasks}
+    if len(graph) != len(tasks):
+        raise ValueError("Task names must be unique")
+    _validate(graph)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='provisioning') as executor:
+        execution = _Execution(graph, executor)
+        execution.run()
+    if execution.failure:
+        raise execution.failure
+
+    graph_run = GraphRun(results=execution.results, timings=execution.timings,
+                         wall_seconds=time.perf_counter() - start,
+                         critical_path=_critical_path(graph, execution.timings))
+    _LOG.info(f"Ran {len(tasks)} tasks in {graph_run.wall_seconds:.2f} s, "
+              f"critical path {graph_run.critical_path_seconds:.2f} s, sequential {graph_run.task_seconds:.2f} s")
+    return graph_run
+
+
+def provisioning_tasks(grafana_api: GrafanaFace, gitlab_groups_and_users: Dict,
+                       upload_dashboards: Optional[Callable[[str, int], Any]] = None,
+                       ensure_user: Optional[Callable[[User], Dict]] = None) -> List[Task]:
+    """
+    One task per Grafana user, team, team membership, folder, folder permission and,
+    if upload_dashboards(group_name, gitlab_group_id) is given, per dashboard upload of a group.
+    Folders get the uids of manage_users.uids.
+
+    Task names are user:{username}, team:{group}, member:{group}:{username}, folder:{group},
+    permissions:{group} and dashboards:{group}.
+
+    :param ensure_user: returns a Dict with the Grafana "id" of the user, defaults to creating the user
+    """
+    ensure_user = ensure_user or (lambda user: create_user(grafana_api, user))
+    tasks = []
+    users = {}
+    for group in gitlab_groups_and_users.values():
+        for member in group['members']:
+            users.setdefault(member['username'], member)
+
+    for username, member in users.items():
+        new_user = User({
+            'name': member['name'],
+            'login': username,
+            'password': 'somepassword',
+            'email': f'{username}@stud.ntnu.no'
+        })
+        tasks.append(Task(f'user:{username}', lambda _, user=new_user: ensure_user(user)))
+
+    for group_name in gitlab_groups_and_users:
+        tasks.append(Task(f'team:{group_name}',
+                          lambda _, name=group_name: create_team(grafana_api, Team({"name": name}))))
+        tasks.append(Task(f'folder:{group_name}', lambda _, name=group_name: create_folder(
+            grafana_api, name, folder_uid(gitlab_groups_and_users[name]['group_id']))))
+        tasks.append(Task(
+            f'permissions:{group_name}',
+            lambda inputs, name=group_name: give_team_folder_read_rights(
+                grafana_api, inputs[f'folder:{name}']['uid'], inputs[f'team:{name}']['teamId']),
+            dependencies=(f'team:{group_name}', f'folder:{group_name}'),
+        ))
+        for member in gitlab_groups_and_users[group_name]['members']:
+            team, user = f'team:{group_name}', f'user:{member["username"]}'
+            tasks.append(Task(
+                f'member:{group_name}:{member["username"]}',
+                lambda inputs, team=team, user=user: add_user_to_team(grafana_api, inputs[user]['id'],
+                                                                      inputs[team]['teamId']),
+                dependencies=(team, user),
+            ))
+        if upload_dashboards:
+            tasks.append(Task(
+                f'dashboards:{group_name}',
+                lambda _, name=group_name: upload_dashboards(name, gitlab_groups_and_users[name]['group_id']),
+                dependencies=(f'folder:{group_name}',),
+            ))
+    return tasks
+
+
+def provision(grafana_api: GrafanaFace, gitlab_groups_and_users: Dict,
+              upload_dashboards: Optional[Callable[[str, int], Any]] = None, max_workers: int = 8,
+              ensure_user: Optional[Callable[[User], Dict]] = None) -> Dict:
+    """
+    Concurrent equivalent of generate_grafana_users, generate_teams_and_assign_users and
+    generate_folders_and_assign_privileges in manage_users.__main__.
+    The wall, critical path and sequential seconds of the run are recorded in METRICS as
+    orchestrator.wall, orchestrator.critical_path and orchestrator.sequential.
+    :return: the teams in the shape returned by generate_folders_and_assign_privileges
+    """
+    # Requests keeps at most 10 connections per host by default, discarding the rest after every call
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    grafana_api.api.s.mount('http://', adapter)
+    grafana_api.api.s.mount('https://', adapter)
+    # Filled once up front, instead of by the first user tasks concurrently
+    get_all_cached_users(grafana_api)
+
+    tasks = provisioning_tasks(grafana_api, gitlab_groups_and_users, upload_dashboards, ensure_user)
+    graph_run = run_graph(tasks, max_workers)
+    METRICS.record('orchestrator.wall', graph_run.wall_seconds)
+    METRICS.record('orchestrator.critical_path', graph_run.critical_path_seconds)
+    METRICS.record('orchestrator.sequential', graph_run.task_seconds)
+    _LOG.info(f"Critical path: {' -> '.join(graph_run.critical_path)}")
+    results = graph_run.results
+    return {
+        group_name: {
+            "team_id": results[f'team:{group_name}']['teamId'],
+            "members": [{"username": member['username'], "user_id": results[f'user:{member["username"]}']['id']}
+                        for member in group['members']],
+            "gitlab_group": group,
+            "folder_uid": results[f'folder:{group_name}']['uid'],
+        }
+        for group_name, group in gitlab_groups_and_users.items()
+    }
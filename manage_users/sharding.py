@@ -0,0 +1,191 @@
+import dataclasses
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from manage_users.api import grafana
+from manage_users.api.gitlab import get_groups_and_members
+from manage_users.api.grafana import auth as grafana_auth
+from manage_users.api.grafana import create_user
+from manage_users.config import Config
+from manage_users.instrumentation import METRICS
+from manage_users.models import User
+from manage_users.orchestrator import provision
+
+"""
+Provisions many courses at once by spreading their parent groups over worker processes.
+
+Every process has its own Grafana session and worker pool. Students taking several courses are created once:
+a process claims a username in a dict shared through a multiprocessing Manager before creating the user,
+and processes meeting a claimed username wait for the Grafana id of the claiming process instead.
+
+Team and folder titles are the GitLab group names, so they must be unique across the provisioned courses.
+"""
+
+_LOG = logging.getLogger(__name__)
+
+# Claim of a user which is still being created
+_PENDING = -1
+
+
+@dataclasses.dataclass
+class CourseReport:
+    parent_group_id: int
+    groups: int
+    members: int
+    # Users created by this course, the other members were claimed by an earlier course
+    users_created: int
+    seconds: float
+    pid: int
+
+
+@dataclasses.dataclass
+class ShardingReport:
+    courses: List[CourseReport]
+    wall_seconds: float
+    processes: int
+    # Instrumentation of every process, summed per endpoint
+    metrics: Dict[str, Dict]
+
+    @property
+    def users_created(self) -> int:
+        return sum(course.users_created for course in self.courses)
+
+    def to_json_data(self) -> Dict:
+        return {
+            'wall_seconds': self.wall_seconds,
+            'processes': self.processes,
+            'users_created': self.users_created,
+            'courses': [dataclasses.asdict(course) for course in self.courses],
+            'metrics': self.metrics,
+        }
+
+
+def partition(parent_group_ids: List[int], shards: int) -> List[List[int]]:
+    """
+    Deals the parent groups round robin over at most shards non-empty shards
+    """
+    return [shard for shard in (parent_group_ids[n::shards] for n in range(shards)) if shard]
+
+
+def claiming_user_creator(create: Callable[[User], Dict], claims, lock, timeout_s: float = 120.0,
+                          poll_s: float = 0.05) -> Callable[[User], Dict]:
+    """
+    Wraps create so every login is created once across all processes sharing claims and lock.
+    The returned function adds "created": False to the result if another caller created the user.
+
+    :param claims: Manager dict of login -> Grafana user id, or _PENDING while being created
+    :param lock: Manager lock guarding the check and claim of a login
+    """
+    def ensure_user(user: User) -> Dict:
+        login = user['login']
+        with lock:
+            claimed = login in claims
+            if not claimed:
+                claims[login] = _PENDING
+        if not claimed:
+            try:
+                response = create(user)
+            except Exception:
+                # Waiting processes fail instead of waiting for a user which will never exist
+                with lock:
+                    del claims[login]
+                raise
+            claims[login] = response['id']
+            return {**response, 'created': True}
+
+        deadline = time.monotonic() + timeout_s
+        while True:
+            user_id = claims.get(login)
+            if user_id is None:
+                raise RuntimeError(f"Creating user {login} failed in another process")
+            if user_id != _PENDING:
+                return {'id': user_id, 'created': False}
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"User {login} was not created within {timeout_s} s")
+            time.sleep(poll_s)
+    return ensure_user
+
+
+def provision_shard(config: Config, parent_group_ids: List[int], claims, lock, max_workers: int) -> Dict:
+    """
+    Runs in a worker process, provisions the courses of one shard one after another
+    :return: Dict({ "courses": [ CourseReport, ... ], "metrics": METRICS.report() })
+    """
+    METRICS.reset()
+    # Forked processes inherit the email cache of the parent, which may belong to another Grafana
+    grafana.cached_user_emails = set()
+    grafana_api = grafana_auth(host=config.grafana_host, username=config.grafana_user,
+                               password=config.grafana_password)
+    created = set()
+    created_lock = threading.Lock()
+    claim = claiming_user_creator(lambda user: create_user(grafana_api, user), claims, lock)
+
+    def ensure_user(user: User) -> Dict:
+        response = claim(user)
+        if response['created']:
+            with created_lock:
+                created.add(user['login'])
+        return response
+
+    courses = []
+    for parent_group_id in parent_group_ids:
+        start = time.perf_counter()
+        created_before = len(created)
+        gitlab_groups_and_users = get_groups_and_members(config.gitlab_token, parent_group_id, config.gitlab_api_url)
+        provision(grafana_api, gitlab_groups_and_users, max_workers=max_workers, ensure_user=ensure_user)
+        courses.append(CourseReport(
+            parent_group_id=parent_group_id,
+            groups=len(gitlab_groups_and_users),
+            members=sum(len(group['members']) for group in gitlab_groups_and_users.values()),
+            users_created=len(created) - created_before,
+            seconds=time.perf_counter() - start,
+            pid=os.getpid(),
+        ))
+        _LOG.info(f"Provisioned course {parent_group_id} in {courses[-1].seconds:.1f} s")
+    return {'courses': courses, 'metrics': METRICS.report()}
+
+
+def merge_metrics(reports: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    merged: Dict[str, Dict] = {}
+    counters = ['calls', 'errors', 'retries', 'bytes_sent', 'bytes_received', 'total_seconds']
+    for report in reports:
+        for endpoint, metrics in report.items():
+            totals = merged.setdefault(endpoint, {counter: 0 for counter in counters})
+            for counter in counters:
+                totals[counter] += metrics[counter]
+    for totals in merged.values():
+        totals['mean_seconds'] = totals['total_seconds'] / totals['calls'] if totals['calls'] else 0.0
+    return dict(sorted(merged.items()))
+
+
+def provision_courses(config: Config, parent_group_ids: List[int], processes: Optional[int] = None,
+                      max_workers: int = 8) -> ShardingReport:
+    """
+    Provisions every course, spread over processes worker processes with max_workers concurrent
+    Grafana calls each
+    """
+    shards = partition(parent_group_ids, processes or os.cpu_count() or 1)
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager:
+        claims = manager.dict()
+        lock = manager.Lock()
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(provision_shard, config, shard, claims, lock, max_workers)
+                       for shard in shards]
+            results = [future.result() for future in futures]
+
+    report = ShardingReport(
+        courses=sorted((course for result in results for course in result['courses']),
+                       key=lambda course: parent_group_ids.index(course.parent_group_id)),
+        wall_seconds=time.perf_counter() - start,
+        processes=len(shards),
+        metrics=merge_metrics([result['metrics'] for result in results]),
+    )
+    _LOG.info(f"Provisioned {len(parent_group_ids)} courses with {report.processes} processes "
+              f"in {report.wall_seconds:.1f} s, {report.users_created} users created")
+    return report
@@ -0,0 +1,116 @@
+import dataclasses
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection, TRANSACTION_STATUS_IDLE
+
+from manage_users.instrumentation import METRICS
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class StatementStats:
+    calls: int = 0
+    total_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+
+class StatementRegistry:
+    """
+    Named queries which are prepared once per connection and then executed with parameters,
+    so Postgres skips parsing and planning on repeated lookups.
+    Tracks the number of calls and cumulative latency of every statement.
+
+    Statements use Postgres placeholders ($1, $2, ...) instead of %s.
+    """
+
+    def __init__(self):
+        self._statements: Dict[str, str] = {}
+        self._stats: Dict[str, StatementStats] = {}
+        # Backend pid and statements prepared per connection, keyed by id(connection)
+        # since psycopg2 connections can't be weakly referenced. A new pid means a new session.
+        self._prepared: Dict[int, Tuple[int, Set[str]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, sql: str) -> None:
+        if name in self._statements and self._statements[name] != sql:
+            raise ValueError(f"Statement {name} is already registered with another query")
+        self._statements[name] = sql
+        self._stats.setdefault(name, StatementStats())
+
+    def _prepare(self, conn: connection, curs, name: str) -> None:
+        backend_pid = conn.info.backend_pid
+        with self._lock:
+            pid, prepared = self._prepared.get(id(conn), (None, set()))
+            if pid != backend_pid:
+                prepared = set()
+                self._prepared[id(conn)] = (backend_pid, prepared)
+        if name not in prepared:
+            curs.execute(f'PREPARE {name} AS {self._statements[name]}')
+            prepared.add(name)
+
+    def _execute(self, conn: connection, name: str, params: Tuple) -> List:
+        placeholders = f' ({", ".join(["%s"] * len(params))})' if params else ''
+        with conn.cursor() as curs:
+            self._prepare(conn, curs, name)
+            curs.execute(f'EXECUTE {name}{placeholders}', params)
+            return curs.fetchall() if curs.description else []
+
+    def forget(self, conn: connection) -> None:
+        """
+        Drops the bookkeeping of conn, call when closing it. ConnectionPool does so for the connections it closes.
+        """
+        with self._lock:
+            self._prepared.pop(id(conn), None)
+
+    def execute(self, conn: connection, name: str, params: Optional[Tuple] = None) -> List:
+        """
+        Executes the named statement on conn, preparing it first if this connection hasn't yet.
+        Statements lost by the session, e.g. after DISCARD ALL, are prepared again, unless conn is in the middle
+        of a transaction of the caller, which the failed statement aborted.
+        :return: all result rows, or [] for statements without a result set
+        """
+        params = tuple(params or ())
+        # Rolling back the failed statement must not discard work of the caller
+        can_retry = conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        start = time.perf_counter()
+        error = True
+        try:
+            try:
+                rows = self._execute(conn, name, params)
+            except psycopg2.errors.InvalidSqlStatementName:
+                self.forget(conn)
+                if not can_retry:
+                    raise
+                _LOG.warning(f"Prepared statement {name} disappeared, preparing it again")
+                METRICS.record_retry(f'postgres.{name}')
+                conn.rollback()
+                rows = self._execute(conn, name, params)
+            error = False
+            return rows
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stats = self._stats[name]
+                stats.calls += 1
+                stats.total_seconds += seconds
+            METRICS.record(f'postgres.{name}', seconds, error=error)
+
+    def stats(self) -> Dict[str, StatementStats]:
+        """
+        :return: copy of the statistics, ordered by cumulative latency, most expensive first
+        """
+        with self._lock:
+            ordered = sorted(self._stats.items(), key=lambda item: item[1].total_seconds, reverse=True)
+            return {name: dataclasses.replace(stats) for name, stats in ordered}
+
+
+# Registry shared by every lookup in manage_users.db_connector
+STATEMENTS = StatementRegistry()
@@ -0,0 +1,8 @@
+"""
+Names of the tables manage_users maintains in the analytics database.
+The dashboards read them, so this module must not import psycopg2, grafana_api or anything else
+beyond the standard library.
+"""
+
+# Canonical GitLab username of every author email, see manage_users.aliases
+AUTHOR_ALIAS_TABLE = 'authoralias'
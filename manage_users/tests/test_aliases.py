@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+
+import manage_users.__main__ as manage_users_main
+from generate_dashboards.dashboard.group_overview import user_filter_variables
+from generate_dashboards.tests.test_running_totals import executed_sql, recording_connection
+from manage_users import aliases as aliases_module
+from manage_users.aliases import resolve_author_aliases, save_author_aliases, AuthorAlias, MATCHED_USERNAME, \
+    MATCHED_GRAFANA_EMAIL, MATCHED_NAME, UNMATCHED
+from manage_users.config import Config
+from manage_users.tables import AUTHOR_ALIAS_TABLE
+
+GITLAB_GROUPS = {
+    'group1': {
+        'group_id': 1,
+        'group_name': 'group1',
+        'parent_group_id': 0,
+        'members': [
+            {'member_id': 10, 'username': 'olan', 'name': 'Ola Nordmann'},
+            {'member_id': 11, 'username': 'karin', 'name': 'Kari Nordmann'},
+            {'member_id': 12, 'username': 'pers', 'name': 'Per Sandberg'},
+        ],
+    },
+}
+
+GRAFANA_USERS = [
+    {'id': 2, 'login': 'olan', 'email': 'olan@stud.ntnu.no'},
+    {'id': 3, 'login': 'karin', 'email': 'kari.private@gmail.com'},
+    {'id': 4, 'login': 'pers', 'email': 'pers@stud.ntnu.no'},
+]
+
+
+class AliasCases(unittest.TestCase):
+    def test_resolves_every_match_kind(self):
+        aliases = resolve_author_aliases(
+            {'group1': ['olan@stud.ntnu.no', 'Kari.Private@gmail.com', 'per.sandberg@gmail.com', 'bot@example.com']},
+            GITLAB_GROUPS,
+            GRAFANA_USERS,
+        )
+        resolved = {alias.author_email: (alias.username, alias.grafana_user_id, alias.matched_by) for alias in aliases}
+        self.assertEqual(resolved, {
+            'olan@stud.ntnu.no': ('olan', 2, MATCHED_USERNAME),
+            'Kari.Private@gmail.com': ('karin', 3, MATCHED_GRAFANA_EMAIL),
+            'per.sandberg@gmail.com': ('pers', 4, MATCHED_NAME),
+            'bot@example.com': ('bot@example.com', None, UNMATCHED),
+        })
+
+    def test_members_of_other_groups_are_not_matched(self):
+        aliases = resolve_author_aliases({'group2': ['olan@gmail.com']}, GITLAB_GROUPS, [])
+        self.assertEqual(aliases[0].matched_by, UNMATCHED)
+
+    def test_save_prunes_the_aliases_which_no_longer_resolve(self):
+        aliases = [AuthorAlias('group1', 'olan@stud.ntnu.no', 'olan', 2, MATCHED_USERNAME)]
+        conn = recording_connection()
+        with mock.patch.object(aliases_module, 'execute_values') as upsert:
+            save_author_aliases(conn, aliases)
+            self.assertEqual(executed_sql(conn), [])
+            save_author_aliases(conn, aliases, prune=True)
+        self.assertEqual(upsert.call_count, 2)
+        [delete] = conn.cursor.return_value.execute.call_args_list
+        self.assertIn(f'DELETE FROM {AUTHOR_ALIAS_TABLE}', delete.args[0])
+        self.assertEqual(delete.args[1], (['group1'], ['olan@stud.ntnu.no']))
+
+    def test_filter_lists_the_authors_without_an_alias(self):
+        authors, users = user_filter_variables('group1', use_author_aliases=True)
+        for variable in (authors, users):
+            self.assertIn(f'LEFT JOIN {AUTHOR_ALIAS_TABLE} AS alias', variable['query'])
+            self.assertIn('FROM changecontribution', variable['query'])
+        self.assertIn('SELECT DISTINCT COALESCE(alias.username, contribution.author_email)', authors['query'])
+        self.assertIn('WHERE COALESCE(alias.username, contribution.author_email) IN (${filter_authors})',
+                      users['query'])
+
+    def test_synced_with_the_users_when_the_database_is_configured(self):
+        grafana_api = mock.Mock()
+        with mock.patch.object(manage_users_main, 'connect') as connect, \
+                mock.patch.object(manage_users_main, 'sync_author_aliases', return_value=[]) as sync:
+            self.assertIsNone(manage_users_main.sync_aliases(Config(), grafana_api, GITLAB_GROUPS))
+            connect.assert_not_called()
+
+            config = Config(db_host='localhost', db_name='analytics', db_user='grafana', db_password='password')
+            self.assertEqual(manage_users_main.sync_aliases(config, grafana_api, GITLAB_GROUPS), [])
+            sync.assert_called_once_with(connect.return_value, grafana_api, GITLAB_GROUPS)
+            connect.return_value.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
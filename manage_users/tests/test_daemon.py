@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+import unittest
+
+import requests
+
+from benchmarks.standins import GitLabStandIn, GrafanaStandIn
+from manage_users.api import grafana
+from manage_users.config import Config
+from manage_users.daemon import ADD_MEMBER, REMOVE_MEMBER, ChangeBuffer, MembershipChange, SyncDaemon, \
+    changes_from_event, webhook_server
+
+
+def member_event(event_name, group_name, username):
+    return {'event_name': event_name, 'group_name': group_name, 'group_id': 1, 'user_username': username,
+            'user_name': username.capitalize(), 'user_id': 1}
+
+
+class ChangeBufferCases(unittest.TestCase):
+    def test_translates_member_events(self):
+        self.assertEqual(changes_from_event(member_event('user_remove_from_group', 'group0', 'olan')),
+                         [MembershipChange(REMOVE_MEMBER, 'group0', 'olan', 'Olan', 1)])
+        self.assertEqual(changes_from_event({'event_name': 'project_create'}), [])
+
+    def test_coalesces_burst_into_latest_change_per_membership(self):
+        buffer = ChangeBuffer(debounce_s=0.05)
+        for event_name in ['user_add_to_group', 'user_remove_from_group', 'user_add_to_group']:
+            buffer.add(changes_from_event(member_event(event_name, 'group0', 'olan')))
+        buffer.add(changes_from_event(member_event('user_add_to_group', 'group0', 'karin')))
+
+        changes, reconcile = buffer.wait(timeout_s=1.0)
+        self.assertEqual([(change.action, change.username) for change in changes],
+                         [(ADD_MEMBER, 'olan'), (ADD_MEMBER, 'karin')])
+        self.assertFalse(reconcile)
+        self.assertEqual(buffer.wait(timeout_s=0.01), ([], False))
+
+    def test_waits_for_quiet_period_up_to_max_delay(self):
+        buffer = ChangeBuffer(debounce_s=0.1, max_delay_s=0.25)
+        start = time.monotonic()
+
+        def keep_adding():
+            while time.monotonic() - start < 0.6:
+                buffer.add([MembershipChange(ADD_MEMBER, 'group0', 'olan')])
+                time.sleep(0.02)
+
+        thread = threading.Thread(target=keep_adding)
+        thread.start()
+        changes, _ = buffer.wait(timeout_s=1.0)
+        waited = time.monotonic() - start
+        thread.join()
+        self.assertEqual(len(changes), 1)
+        self.assertGreaterEqual(waited, 0.25)
+        self.assertLess(waited, 0.5)
+
+
+class SyncDaemonCases(unittest.TestCase):
+    def test_webhooks_update_grafana(self):
+        with GitLabStandIn() as gitlab, GrafanaStandIn() as grafana_server:
+            gitlab.add_group(1, 10, 'group0', [{'id': 1, 'username': 'olan', 'name': 'Ola Nordmann'}])
+            grafana.cached_user_emails = set()
+            config = Config(gitlab_token='token', gitlab_api_url=gitlab.api_url, parent_group_id=1)
+            sync_daemon = SyncDaemon(config, grafana.auth(host=grafana_server.address, username='admin',
+                                                          password='admin'), ChangeBuffer(debounce_s=0.05))
+            server = webhook_server(sync_daemon.submit, port=0, secret_token='secret')
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            daemon_thread = threading.Thread(target=sync_daemon.run)
+            daemon_thread.start()
+            try:
+                url = f'http://127.0.0.1:{server.server_address[1]}'
+                self.assertEqual(requests.post(url, data='{}').status_code, 401)
+                self.assertEqual(requests.post(url, data='{}', headers={'X-Gitlab-Token': 'secre'}).status_code, 401)
+
+                # The initial reconciliation creates the team of group0 with olan
+                deadline = time.monotonic() + 5
+                while len(grafana_server.team_members.get(2, [])) + len(grafana_server.teams) < 2:
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.02)
+
+                for event in [member_event('user_add_to_group', 'group0', 'karin'),
+                              member_event('user_remove_from_group', 'group0', 'olan')]:
+                    response = requests.post(url, data=json.dumps(event), headers={'X-Gitlab-Token': 'secret'})
+                    self.assertEqual(response.status_code, 202)
+
+                team_id = next(iter(grafana_server.teams))
+                logins = {user['id']: user['login'] for user in grafana_server.users.values()}
+                while {logins.get(user_id) for user_id in grafana_server.team_members[team_id]} != {'karin'}:
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.02)
+                    logins = {user['id']: user['login'] for user in grafana_server.users.values()}
+            finally:
+                sync_daemon.stop()
+                daemon_thread.join()
+                server.shutdown()
+                grafana.cached_user_emails = set()
@@ -0,0 +1,175 @@
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from manage_users import db_connector
+from manage_users.db_connector import ConnectionPool, get_authors_by_repo_ids, get_group_repository_authors, \
+    stream_db_conn
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = TRANSACTION_STATUS_IDLE
+        self.broken = False
+        self.pings = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return mock.MagicMock(**{'__enter__.return_value.execute.side_effect': self._ping})
+
+    def _ping(self, query):
+        self.pings += 1
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakePool:
+    """
+    ThreadedConnectionPool handing out FakeConnections, which fails instead of blocking once maxconn are in use
+    """
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.maxconn = maxconn
+        self.idle = []
+        self.used = set()
+        self.closed = []
+
+    def getconn(self):
+        if len(self.used) >= self.maxconn:
+            raise psycopg2.pool.PoolError("connection pool exhausted")
+        conn = self.idle.pop() if self.idle else FakeConnection()
+        self.used.add(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.used.remove(conn)
+        if close:
+            conn.closed = 1
+            self.closed.append(conn)
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        pass
+
+
+class ConnectionPoolCases(unittest.TestCase):
+    def pool(self, **kwargs) -> ConnectionPool:
+        with mock.patch.object(db_connector, 'ThreadedConnectionPool', FakePool):
+            return ConnectionPool(dbname='analytics', user='grafana', host='localhost', password='password', **kwargs)
+
+    def test_connections_are_reused_and_rolled_back(self):
+        pool = self.pool(maxconn=2)
+        with pool.connection() as conn:
+            conn.status = TRANSACTION_STATUS_INTRANS
+        self.assertEqual(conn.status, TRANSACTION_STATUS_IDLE)
+        with pool.connection() as reused:
+            self.assertIs(reused, conn)
+        # Pinged when it was first borrowed, but not after it was returned recently
+        self.assertEqual(conn.pings, 1)
+
+    def test_failed_rollback_discards_the_connection(self):
+        pool = self.pool(maxconn=1, borrow_timeout_s=0.1)
+        with pool.connection() as conn:
+            conn.status = TRANSACTION_STATUS_INTRANS
+            conn.broken = True
+        self.assertEqual(pool._pool.closed, [conn])
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, conn)
+
+    def test_idle_connections_are_checked_before_use(self):
+        pool = self.pool(maxconn=2, health_check_after_s=0.0)
+        with pool.connection() as conn:
+            pass
+        with pool.connection() as healthy:
+            self.assertIs(healthy, conn)
+        self.assertEqual(conn.pings, 2)
+
+        conn.broken = True
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, conn)
+        self.assertEqual(pool._pool.closed, [conn])
+
+    def test_borrowing_blocks_until_a_connection_is_returned(self):
+        pool = self.pool(maxconn=1, borrow_timeout_s=0.05)
+        conn = pool.getconn()
+        with self.assertRaises(TimeoutError):
+            pool.getconn()
+
+        threading.Timer(0.02, pool.putconn, args=(conn,)).start()
+        pool._borrow_timeout_s = 1.0
+        self.assertIs(pool.getconn(), conn)
+
+
+class StreamCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = mock.MagicMock()
+        self.curs = self.conn.cursor.return_value
+        self.rows = [(f'group{n}', n) for n in range(5)]
+
+    def test_rows_come_from_a_named_server_side_cursor(self):
+        self.curs.__iter__.return_value = iter(self.rows)
+        self.assertEqual(list(stream_db_conn(self.conn, 'SELECT 1', itersize=2)), self.rows)
+        name = self.conn.cursor.call_args.kwargs['name']
+        self.assertTrue(name.startswith('stream_'))
+        self.assertEqual(self.curs.itersize, 2)
+        self.curs.execute.assert_called_once_with('SELECT 1', None)
+        self.curs.close.assert_called_once()
+
+        list(stream_db_conn(self.conn, 'SELECT 1'))
+        self.assertNotEqual(self.conn.cursor.call_args.kwargs['name'], name)
+
+    def test_batches_of_itersize_rows(self):
+        self.curs.fetchmany.side_effect = [self.rows[:2], self.rows[2:4], self.rows[4:], []]
+        self.assertEqual(list(stream_db_conn(self.conn, 'SELECT 1', itersize=2, batches=True)),
+                         [self.rows[:2], self.rows[2:4], self.rows[4:]])
+        self.assertEqual({call.args for call in self.curs.fetchmany.call_args_list}, {(2,)})
+        self.curs.close.assert_called_once()
+
+    def test_cursor_is_closed_when_the_query_fails(self):
+        self.curs.execute.side_effect = psycopg2.errors.QueryCanceled("canceling statement due to statement timeout")
+        with self.assertRaises(psycopg2.errors.QueryCanceled):
+            list(stream_db_conn(self.conn, 'SELECT 1'))
+        self.curs.close.assert_called_once()
+
+
+class BatchedAuthorCases(unittest.TestCase):
+    def test_every_repository_is_resolved_in_one_query(self):
+        with mock.patch.object(db_connector.STATEMENTS, 'execute',
+                               return_value=[(1, ['kari@x', 'ola@x']), (3, ['per@x'])]) as execute:
+            authors = get_authors_by_repo_ids(mock.Mock(), (1, 2, 3))
+        self.assertEqual(authors, {1: ['kari@x', 'ola@x'], 2: [], 3: ['per@x']})
+        execute.assert_called_once()
+        self.assertEqual(execute.call_args.args[1:], ('authors_by_repo_ids', ([1, 2, 3],)))
+
+    def test_rows_are_grouped_per_group_and_repository(self):
+        rows = [('group0', 1, ['ola@x']), ('group0', 2, ['kari@x', 'ola@x']), ('group1', 3, ['per@x'])]
+        with mock.patch.object(db_connector, 'query_db_conn', return_value=rows) as query:
+            index = get_group_repository_authors(mock.Mock())
+            self.assertEqual(index, {
+                'group0': {1: ['ola@x'], 2: ['kari@x', 'ola@x']},
+                'group1': {3: ['per@x']},
+            })
+            self.assertNotIn('WHERE', query.call_args.args[1])
+            self.assertIsNone(query.call_args.args[2])
+
+            since = datetime(2022, 1, 1)
+            get_group_repository_authors(mock.Mock(), since=since)
+            self.assertIn('WHERE "timestamp" >= (%s)', query.call_args.args[1])
+            self.assertEqual(query.call_args.args[2], (since,))
+        self.assertEqual(query.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+
+from manage_users.instrumentation import Instrumentation
+
+
+class InstrumentationCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = Instrumentation(buckets=(0.1, 1.0))
+
+    def test_counts_calls_and_errors(self):
+        @self.metrics.instrumented('grafana')
+        def create_user(fail: bool):
+            if fail:
+                raise ValueError("Failed")
+            return 'created'
+
+        self.assertEqual(create_user(False), 'created')
+        with self.assertRaises(ValueError):
+            create_user(True)
+
+        report = self.metrics.report()['grafana.create_user']
+        self.assertEqual(report['calls'], 2)
+        self.assertEqual(report['errors'], 1)
+        self.assertEqual(sum(report['histogram'].values()), 2)
+
+    def test_bytes_and_retries_belong_to_innermost_call(self):
+        @self.metrics.instrumented('gitlab')
+        def get_members():
+            self.metrics.record_bytes(sent=10, received=200)
+            self.metrics.record_retry()
+
+        @self.metrics.instrumented('gitlab')
+        def get_groups_and_members():
+            get_members()
+
+        get_groups_and_members()
+        report = self.metrics.report()
+        self.assertEqual(report['gitlab.get_members']['bytes_received'], 200)
+        self.assertEqual(report['gitlab.get_members']['retries'], 1)
+        self.assertEqual(report['gitlab.get_groups_and_members']['bytes_received'], 0)
+
+    def test_histogram_buckets(self):
+        for seconds in [0.05, 0.5, 0.5, 5.0]:
+            self.metrics.record('postgres.query', seconds)
+        histogram = self.metrics.report()['postgres.query']['histogram']
+        self.assertEqual(histogram, {'0.1': 1, '1.0': 2, '+Inf': 1})
+
+        text = self.metrics.prometheus_text()
+        self.assertIn('grafana_manager_calls_total{endpoint="postgres.query"} 4', text)
+        self.assertIn('grafana_manager_call_duration_seconds_bucket{endpoint="postgres.query",le="1.0"} 3', text)
+        self.assertIn('grafana_manager_call_duration_seconds_bucket{endpoint="postgres.query",le="+Inf"} 4', text)
+
+    def test_write_reports(self):
+        self.metrics.record('grafana.upload_to_grafana', 0.2)
+        with tempfile.TemporaryDirectory() as directory:
+            self.metrics.write_reports(directory, name='run')
+            with open(os.path.join(directory, 'run.json')) as file:
+                self.assertEqual(json.load(file)['grafana.upload_to_grafana']['calls'], 1)
+            self.assertTrue(os.path.exists(os.path.join(directory, 'run.prom')))
+
+
+if __name__ == '__main__':
+    unittest.main()
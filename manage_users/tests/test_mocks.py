@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+
+from manage_users.mocks import BulkMocks, write_jsonl
+
+
+class BulkMockCases(unittest.TestCase):
+    def test_same_seed_gives_same_entities(self):
+        self.assertEqual(list(BulkMocks(seed=3).users(100)), list(BulkMocks(seed=3).users(100)))
+        self.assertNotEqual(list(BulkMocks(seed=3).users(100)), list(BulkMocks(seed=4).users(100)))
+
+    def test_unique_logins_emails_and_team_names(self):
+        mocks = BulkMocks(pool_size=10)
+        users = list(mocks.users(5000)) + list(mocks.users(5000, start=5000))
+        self.assertEqual(len({user['login'] for user in users}), 10000)
+        self.assertEqual(len({user['email'] for user in users}), 10000)
+        self.assertEqual(len({team['name'] for team in mocks.teams(1000)}), 1000)
+
+    def test_batches_continue_the_running_numbers(self):
+        mocks = BulkMocks(pool_size=10)
+        first_batch, second_batch = mocks.users(500), mocks.users(500)
+        users = list(second_batch) + list(first_batch) + list(mocks.users(500))
+        self.assertEqual(len({user['login'] for user in users}), 1500)
+        teams = list(mocks.teams(100)) + list(mocks.teams(100))
+        self.assertEqual(len({team['name'] for team in teams}), 200)
+        # An explicit start is an override and does not rewind the counter
+        self.assertRegex(next(mocks.users(1, start=0))['login'], r'^\D+0$')
+        self.assertRegex(next(mocks.users(1))['login'], r'^\D+1500$')
+
+    def test_gitlab_groups(self):
+        groups = list(BulkMocks().gitlab_groups(11911, groups=20, members_per_group=4))
+        members = [member for group in groups for member in group['members']]
+        self.assertEqual({group['parent_id'] for group in groups}, {11911})
+        self.assertEqual(len({member['username'] for member in members}), 80)
+        self.assertEqual(sorted(member['id'] for member in members), list(range(1, 81)))
+
+    def test_gitlab_groups_of_several_courses_do_not_collide(self):
+        mocks = BulkMocks(pool_size=10)
+        first_course = mocks.gitlab_groups(1042, groups=10, members_per_group=5)
+        second_course = mocks.gitlab_groups(11911, groups=10, members_per_group=5)
+        groups = list(second_course) + list(first_course)
+        members = [member for group in groups for member in group['members']]
+        self.assertEqual(len({group['id'] for group in groups}), 20)
+        self.assertEqual(len({group['name'] for group in groups}), 20)
+        self.assertEqual(len({member['id'] for member in members}), 100)
+        self.assertEqual(len({member['username'] for member in members}), 100)
+
+    def test_write_jsonl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl')
+            self.assertEqual(write_jsonl(BulkMocks().users(10), path), 10)
+            with open(path) as file:
+                self.assertEqual([json.loads(line) for line in file], list(BulkMocks().users(10)))
@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+
+from benchmarks.standins import GrafanaStandIn
+from manage_users.api import grafana
+from manage_users.instrumentation import METRICS
+from manage_users.orchestrator import Task, provision, run_graph
+
+
+class RunGraphCases(unittest.TestCase):
+    def test_dependencies_receive_results(self):
+        graph_run = run_graph([
+            Task('a', lambda _: 1),
+            Task('b', lambda _: 2),
+            Task('sum', lambda inputs: inputs['a'] + inputs['b'], dependencies=('a', 'b')),
+        ])
+        self.assertEqual(graph_run.results['sum'], 3)
+
+    def test_independent_tasks_overlap_and_critical_path(self):
+        def sleep(seconds):
+            return lambda _: time.sleep(seconds)
+
+        graph_run = run_graph([
+            Task('slow', sleep(0.2)),
+            Task('after slow', sleep(0.1), dependencies=('slow',)),
+            *[Task(f'fast{n}', sleep(0.1)) for n in range(4)],
+        ], max_workers=8)
+        self.assertEqual(graph_run.critical_path, ['slow', 'after slow'])
+        self.assertLess(graph_run.wall_seconds, 0.45)
+        self.assertGreater(graph_run.task_seconds, 0.6)
+
+    def test_failure_stops_dependents(self):
+        started = []
+        lock = threading.Lock()
+
+        def record(name):
+            def run(_):
+                with lock:
+                    started.append(name)
+            return run
+
+        def fail(_):
+            raise RuntimeError("Failed")
+
+        with self.assertRaises(RuntimeError):
+            run_graph([Task('fail', fail), Task('after', record('after'), dependencies=('fail',))])
+        self.assertEqual(started, [])
+
+    def test_invalid_graphs(self):
+        with self.assertRaises(ValueError):
+            run_graph([Task('a', lambda _: None, dependencies=('missing',))])
+        with self.assertRaises(ValueError):
+            run_graph([Task('a', lambda _: None, dependencies=('b',)), Task('b', lambda _: None, dependencies=('a',))])
+
+
+class ProvisionCases(unittest.TestCase):
+    def test_provision_against_stand_in(self):
+        groups = {
+            f'group{n}': {
+                'group_id': n, 'group_name': f'group{n}', 'parent_group_id': 1,
+                # student0 is a member of every group
+                'members': [{'member_id': m, 'username': f'student{m}', 'name': f'Student {m}'} for m in (0, n + 1)],
+            }
+            for n in range(3)
+        }
+        uploads = []
+        with GrafanaStandIn() as grafana_server:
+            grafana.cached_user_emails = set()
+            grafana_api = grafana.auth(host=grafana_server.address, username='admin', password='admin')
+            METRICS.reset()
+            teams = provision(grafana_api, groups, lambda name, group_id: uploads.append((name, group_id)))
+            grafana.cached_user_emails = set()
+
+            self.assertEqual(len(grafana_server.users), 1 + 4)
+            for name, team in teams.items():
+                self.assertEqual(sorted(grafana_server.team_members[team['team_id']]),
+                                 sorted(member['user_id'] for member in team['members']))
+                self.assertIn({'teamId': team['team_id'], 'permission': 1},
+                              grafana_server.folder_permissions[team['folder_uid']])
+            self.assertEqual(sorted(uploads), sorted((name, group['group_id']) for name, group in groups.items()))
+            self.assertEqual(teams['group1']['folder_uid'], 'gitlab-1-folder')
+
+            # The graph run is recorded, its critical path bounds the wall time from below
+            metrics = METRICS.report()
+            for endpoint in ('orchestrator.wall', 'orchestrator.critical_path', 'orchestrator.sequential'):
+                self.assertEqual(metrics[endpoint]['calls'], 1)
+            critical_path = metrics['orchestrator.critical_path']['total_seconds']
+            self.assertGreater(critical_path, 0)
+            self.assertLessEqual(critical_path, metrics['orchestrator.wall']['total_seconds'])
+            self.assertLessEqual(critical_path, metrics['orchestrator.sequential']['total_seconds'])
@@ -0,0 +1,57 @@
+import threading
+import unittest
+
+from benchmarks.standins import GitLabStandIn, GrafanaStandIn
+from manage_users.config import Config
+from manage_users.sharding import claiming_user_creator, partition, provision_courses
+
+
+class ShardingCases(unittest.TestCase):
+    def test_partition(self):
+        self.assertEqual(partition([1, 2, 3, 4, 5], 2), [[1, 3, 5], [2, 4]])
+        self.assertEqual(partition([1], 4), [[1]])
+
+    def test_claims_create_each_user_once(self):
+        created = []
+        claims, lock = {}, threading.Lock()
+
+        def create(user):
+            created.append(user['login'])
+            return {'id': len(created), 'message': 'User created'}
+
+        ensure_user = claiming_user_creator(create, claims, lock)
+        first = ensure_user({'login': 'olan'})
+        second = ensure_user({'login': 'olan'})
+        self.assertEqual(created, ['olan'])
+        self.assertTrue(first['created'])
+        self.assertEqual(second, {'id': first['id'], 'created': False})
+
+    def test_failed_creation_releases_claim(self):
+        claims, lock = {}, threading.Lock()
+
+        def fail(user):
+            raise ValueError("Failed")
+
+        with self.assertRaises(ValueError):
+            claiming_user_creator(fail, claims, lock)({'login': 'olan'})
+        self.assertEqual(claims, {})
+
+    def test_courses_share_students(self):
+        with GitLabStandIn() as gitlab, GrafanaStandIn() as grafana_server:
+            for course in range(4):
+                for group in range(3):
+                    # student0 takes every course
+                    members = [{'id': 0, 'username': 'student0', 'name': 'Student 0'}] + [
+                        {'id': member, 'username': f'student{member}', 'name': f'Student {member}'}
+                        for member in (course * 100 + group * 2 + 1, course * 100 + group * 2 + 2)]
+                    gitlab.add_group(course, 1000 + course * 10 + group, f'course{course}-group{group}', members)
+
+            config = Config(gitlab_token='token', gitlab_api_url=gitlab.api_url, grafana_host=grafana_server.address)
+            report = provision_courses(config, [0, 1, 2, 3], processes=2, max_workers=4)
+
+            self.assertEqual(report.processes, 2)
+            self.assertEqual(len(grafana_server.users), 1 + 1 + 4 * 3 * 2)
+            self.assertEqual(report.users_created, 1 + 4 * 3 * 2)
+            self.assertEqual(len(grafana_server.teams), 12)
+            self.assertEqual([course.groups for course in report.courses], [3, 3, 3, 3])
+            self.assertGreater(report.metrics['grafana.create_team']['calls'], 0)
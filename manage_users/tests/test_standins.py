@@ -0,0 +1,69 @@
+import unittest
+
+from grafana_api.grafana_api import GrafanaClientError, GrafanaServerError
+
+from benchmarks.standins import GitLabStandIn, GrafanaStandIn, StandInBehaviour
+from generate_dashboards.api import get_dashboard_json, upload_to_grafana
+from generate_dashboards.dashboard.group_overview import group_overview
+from manage_users.api import grafana
+from manage_users.api.gitlab import get_groups_and_members
+from manage_users.models import User, Team
+
+
+class StandInCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.grafana_server = GrafanaStandIn().start()
+        self.gitlab = GitLabStandIn().start()
+        self.GRAFANA_API = grafana.auth(host=self.grafana_server.address, username='admin', password='admin')
+        grafana.cached_user_emails = set()
+
+    def tearDown(self) -> None:
+        self.grafana_server.stop()
+        self.gitlab.stop()
+        grafana.cached_user_emails = set()
+
+    def test_gitlab_groups_and_members(self):
+        self.gitlab.add_course(100, groups=3, members_per_group=2)
+        groups = get_groups_and_members('token', 100, self.gitlab.api_url)
+        self.assertEqual(sorted(groups), ['group0', 'group1', 'group2'])
+        self.assertEqual([member['username'] for member in groups['group1']['members']], ['student3', 'student4'])
+        self.assertEqual(groups['group1']['parent_group_id'], 100)
+
+    def test_users_teams_and_folders(self):
+        user_id = grafana.create_user(self.GRAFANA_API, User({
+            'name': 'Ola Nordmann', 'login': 'olan', 'password': 'somepassword', 'email': 'olan@stud.ntnu.no'}))['id']
+        with self.assertRaises(ValueError):
+            grafana.create_user(self.GRAFANA_API, User({
+                'name': 'Ola Nordmann', 'login': 'olan', 'password': 'somepassword', 'email': 'olan@stud.ntnu.no'}))
+
+        team_id = grafana.create_team(self.GRAFANA_API, Team({'name': 'group0'}))['teamId']
+        grafana.add_user_to_team(self.GRAFANA_API, user_id, team_id)
+        members = grafana.get_team_members_by_team_id(self.GRAFANA_API, team_id)
+        self.assertEqual([member['userId'] for member in members], [user_id])
+        self.assertEqual([team['name'] for team in grafana.get_all_teams(self.GRAFANA_API)], ['group0'])
+
+        folder = grafana.create_folder(self.GRAFANA_API, 'group0')
+        grafana.give_team_folder_read_rights(self.GRAFANA_API, folder['uid'], team_id)
+        self.assertIn({'teamId': team_id, 'permission': 1}, self.grafana_server.folder_permissions[folder['uid']])
+
+        upload_to_grafana(get_dashboard_json(group_overview('group0'), folder['uid']),
+                          self.grafana_server.address, 'api-key')
+        response = upload_to_grafana(get_dashboard_json(group_overview('group0'), folder['uid']),
+                                     self.grafana_server.address, 'api-key')
+        self.assertEqual(response['version'], 2)
+
+        grafana.delete_all_non_admin_users(self.GRAFANA_API)
+        self.assertEqual([user['login'] for user in grafana.get_all_users(self.GRAFANA_API)], ['admin'])
+
+    def test_injected_errors_and_rate_limits(self):
+        with GrafanaStandIn(StandInBehaviour(error_rate=1.0)) as failing:
+            with self.assertRaises(GrafanaServerError):
+                grafana.get_all_teams(grafana.auth(host=failing.address, username='admin', password='admin'))
+
+        with GrafanaStandIn(StandInBehaviour(rate_limit_per_s=0.001, burst=2)) as limited:
+            grafana_api = grafana.auth(host=limited.address, username='admin', password='admin')
+            grafana.get_all_folders(grafana_api)
+            grafana.get_all_folders(grafana_api)
+            with self.assertRaises(GrafanaClientError):
+                grafana.get_all_folders(grafana_api)
+            self.assertEqual(limited.statuses[429], 1)
@@ -0,0 +1,123 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR, TRANSACTION_STATUS_INTRANS
+
+from manage_users import db_connector, statements
+from manage_users.instrumentation import Instrumentation
+from manage_users.statements import StatementRegistry
+from manage_users.tests.test_db_connector import FakeConnection, FakePool
+
+
+class FakeSession:
+    """
+    Connection to a session which keeps the prepared statements on the server side
+    """
+    def __init__(self, backend_pid: int = 100):
+        self.info = SimpleNamespace(backend_pid=backend_pid)
+        self.status = TRANSACTION_STATUS_IDLE
+        self.server_statements = set()
+        self.executed = []
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, session: FakeSession):
+        self.session = session
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        command, name = sql.split()[:2]
+        self.session.executed.append(f'{command} {name}')
+        if command == 'PREPARE':
+            self.session.server_statements.add(name)
+            return
+        if name not in self.session.server_statements:
+            self.session.status = TRANSACTION_STATUS_INERROR
+            raise psycopg2.errors.InvalidSqlStatementName(f'prepared statement "{name}" does not exist')
+        self.session.status = max(self.session.status, TRANSACTION_STATUS_INTRANS)
+        self.description = [('group_id',)]
+        self.params = params
+
+    def fetchall(self):
+        return [self.params]
+
+
+class StatementRegistryCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.statements = StatementRegistry()
+        self.statements.register('activity', 'SELECT MIN("timestamp") FROM changecontribution WHERE group_id=$1')
+        self.conn = FakeSession()
+
+    def test_prepared_once_per_session(self):
+        self.assertEqual(self.statements.execute(self.conn, 'activity', ('group0',)), [('group0',)])
+        self.statements.execute(self.conn, 'activity', ('group1',))
+        self.assertEqual(self.conn.executed, ['PREPARE activity', 'EXECUTE activity', 'EXECUTE activity'])
+
+        # Same connection object, new session
+        self.conn.info.backend_pid = 101
+        self.conn.server_statements.clear()
+        self.statements.execute(self.conn, 'activity', ('group0',))
+        self.assertEqual(self.conn.executed[-2:], ['PREPARE activity', 'EXECUTE activity'])
+        self.assertEqual(self.conn.rollbacks, 0)
+
+    def test_lost_statements_are_prepared_again_once(self):
+        self.statements.execute(self.conn, 'activity', ('group0',))
+        self.conn.rollback()
+        self.conn.server_statements.clear()
+
+        metrics = Instrumentation()
+        with mock.patch.object(statements, 'METRICS', metrics):
+            self.assertEqual(self.statements.execute(self.conn, 'activity', ('group0',)), [('group0',)])
+        self.assertEqual(self.conn.rollbacks, 2)
+        self.assertEqual(metrics.report()['postgres.activity']['calls'], 1)
+        self.assertEqual(metrics.report()['postgres.activity']['retries'], 1)
+        self.assertEqual(self.conn.executed[-3:], ['EXECUTE activity', 'PREPARE activity', 'EXECUTE activity'])
+        self.assertEqual(self.statements.stats()['activity'].calls, 2)
+
+    def test_transaction_of_the_caller_is_not_rolled_back(self):
+        self.statements.execute(self.conn, 'activity', ('group0',))
+        self.conn.server_statements.clear()
+
+        with self.assertRaises(psycopg2.errors.InvalidSqlStatementName):
+            self.statements.execute(self.conn, 'activity', ('group0',))
+        self.assertEqual(self.conn.rollbacks, 0)
+        self.assertEqual(self.statements.stats()['activity'].calls, 2)
+
+        # Once the caller rolled back, the statement is prepared again
+        self.conn.rollback()
+        self.statements.execute(self.conn, 'activity', ('group0',))
+        self.assertEqual(self.conn.executed[-2:], ['PREPARE activity', 'EXECUTE activity'])
+
+    def test_pool_forgets_the_connections_it_closes(self):
+        with mock.patch.object(db_connector, 'ThreadedConnectionPool', FakePool), \
+                mock.patch.object(db_connector, 'STATEMENTS') as statements:
+            pool = db_connector.ConnectionPool(dbname='analytics', user='grafana', host='localhost',
+                                               password='password', maxconn=1)
+            with pool.connection() as conn:
+                conn.status = TRANSACTION_STATUS_INTRANS
+                conn.broken = True
+            statements.forget.assert_called_once_with(conn)
+            self.assertIsInstance(conn, FakeConnection)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from benchmarks.standins import GrafanaStandIn
+from generate_dashboards.__main__ import upload_group_dashboards
+from generate_dashboards.api import get_dashboard_payload, upload_to_grafana
+from generate_dashboards.dashboard.group_overview import group_overview
+from manage_users.api import grafana
+from manage_users.config import Config
+from manage_users.uids import DRILLDOWN, FOLDER, MAX_UID_LENGTH, OVERVIEW, folder_uid, group_uid
+
+
+class UidCases(unittest.TestCase):
+    def test_uids_are_distinct_and_short(self):
+        uids = {group_uid(group_id, kind)
+                for group_id in (1, 12, 121, 10 ** 12) for kind in (FOLDER, OVERVIEW, DRILLDOWN)}
+        self.assertEqual(len(uids), 12)
+        self.assertTrue(all(len(uid) <= MAX_UID_LENGTH for uid in uids))
+        self.assertEqual(folder_uid(11911), 'gitlab-11911-folder')
+        with self.assertRaises(ValueError):
+            group_uid(1, 'over-view')
+
+    def test_folders_and_dashboards_are_addressed_directly(self):
+        with GrafanaStandIn() as grafana_server:
+            grafana_api = grafana.auth(host=grafana_server.address, username='admin', password='admin')
+            created = grafana.create_folder(grafana_api, 'group0', folder_uid(42))
+            self.assertEqual(grafana.create_folder(grafana_api, 'group0', folder_uid(42))['id'], created['id'])
+
+            config = Config(grafana_host=grafana_server.address, grafana_api_key='api-key')
+            upload_group_dashboards(config, 'group0', 42)
+            responses = upload_group_dashboards(config, 'group0', 42)
+            self.assertEqual([response['uid'] for response in responses],
+                             [group_uid(42, OVERVIEW), group_uid(42, DRILLDOWN)])
+            self.assertEqual([response['version'] for response in responses], [2, 2])
+            self.assertEqual(grafana_server.requests['GET /api/folders'], 0)
+            # The folder belongs to another GitLab group
+            with self.assertRaises(ValueError):
+                grafana.create_folder(grafana_api, 'group0', folder_uid(43))
+
+    def test_folders_follow_the_gitlab_group(self):
+        with GrafanaStandIn() as grafana_server:
+            grafana_api = grafana.auth(host=grafana_server.address, username='admin', password='admin')
+            # Created before the uids were derived
+            legacy = grafana.create_folder(grafana_api, 'group0')
+            grafana.give_team_folder_read_rights(grafana_api, legacy['uid'], 2)
+            upload_to_grafana(get_dashboard_payload(group_overview('group0'), folder_uid=legacy['uid']),
+                              grafana_server.address, 'api-key')
+
+            migrated = grafana.create_folder(grafana_api, 'group0', folder_uid(42))
+            self.assertEqual((migrated['id'], migrated['uid']), (legacy['id'], folder_uid(42)))
+            self.assertEqual(set(grafana_server.folders), {folder_uid(42)})
+            self.assertEqual({dashboard['folderUid'] for dashboard in grafana_server.dashboards.values()},
+                             {folder_uid(42)})
+            self.assertTrue(grafana_server.folder_permissions[folder_uid(42)])
+
+            renamed = grafana.create_folder(grafana_api, 'group0 renamed', folder_uid(42))
+            self.assertEqual((renamed['id'], renamed['title']), (legacy['id'], 'group0 renamed'))
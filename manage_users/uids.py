@@ -0,0 +1,41 @@
+import re
+
+"""
+Grafana uids of the folder and dashboards of a GitLab group, derived from the id of the group.
+
+GitLab group ids are unique and never reused, so every stage can address the folder or a dashboard of a group
+directly, instead of listing the folders and matching their titles.
+"""
+
+FOLDER = 'folder'
+OVERVIEW = 'overview'
+DRILLDOWN = 'drilldown'
+
+# Grafana rejects longer uids
+MAX_UID_LENGTH = 40
+_KIND = re.compile(r'^[a-z]+$')
+_GROUP_UID = re.compile(r'^gitlab-\d+-[a-z]+$')
+
+
+def group_uid(gitlab_group_id: int, kind: str) -> str:
+    """
+    Uid of the folder or a dashboard of a GitLab group. Kinds are lowercase letters only,
+    so two (group, kind) pairs never share a uid, and the prefix keeps them apart from the uids Grafana generates.
+    """
+    if not _KIND.match(kind):
+        raise ValueError(f"Invalid uid kind {kind}")
+    uid = f'gitlab-{int(gitlab_group_id)}-{kind}'
+    if len(uid) > MAX_UID_LENGTH:
+        raise ValueError(f"Uid {uid} is longer than {MAX_UID_LENGTH} characters")
+    return uid
+
+
+def is_group_uid(uid: str) -> bool:
+    """
+    Tells uids derived by group_uid apart from the random uids Grafana generates
+    """
+    return bool(_GROUP_UID.match(uid))
+
+
+def folder_uid(gitlab_group_id: int) -> str:
+    return group_uid(gitlab_group_id, FOLDER)